@@ -1,10 +1,11 @@
-from flask import abort, Flask, render_template, request, redirect, url_for, session, flash, jsonify
+from flask import abort, Flask, render_template, request, redirect, url_for, session, flash, jsonify, Response
 from flask_session import Session
 from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import datetime, timezone
 import json
-import dateutil.parser
+import queue
 import zoneinfo
+import os
 
 app = Flask(__name__)
 
@@ -13,103 +14,119 @@ app.config["SESSION_PERMANENT"] = False
 app.config["SESSION_TYPE"] = "filesystem"
 Session(app)
 
+# One pooled SQLite connection per request, released when the app context tears down
+import db
+db.init_app(app)
+
+# Fingerprinted, precompressed static files and icon sprites, built by `python assets.py`
+from assets import assets
+assets.init_app(app)
+
+# Bring the schema up to date in place; workers starting together apply each migration once
+from migrations import migrate
+migrate()
+
 # Import get_time_period from helpers.py
 from helpers import *
 
 from weather_helper import WEATHER_ICON_MAP, get_weather_icon, get_weather_simplified, hourly_dicts_from_openmeteo, filtered_hourly_dicts_from_openmeteo
 
-# In-memory caches
-ip_location_cache = {}  # {ip: {location and weather data}}
+from warmer import current_weather_warmer
+from geo_cache import geo_cache
+from ip_index import ip_index
+from spatial import snap_location
+from pregenerate import pregenerate_scheduler
+from singleflight import report_flight
+from forecast_view import hourly_window
+from snapshots import store_snapshot
+from retention import retention_scheduler
+from reference_data import reference_data
+import fanout
+from page_cache import page_cache, page_response, render_page, render_json
+
+# Keep the homepage's current weather snapshot warm in the background
+if os.environ.get("WARMER_ENABLED", "1") == "1":
+	current_weather_warmer.start()
+
+# Write the shared reports before each time period starts (costs LLM calls, off by default)
+if os.environ.get("PREGENERATE_ENABLED", "0") == "1":
+	pregenerate_scheduler.start()
+
+# Archive and delete reports older than RETENTION_DAYS (off by default, it deletes rows)
+if os.environ.get("RETENTION_ENABLED", "0") == "1":
+	retention_scheduler.start()
+
+# City cards per homepage page, the rest are reached through the pager or the search box
+CITIES_PER_PAGE = int(os.environ.get("CITIES_PER_PAGE", 24))
 
 @app.route("/")
 def index():
-	# Load cities and styles from the database
-	conn = get_db()
-	c = conn.cursor()
-	c.execute('SELECT name, slug, timezone, lat, lon FROM cities ORDER BY name')
-	city_names = [{"name": row[0], "slug": row[1], "timezone": row[2], "lat": row[3], "lon": row[4]} for row in c.fetchall()]
-	c.execute('SELECT name FROM styles ORDER BY name')
-	styles = [row[0] for row in c.fetchall()]
-	conn.close()
-	
-	# add current weather icon
-	cities_current_weather = get_current_weather(city_names)
-	for city in cities_current_weather:
-		city["current"]["icon"] = get_weather_icon(city["current"]["weather_code"], city["current"]["is_day"])
-		city['current']['description'] = get_weather_simplified(city["current"]["weather_code"], city["current"]["is_day"])
-		# Set hour:minute to city timezone from city_names
-		city['current']['time'] = datetime.now(zoneinfo.ZoneInfo(city['city']['timezone'])).strftime("%H:%M")
+	# Cities, styles and timezones come from the in-process reference data, no queries
+	ref = reference_data.get()
+	styles = ref.style_names
 
-	# Get user IP
-	ip = get_user_ip()
+	# The upstream fetches below run concurrently, under one deadline for the whole page.
+	# Whatever misses it renders as a placeholder and keeps loading in the background.
+	deadline = fanout.deadline_in()
 
-	# No caching temporary
-	user_location = None # ip_location_cache.get(ip)
+	# Current weather, icon and description are precomputed by the background warmer;
+	# only the first requests of a process wait for it, and share one refresh
+	snapshot = current_weather_warmer.get_snapshot()
+	snapshot_future = current_weather_warmer.refresh_in_background() if snapshot is None else None
 
-	if not user_location:
-		loc_data = get_user_location(ip)
+	# Get user IP
+	ip = get_user_ip()
 
-		if loc_data.get("status") == "success":
-			user_location = loc_data
-			# Get weather for this location, using user's timezone if available
-			city = {"name": loc_data.get("city", "Your Location"), "lat": loc_data["lat"], "lon": loc_data["lon"]}
-			timezone_str = loc_data.get("timezone", "America/Los_Angeles")
-			user_location["weather"] = get_weather(city, timezone_str)
-			user_location["weather"]['current']['cardinal'] = wind_direction_cardinal(user_location["weather"]['current']['wind_direction_10m'])
-			ip_location_cache[ip] = user_location
+	# Location and weather are cached separately, so they don't expire together
+	user_location = None
+	user_location_pending = False
+	# Try the offline IP range index first, ip-api.com only on a miss
+	loc_data = ip_index.lookup(ip) if ip_index else None
+	if loc_data is None:
+		loc_data = fanout.result_by(fanout.submit(geo_cache.get, ip, get_user_location), deadline)
+		user_location_pending = loc_data is None
+
+	if loc_data and loc_data.get("status") == "success":
+		# copy, the cached location is shared between requests
+		user_location = dict(loc_data)
+		# Coordinates are snapped to a nearby city or a coarse grid cell so nearby visitors share one cached forecast.
+		# A snapped location takes the city's timezone; a grid cell the visitor's, or the nearest city's
+		forecast_location, _ = snap_location(loc_data["lat"], loc_data["lon"], loc_data.get("timezone"), ref.city_index)
+		user_location["weather"] = fanout.result_by(fanout.submit(get_weather, forecast_location, forecast_location["timezone"]), deadline)
+		user_location["weather_pending"] = user_location["weather"] is None
+
+	if snapshot_future is not None:
+		snapshot = fanout.result_by(snapshot_future, deadline)
+	cities_pending = snapshot is None
+	all_cities = snapshot.cities if snapshot else ()
+	# Only one page of city cards is rendered
+	pages = max(1, -(-len(all_cities) // CITIES_PER_PAGE))
+	page = min(max(request.args.get("page", 1, type=int), 1), pages)
+
+	def render_city_cards():
+		cities_current_weather = all_cities[(page - 1) * CITIES_PER_PAGE:page * CITIES_PER_PAGE]
+		# Set hour:minute to each city's timezone
+		local_times = {c["city"]["slug"]: datetime.now(snapshot.timezones[c["city"]["slug"]]).strftime("%H:%M") for c in cities_current_weather}
+		return render_template("city_cards.html", cities=cities_current_weather, local_times=local_times, page=page, pages=pages)
+
+	# The city grid is the same for every visitor until the snapshot or the minute changes
+	city_cards = page_cache.get_or_render(("city_cards", page, datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M")), snapshot, render_city_cards)
 
 	# Prepare 24-hour hourly forecast for user's location (if available)
 	user_hourly_forecast = None
-	if user_location and user_location.get("weather") and user_location["weather"].get("hourly"):
-		hourly = user_location["weather"]["hourly"]
-
-		# open-meteo returns arrays: time, temperature_2m, wind_speed_10m, etc.
-		times = hourly.get("time", [])
-		temps = hourly.get("temperature_2m", [])
-		winds = hourly.get("wind_speed_10m", [])
-		wind_directions = hourly.get("wind_direction_10m", [])
-		weather_codes = hourly.get("weather_code", [])
-		is_day_flags = hourly.get("is_day", [])  # 1 for day, 0 for night
-
-		# Use user's timezone for current time		
-		timezone_str = user_location.get("timezone", "America/Los_Angeles")
+	if user_location and user_location.get("weather"):
+		# Use the forecast's timezone for current time, its hours are in that timezone
+		timezone_str = user_location["weather"].get("timezone") or user_location.get("timezone") or "America/Los_Angeles"
 		try:
 			tz = zoneinfo.ZoneInfo(timezone_str)
 		except Exception:
 			tz = zoneinfo.ZoneInfo("America/Los_Angeles")
-		now = datetime.now(tz)
-		start_idx = 0
-		for i, t in enumerate(times):
-			tdt = dateutil.parser.isoparse(t)
-			if tdt.tzinfo is None:
-				tdt = tdt.replace(tzinfo=tz)
-			# Find the first hour that is >= current hour (rounded down)
-			if tdt.hour == now.hour and tdt.date() == now.date():
-				start_idx = i
-				break
-			elif tdt > now:
-				start_idx = i
-				break
-
-		# Always get 24 hours from start_idx
-		end_idx = min(start_idx + 24, len(times))
-		user_hourly_forecast = []
-		for i in range(start_idx, end_idx):
-			# format date time to hour
-			hour = times[i].split("T")[1]
-			user_hourly_forecast.append({
-				"original_time": times[i],
-				"time": hour,
-				"temperature": temps[i] if i < len(temps) else None,
-				"windspeed": winds[i] if i < len(winds) else None,
-				"beaufort": beaufort_scale(winds[i]) if i < len(winds) else None,
-				"winddirection": wind_directions[i] if i < len(wind_directions) else None,
-				"cardinal": wind_direction_cardinal(wind_directions[i]) if i < len(wind_directions) else None,
-				"weather_code": weather_codes[i] if i < len(weather_codes) else None,
-				"icon": get_weather_icon(weather_codes[i], is_day=is_day_flags[i]) if i < len(weather_codes) else None
-			})
+		user_hourly_forecast = hourly_window(user_location["weather"], tz)
 
-	return render_template("index.html", cities=cities_current_weather, styles=styles, user_location=user_location, user_hourly_forecast=user_hourly_forecast)
+	# The visitor's own block makes every page different, so it is not compressed ahead of time
+	html = render_template("index.html", city_cards=city_cards, cities_pending=cities_pending, styles=styles,
+		user_location=user_location, user_location_pending=user_location_pending, user_hourly_forecast=user_hourly_forecast)
+	return page_response(render_page(html, compress=False))
 
 @app.route('/register', methods=['GET', 'POST'])
 def register():
@@ -135,7 +152,6 @@ def register():
 		c = conn.cursor()
 		c.execute('INSERT INTO users (username, password_hash) VALUES (?, ?)', (username, password_hash))
 		conn.commit()
-		conn.close()
 		flash('Registration successful! Please log in.', 'success')
 		return redirect(url_for('login'))
 	return render_template('register.html')
@@ -151,7 +167,6 @@ def login():
 		c = conn.cursor()
 		c.execute('SELECT * FROM users WHERE username = ?', (username,))
 		user = c.fetchone()
-		conn.close()
 
 		if user and check_password_hash(user['password_hash'], password):
 			session['user_id'] = user['id']
@@ -168,71 +183,24 @@ def logout():
 # Route for /<city> to show today's forecast for that city
 @app.route("/<city_name>")
 def city_forecast(city_name):
-	# Find city by name (case-insensitive match) in DB
-	conn = get_db()
-	c = conn.cursor()
-	c.execute('SELECT id, name, lat, lon, timezone FROM cities WHERE slug = ?', (city_name.lower(),))
-	row = c.fetchone()
-	if not row:
+	# Find city by slug (case-insensitive match) in the reference data
+	ref = reference_data.get()
+	city = ref.cities_by_slug.get(city_name.lower())
+	if not city:
 		return abort(404, description="City not found")
 
-	city = {"id": row[0], "name": row[1], "lat": row[2], "lon": row[3], "timezone": row[4]}
 	weather = get_weather(city, city['timezone'])
 
 	# Use city's timezone for current time and find the starting index
 	# of the current hour
-	timezone_str = city["timezone"]
-	tz = zoneinfo.ZoneInfo(timezone_str)
+	tz = ref.timezones[city["timezone"]]
 	now = datetime.now(tz)
 
-	# Prepare 24-hour hourly forecast for user's location (if available)
-	user_hourly_forecast = None
-	if weather and weather.get("hourly"):
-		hourly = weather["hourly"]
-
-		# open-meteo returns arrays: time, temperature_2m, wind_speed_10m, etc.
-		times = hourly.get("time", [])
-		temps = hourly.get("temperature_2m", [])
-		winds = hourly.get("wind_speed_10m", [])
-		wind_directions = hourly.get("wind_direction_10m", [])
-		weather_codes = hourly.get("weather_code", [])
-		is_day_flags = hourly.get("is_day", [])  # 1 for day, 0 for night
-
-		start_idx = 0
-		for i, t in enumerate(times):
-			tdt = dateutil.parser.isoparse(t)
-			if tdt.tzinfo is None:
-				tdt = tdt.replace(tzinfo=tz)
-			# Find the first hour that is >= current hour (rounded down)
-			if tdt.hour == now.hour and tdt.date() == now.date():
-				start_idx = i
-				break
-			elif tdt > now:
-				start_idx = i
-				break
-
-		# Always get 24 hours from start_idx
-		end_idx = min(start_idx + 24, len(times))
-		user_hourly_forecast = []
-		for i in range(start_idx, end_idx):
-			# change hour format to 12-hour format
-			hour = times[i].split("T")[1]
-			user_hourly_forecast.append({
-				"original_time": times[i],
-				"time": hour,
-				"temperature": temps[i] if i < len(temps) else None,
-				"windspeed": winds[i] if i < len(winds) else None,
-				"beaufort": beaufort_scale(winds[i]) if i < len(winds) else None,
-				"winddirection": wind_directions[i] if i < len(wind_directions) else None,
-				"cardinal": wind_direction_cardinal(wind_directions[i]) if i < len(wind_directions) else None,
-				"weather_code": weather_codes[i] if i < len(weather_codes) else None,
-				"icon": get_weather_icon(weather_codes[i], is_day=is_day_flags[i]) if i < len(weather_codes) else None
-			})
-			
-	# Get all styles ordered by position
-	c = conn.cursor()
-	c.execute('SELECT id, name, position FROM styles ORDER BY position ASC')
-	styles = [dict(id=row[0], name=row[1], position=row[2]) for row in c.fetchall()]
+	# Prepare 24-hour hourly forecast for the city
+	user_hourly_forecast = hourly_window(weather, tz)
+
+	# All styles, ordered by position
+	styles = ref.styles
 
 	# Get default report for the first style (assume "Normal Weather Report" is first in list)
 	default_style = styles[0]
@@ -241,38 +209,72 @@ def city_forecast(city_name):
 	time_period = get_time_period_from_json(weather)
 	today = now.strftime("%Y-%m-%d")
 
+	logged_in = session.get('user_id') is not None
+
+	# Anonymous visitors all get the same page until the forecast, the hour or the report changes.
+	# Pending flash messages are rendered into the page, so those requests skip the cache
+	cache_key = None
+	if not logged_in and not session.get("_flashes"):
+		cache_key = ("city", city["id"], style_id, time_period, today, now.hour)
+		cached = page_cache.get(cache_key, weather)
+		if cached is not None:
+			return page_response(cached)
+
 	# Check for cached report in DB
-	c.execute('''SELECT weather_json, report_text FROM weather_reports
-				WHERE user_id IS NULL AND city_id = ? AND style_id = ? AND time_period = ? AND date = ?''',
-			  (city["id"], style_id, time_period, today))
-	row = c.fetchone()
+	conn = get_db()
+	c = conn.cursor()
 
-	if row:
-		# Cached report found
-		report = row[1]
-	else:
-		# Not cached, call API and store
+	def lookup_report():
+		c.execute('''SELECT report_text FROM weather_reports
+					WHERE user_id IS NULL AND city_id = ? AND style_id = ? AND time_period = ? AND date = ?''',
+				  (city["id"], style_id, time_period, today))
+		row = c.fetchone()
+		return row[0] if row else None
+
+	def generate_default_report():
 		report = call_llm_api(city["name"], weather, style_name)
-		c.execute('''INSERT INTO weather_reports (city_id, style_id, time_period, date, weather_json, report_text)
+		c.execute('''INSERT OR IGNORE INTO weather_reports (city_id, style_id, time_period, date, snapshot_id, report_text)
 					VALUES (?, ?, ?, ?, ?, ?)''',
-				(city["id"], style_id, time_period, today, json.dumps(weather), report))
+				(city["id"], style_id, time_period, today, store_snapshot(conn, weather), report))
 		conn.commit()
+		return report
 
-	logged_in = session.get('user_id') is not None
+	report = lookup_report()
+	if report is None:
+		# Not cached, call API and store. Concurrent misses for the same report wait for one generation
+		key = f"report:shared:{city['id']}:{style_id}:{time_period}:{today}"
+		report = report_flight.do(key, generate_default_report, lookup_report)
 
 	# if a user is logged in, reports for all styles and current day and time of day for the city should be fetched
+	# A user's own report wins over a shared (pre-generated) one for the same style
 	if logged_in:
-		c.execute('''SELECT style_id, report_text FROM weather_reports
-					WHERE user_id = ? AND city_id = ? AND date = ? AND time_period = ?''',
-				  (session.get('user_id'), city["id"], today, time_period))
+		# one SELECT per partial index, with an OR the planner may fall back to the date index
+		c.execute('''SELECT style_id, report_text, user_id FROM weather_reports
+					WHERE user_id = ? AND city_id = ? AND date = ? AND time_period = ?
+					UNION ALL
+					SELECT style_id, report_text, user_id FROM weather_reports
+					WHERE user_id IS NULL AND city_id = ? AND date = ? AND time_period = ?''',
+				  (session.get('user_id'), city["id"], today, time_period, city["id"], today, time_period))
 		rows = c.fetchall()
-		user_reports = {row[0]: row[1] for row in rows}
+		user_reports = {}
+		for row in rows:
+			if row[2] is not None or row[0] not in user_reports:
+				user_reports[row[0]] = row[1]
 	else:
 		user_reports = {}
 
-	conn.close()
+	html = render_template("city.html", city=city, report=report, weather=weather, user_hourly_forecast=user_hourly_forecast, styles=styles, logged_in=logged_in, user_reports=user_reports)
+	page = render_page(html, compress=cache_key is not None)
+	if cache_key is not None:
+		page_cache.put(cache_key, weather, page)
+	return page_response(page)
 
-	return render_template("city.html", city=city, report=report, weather=weather, user_hourly_forecast=user_hourly_forecast, styles=styles, logged_in=logged_in, user_reports=user_reports)
+def lookup_by_id(index, value):
+	# ids arrive from the page as strings
+	try:
+		return index.get(int(value))
+	except (TypeError, ValueError):
+		return None
 
 @app.route('/generate_report', methods=['POST'])
 def generate_report():
@@ -280,23 +282,16 @@ def generate_report():
 	city_id = data.get('city_id')
 	style_id = data.get('style_id')
 
-	# get city from database
-	conn = get_db()
-	c = conn.cursor()
-	c.execute('SELECT id, name, lat, lon, timezone FROM cities WHERE id = ?', (city_id,))
-	row = c.fetchone()
-	city = {"id": row[0], "name": row[1], "lat": row[2], "lon": row[3], "timezone": row[4]}
+	# get city and style from the reference data
+	ref = reference_data.get()
+	city = lookup_by_id(ref.cities_by_id, city_id)
+	style = lookup_by_id(ref.styles_by_id, style_id)
+	if not city or not style:
+		return abort(404, description="City or style not found")
 
-	# Get style from database
-	c = conn.cursor()
-	c.execute('SELECT name FROM styles WHERE id = ?', (style_id,))
-	row = c.fetchone()
-	style = {"id": style_id, "name": row[0]} if row else None
-	
 	# Use city's timezone for current time and find the starting index
 	# of the current hour
-	timezone_str = city["timezone"]
-	tz = zoneinfo.ZoneInfo(timezone_str)
+	tz = ref.timezones[city["timezone"]]
 	now = datetime.now(tz)
 
 	# fetch new weather data
@@ -305,25 +300,269 @@ def generate_report():
 	time_period = get_time_period_from_json(weather)
 	today = now.strftime("%Y-%m-%d")
 
-	# remove the existing report if it exists
+	user_id = session.get('user_id')
+	report_key = (user_id, city["id"], style["id"], time_period, today)
+
+	# Reports stored after this point are newer than the one being regenerated
+	conn = get_db()
 	c = conn.cursor()
-	c.execute('DELETE FROM weather_reports WHERE user_id = ? AND city_id = ? AND style_id = ? AND time_period = ? AND date = ?',
-				(session.get('user_id'), city["id"], style["id"], time_period, today))
-	conn.commit()
+	c.execute('SELECT MAX(id) FROM weather_reports WHERE user_id = ? AND city_id = ? AND style_id = ? AND time_period = ? AND date = ?', report_key)
+	previous_id = c.fetchone()[0] or 0
+
+	def lookup_report():
+		c.execute('SELECT report_text FROM weather_reports WHERE user_id = ? AND city_id = ? AND style_id = ? AND time_period = ? AND date = ? AND id > ?',
+					report_key + (previous_id,))
+		row = c.fetchone()
+		return row[0] if row else None
+
+	def regenerate_report():
+		# remove the existing report if it exists
+		c.execute('DELETE FROM weather_reports WHERE user_id = ? AND city_id = ? AND style_id = ? AND time_period = ? AND date = ?', report_key)
+		conn.commit()
 
-	# generate report
-	report = call_llm_api(city["name"], weather, style["name"])
+		# generate report
+		report = call_llm_api(city["name"], weather, style["name"])
 
-	# store it in the database
-	c = conn.cursor()
-	c.execute('INSERT INTO weather_reports (user_id, city_id, style_id, time_period, date, weather_json, report_text) VALUES (?, ?, ?, ?, ?, ?, ?)',
-				(session.get('user_id'), city["id"], style["id"], time_period, today, json.dumps(weather), report))
-	conn.commit()
-	conn.close()
-		
+		# store it in the database
+		c.execute('INSERT INTO weather_reports (user_id, city_id, style_id, time_period, date, snapshot_id, report_text) VALUES (?, ?, ?, ?, ?, ?, ?)',
+					report_key + (store_snapshot(conn, weather), report))
+		conn.commit()
+		return report
+
+	# Repeated clicks (or tabs) regenerating the same report share one LLM call
+	key = "report:" + ":".join(str(part) for part in report_key)
+	report = report_flight.do(key, regenerate_report, lookup_report)
 
 	return jsonify({"success": True, "report": report})
 
+def sse_event(data, event=None):
+	# One Server-Sent Event; data is JSON so chunks may contain newlines
+	message = f"event: {event}\n" if event else ""
+	return message + f"data: {json.dumps(data)}\n\n"
+
+@app.route('/generate_report/stream', methods=['POST'])
+def generate_report_stream():
+	"""
+	Streaming variant of /generate_report: forwards the report to the browser
+	as Server-Sent Events while Gemini writes it, then stores the full text.
+	If generation fails, also halfway, an error event is sent and nothing is stored.
+	"""
+	data = request.get_json()
+	city_id = data.get('city_id')
+	style_id = data.get('style_id')
+	user_id = session.get('user_id')
+
+	ref = reference_data.get()
+	city = lookup_by_id(ref.cities_by_id, city_id)
+	if not city:
+		return abort(404, description="City not found")
+	style = lookup_by_id(ref.styles_by_id, style_id)
+	if not style:
+		return abort(404, description="Style not found")
+
+	now = datetime.now(ref.timezones[city["timezone"]])
+	weather = get_weather(city, city['timezone'])
+	time_period = get_time_period_from_json(weather)
+	today = now.strftime("%Y-%m-%d")
+	report_key = (user_id, city["id"], style["id"], time_period, today)
+
+	# Reports stored after this point are newer than the one being regenerated
+	conn = get_db()
+	row = conn.execute('SELECT MAX(id) FROM weather_reports WHERE user_id = ? AND city_id = ? AND style_id = ? AND time_period = ? AND date = ?', report_key).fetchone()
+	previous_id = row[0] or 0
+
+	# The report is generated on a pool thread, outside this request, so it uses connections of its own
+	def lookup_report():
+		conn = get_db()
+		try:
+			row = conn.execute('SELECT report_text FROM weather_reports WHERE user_id = ? AND city_id = ? AND style_id = ? AND time_period = ? AND date = ? AND id > ?',
+								report_key + (previous_id,)).fetchone()
+		finally:
+			conn.close()
+		return row[0] if row else None
+
+	chunks = queue.Queue()
+
+	def stream_report():
+		# raises LLMError on a failure, also halfway through, so nothing is stored then
+		parts = []
+		for chunk in stream_llm_api(city["name"], weather, style["name"]):
+			parts.append(chunk)
+			chunks.put(chunk)
+		report = "".join(parts)
+		conn = get_db()
+		try:
+			conn.execute('DELETE FROM weather_reports WHERE user_id = ? AND city_id = ? AND style_id = ? AND time_period = ? AND date = ?', report_key)
+			conn.execute('INSERT INTO weather_reports (user_id, city_id, style_id, time_period, date, snapshot_id, report_text) VALUES (?, ?, ?, ?, ?, ?, ?)',
+						report_key + (store_snapshot(conn, weather), report))
+			conn.commit()
+		finally:
+			conn.close()
+		return report
+
+	# Shares one Gemini call with concurrent /generate_report(/stream) requests for the same report;
+	# a request that only waits for another one's report gets it in one chunk at the end
+	key = "report:" + ":".join(str(part) for part in report_key)
+	future = fanout.get_executor("report").submit(report_flight.do, key, stream_report, lookup_report)
+
+	def generate():
+		streamed = False
+		while not future.done() or not chunks.empty():
+			try:
+				chunk = chunks.get(timeout=0.1)
+			except queue.Empty:
+				continue
+			streamed = True
+			yield sse_event({"chunk": chunk})
+		try:
+			report = future.result()
+		except Exception as e:
+			print(f"[generate_report] {city['name']} / {style['name']} failed: {e!r}")
+			yield sse_event({"error": str(e)}, event="error")
+			return
+		if not streamed:
+			yield sse_event({"chunk": report})
+		yield sse_event({"report": report}, event="done")
+
+	# generate() only reads the queue and the future, the request's context and connection aren't held while it streams
+	headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+	return Response(generate(), mimetype="text/event-stream", headers=headers)
+
+# City autocomplete, served from the in-memory prefix index
+@app.route("/api/cities/search")
+def search_cities():
+	query = request.args.get("q", "").strip()
+	limit = request.args.get("limit", 10, type=int)
+	if not query:
+		return jsonify([])
+	cities = reference_data.get().search_index.search(query, limit)
+	return jsonify([{key: city[key] for key in ("id", "name", "slug", "country", "timezone")} for city in cities])
+
+# JSON API for polling clients: the same caches as the pages, ETag/304 and ?fields= selection
+
+# Keys of the open-meteo current conditions, see fetch_weather and fetch_current_weather
+OPENMETEO_CURRENT_FIELDS = {"time", "interval", "temperature_2m", "wind_direction_10m", "wind_speed_10m",
+	"pressure_msl", "relative_humidity_2m", "weather_code"}
+# /api/current: as fetched by the warmer, with its icon and description
+CITY_CURRENT_FIELDS = OPENMETEO_CURRENT_FIELDS | {"is_day", "icon", "description", "icon_url", "icon_animated_url"}
+# /api/cities/<slug>/hourly: the forecast's current conditions, and the rows of the hourly strip
+FORECAST_CURRENT_FIELDS = OPENMETEO_CURRENT_FIELDS | {"cardinal"}
+HOURLY_FIELDS = {"original_time", "time", "temperature", "windspeed", "beaufort", "winddirection", "cardinal",
+	"weather_code", "icon", "icon_url", "icon_animated_url"}
+
+def requested_fields(param, allowed):
+	"""
+	?fields=temperature_2m,icon limits the keys of each city or hour; none means all of them.
+	Returns (fields, unknown field names).
+	"""
+	fields = tuple(sorted(field for field in request.args.get(param, "").split(",") if field))
+	return fields, [field for field in fields if field not in allowed]
+
+def unknown_fields_error(param, unknown):
+	return api_error(f"Unknown {param}: {', '.join(unknown)}", 400)
+
+def select_fields(item, fields):
+	return {key: value for key, value in item.items() if key in fields} if fields else dict(item)
+
+def api_error(message, status):
+	return jsonify({"error": message}), status
+
+def json_response(page):
+	return page_response(page, mimetype="application/json")
+
+def with_icon_urls(values):
+	icon = values.get("icon")
+	values["icon_url"] = assets.icon_url(icon) if icon else None
+	values["icon_animated_url"] = assets.icon_url(icon, animated=True) if icon else None
+	return values
+
+# Current conditions of all cities, or of ?cities=slug,slug
+@app.route("/api/current")
+def api_current():
+	snapshot = current_weather_warmer.get_snapshot()
+	if snapshot is None:
+		return api_error("Current weather is still loading", 503)
+	slugs = tuple(sorted(slug for slug in request.args.get("cities", "").split(",") if slug))
+	fields, unknown = requested_fields("fields", CITY_CURRENT_FIELDS)
+	if unknown:
+		return unknown_fields_error("fields", unknown)
+
+	def render():
+		entries = snapshot.cities
+		if slugs:
+			entries = [c for c in entries if c["city"]["slug"] in slugs]
+		cities = []
+		for c in entries:
+			slug = c["city"]["slug"]
+			cities.append({
+				"slug": slug,
+				"name": c["location_name"],
+				"local_time": datetime.now(snapshot.timezones[slug]).strftime("%H:%M"),
+				"stale": bool(c.get("stale")),
+				"current": select_fields(with_icon_urls(dict(c["current"])), fields),
+			})
+		return render_json({"fetched_at": snapshot.fetched_at, "cities": cities})
+
+	# The same body for everyone until the snapshot or the minute (local times) changes
+	key = ("api_current", slugs, fields, datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M"))
+	return json_response(page_cache.get_or_render(key, snapshot, render))
+
+# Current conditions and the next 24 hours of one city. The current conditions use open-meteo's
+# names (temperature_2m) and the hours the strip's (temperature), so ?fields= selects the keys of
+# "current" and ?hourly_fields= those of each hour
+@app.route("/api/cities/<city_name>/hourly")
+def api_hourly(city_name):
+	ref = reference_data.get()
+	city = ref.cities_by_slug.get(city_name.lower())
+	if not city:
+		return api_error("City not found", 404)
+	fields, unknown = requested_fields("fields", FORECAST_CURRENT_FIELDS)
+	if unknown:
+		return unknown_fields_error("fields", unknown)
+	hourly_fields, unknown = requested_fields("hourly_fields", HOURLY_FIELDS)
+	if unknown:
+		return unknown_fields_error("hourly_fields", unknown)
+	weather = get_weather(city, city["timezone"])
+	if not weather:
+		return api_error("Forecast not available", 503)
+	tz = ref.timezones[city["timezone"]]
+
+	def render():
+		hours = [select_fields(with_icon_urls(row.as_dict()), hourly_fields) for row in hourly_window(weather, tz) or ()]
+		current = select_fields(weather.get("current", {}), fields)
+		return render_json({"city": city["slug"], "name": city["name"], "timezone": city["timezone"], "current": current, "hourly": hours})
+
+	# The window starts at the current hour
+	key = ("api_hourly", city["id"], fields, hourly_fields, datetime.now(tz).strftime("%Y-%m-%d %H"))
+	return json_response(page_cache.get_or_render(key, weather, render))
+
+# The report for a city, ?style=<id> (default the first style), ?period= and ?date= (default now).
+# A logged in user's own report wins over the shared one, like on the city page
+@app.route("/api/reports/<city_name>")
+def api_report(city_name):
+	ref = reference_data.get()
+	city = ref.cities_by_slug.get(city_name.lower())
+	style = lookup_by_id(ref.styles_by_id, request.args["style"]) if "style" in request.args else (ref.styles[0] if ref.styles else None)
+	if not city or not style:
+		return api_error("City or style not found", 404)
+	now = datetime.now(ref.timezones[city["timezone"]])
+	time_period = request.args.get("period") or get_time_period_for_hour(now.hour)
+	if time_period not in {name for _, name in TIME_PERIOD_STARTS}:
+		return api_error("Unknown period", 400)
+	day = request.args.get("date") or now.strftime("%Y-%m-%d")
+
+	c = get_db().cursor()
+	c.execute('''SELECT report_text, user_id FROM weather_reports
+				WHERE (user_id = ? OR user_id IS NULL) AND city_id = ? AND style_id = ? AND time_period = ? AND date = ?
+				ORDER BY user_id IS NULL LIMIT 1''', (session.get("user_id"), city["id"], style["id"], time_period, day))
+	row = c.fetchone()
+	if row is None:
+		return api_error("No report for this city, style and period yet", 404)
+	return json_response(render_json({
+		"city": city["slug"], "style_id": style["id"], "style": style["name"], "time_period": time_period,
+		"date": day, "own": row[1] is not None, "report": row[0],
+	}))
+
 @app.route("/about")
 def about():
 	return render_template("about.html")
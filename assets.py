@@ -0,0 +1,266 @@
+"""
+assets.py
+
+Build step for the files in static/, and the Flask side that serves its output.
+
+`python assets.py` writes static/dist/:
+- a copy of every asset under a content-hashed name (css/styles.3f2a9c1b7e0d.css),
+  with the url()s inside stylesheets pointing at the hashed names too
+- next to each compressible copy, a .gz and (if the brotli package is installed) a .br
+- two SVG sprite sheets with every icon WEATHER_ICON_MAP can return, one for the
+  static and one for the animated icons. Each icon is a nested <svg> shown only when it
+  is the URL fragment, so <img src="sprite.svg#rainy-1-day"> is one icon and a page
+  with 60 icons loads two files
+- manifest.json, mapping each original path to its hashed one
+
+init_app() makes url_for('static', filename='css/styles.css') return the hashed URL,
+serves dist/ with a one-year immutable Cache-Control and the precompressed
+file the client accepts, and gives templates icon_url(). Without a build everything
+falls back to the plain files in static/.
+
+Usage:
+    python assets.py    # rebuild static/dist/, run on every deploy
+"""
+
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import re
+import shutil
+import xml.etree.ElementTree as ET
+
+from flask import abort, request, send_from_directory, url_for
+
+from weather_helper import DEFAULT_ICON, WEATHER_ICON_MAP
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+STATIC_DIR = os.path.join(os.path.dirname(__file__), 'static')
+DIST_DIR = os.path.join(STATIC_DIR, 'dist')
+MANIFEST_NAME = "manifest.json"
+
+# Directories under static/ that are fingerprinted; the other icon sets aren't used by the templates
+ASSET_DIRS = ("css", "font", "icons/static", "icons/animated")
+# sprite path: directory its icons come from
+SPRITES = {"icons/sprite-static.svg": "icons/static", "icons/sprite-animated.svg": "icons/animated"}
+# woff/woff2 are compressed already
+COMPRESSIBLE = (".css", ".js", ".svg", ".eot", ".ttf")
+# Seconds browsers may keep a fingerprinted file, its name changes when it does
+ASSET_MAX_AGE = 365 * 24 * 3600
+
+SVG_NS = "http://www.w3.org/2000/svg"
+ET.register_namespace("", SVG_NS)
+ET.register_namespace("xlink", "http://www.w3.org/1999/xlink")
+
+_CSS_URL = re.compile(r"""url\(\s*(['"]?)([^'")?#]+)([^'")]*)\1\s*\)""")
+_CSS_COMMENT = re.compile(r"/\*.*?\*/", re.S)
+_KEYFRAMES = re.compile(r"@(?:-\w+-)?keyframes\s+([\w-]+)")
+_LOCAL_REF = re.compile(r"url\(#([\w-]+)\)")
+
+
+def fingerprint(path, data):
+    root, ext = os.path.splitext(path)
+    return f"{root}.{hashlib.sha256(data).hexdigest()[:12]}{ext}"
+
+
+def icon_id(filename):
+    return filename[:-len(".svg")]
+
+
+def sprite_icons():
+    """
+    Every icon file WEATHER_ICON_MAP (or the default) can return.
+    """
+    return sorted({name for icons in WEATHER_ICON_MAP.values() for name in icons} | {DEFAULT_ICON})
+
+
+def scope_css(css, scope):
+    """
+    Limits an icon's stylesheet to the icon: rules get an `#scope` prefix and keyframes a
+    `scope-` prefix. The icons reuse class and keyframe names with different definitions.
+    """
+    css = _CSS_COMMENT.sub("", css)
+    for name in set(_KEYFRAMES.findall(css)):
+        # the keyframes name wherever it isn't a class selector
+        css = re.sub(rf"(?<![\w.-]){re.escape(name)}(?![\w-])", f"{scope}-{name}", css)
+    out = []
+    depth = 0
+    start = 0
+    for i, ch in enumerate(css):
+        if ch == "{":
+            if depth == 0:
+                selector = css[start:i].strip()
+                if not selector.startswith("@"):
+                    selector = ", ".join(f"#{scope} {part.strip()}" for part in selector.split(","))
+                out.append(selector + " ")
+                start = i
+            depth += 1
+        elif ch == "}":
+            depth -= 1
+            if depth == 0:
+                out.append(css[start:i + 1] + "\n")
+                start = i + 1
+    return "".join(out)
+
+
+def build_sprite(src_dir, icons, log=print):
+    """
+    Returns one SVG document holding the icons as nested <svg id="icon-name"> elements.
+    Ids inside each icon are prefixed with its name, so the icons' "blur" filters don't collide.
+    Icons missing from src_dir are left out, their fragment shows nothing, like the 404 without a sprite.
+    """
+    sprite = ET.Element(f"{{{SVG_NS}}}svg", {"viewBox": "0 0 56 48"})
+    style = ET.SubElement(sprite, f"{{{SVG_NS}}}style")
+    style.text = "svg > svg { display: none } svg > svg:target { display: inline }\n"
+    for name in icons:
+        scope = icon_id(name)
+        path = os.path.join(src_dir, name)
+        if not os.path.isfile(path):
+            log(f"Sprite: no {path}, skipped")
+            continue
+        icon = ET.parse(path).getroot()
+        for el in icon.iter():
+            if el.get("id"):
+                el.set("id", f"{scope}--{el.get('id')}")
+            for attr, value in el.attrib.items():
+                if "url(#" in value:
+                    el.set(attr, _LOCAL_REF.sub(rf"url(#{scope}--\1)", value))
+            if el.tag == f"{{{SVG_NS}}}style" and el.text:
+                el.text = scope_css(el.text, scope)
+        width, height = icon.get("width", "56"), icon.get("height", "48")
+        nested = ET.SubElement(sprite, f"{{{SVG_NS}}}svg", {"id": scope, "viewBox": f"0 0 {width} {height}"})
+        nested.extend(list(icon))
+    return ET.tostring(sprite, encoding="utf-8", xml_declaration=True)
+
+
+def rewrite_css_urls(css, css_path, manifest):
+    """
+    Points relative url()s in a stylesheet at the fingerprinted files, keeping ?query and #fragment.
+    """
+    css_dir = os.path.dirname(css_path)
+
+    def replace(match):
+        quote, target, suffix = match.groups()
+        logical = os.path.normpath(os.path.join(css_dir, target)).replace(os.sep, "/")
+        if logical not in manifest:
+            return match.group(0)
+        hashed = os.path.relpath(manifest[logical], os.path.dirname(manifest[css_path])).replace(os.sep, "/")
+        return f"url({quote}{hashed}{suffix}{quote})"
+
+    return _CSS_URL.sub(replace, css)
+
+
+def write_asset(dist_dir, path, data):
+    """
+    Writes data under its fingerprinted name, plus .gz and .br copies. Returns the fingerprinted path.
+    """
+    hashed = fingerprint(path, data)
+    target = os.path.join(dist_dir, hashed)
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    with open(target, "wb") as f:
+        f.write(data)
+    if path.endswith(COMPRESSIBLE):
+        with open(target + ".gz", "wb") as f:
+            f.write(gzip.compress(data, 9, mtime=0))
+        if brotli is not None:
+            with open(target + ".br", "wb") as f:
+                f.write(brotli.compress(data))
+    return hashed
+
+
+def build(static_dir=STATIC_DIR, dist_dir=DIST_DIR, log=print):
+    """
+    Rebuilds dist_dir from static_dir. Returns the manifest.
+    """
+    shutil.rmtree(dist_dir, ignore_errors=True)
+    os.makedirs(dist_dir)
+
+    sources = {}
+    for asset_dir in ASSET_DIRS:
+        for name in sorted(os.listdir(os.path.join(static_dir, asset_dir))):
+            with open(os.path.join(static_dir, asset_dir, name), "rb") as f:
+                sources[f"{asset_dir}/{name}"] = f.read()
+    icons = sprite_icons()
+    for sprite, icon_dir in SPRITES.items():
+        sources[sprite] = build_sprite(os.path.join(static_dir, icon_dir), icons, log)
+
+    manifest = {}
+    # stylesheets last, their url()s need the other files' hashed names
+    for path in sorted(sources, key=lambda path: path.endswith(".css")):
+        data = sources[path]
+        if path.endswith(".css"):
+            # only the directory matters for the relative urls; the final name hashes the
+            # rewritten file, so a font change renames the stylesheet too
+            manifest[path] = fingerprint(path, data)
+            data = rewrite_css_urls(data.decode("utf-8"), path, manifest).encode("utf-8")
+        manifest[path] = write_asset(dist_dir, path, data)
+
+    with open(os.path.join(dist_dir, MANIFEST_NAME), "w") as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    log(f"Built {len(manifest)} assets in {dist_dir} (brotli {'on' if brotli else 'not installed, gzip only'})")
+    return manifest
+
+
+class Assets:
+    def __init__(self, dist_dir=DIST_DIR):
+        self.dist_dir = dist_dir
+        self.manifest = {}
+
+    def load_manifest(self):
+        try:
+            with open(os.path.join(self.dist_dir, MANIFEST_NAME)) as f:
+                self.manifest = json.load(f)
+        except (OSError, ValueError):
+            # no build yet, the plain static files are used
+            self.manifest = {}
+
+    def url_defaults(self, endpoint, values):
+        if endpoint == "static" and values.get("filename") in self.manifest:
+            values["filename"] = "dist/" + self.manifest[values["filename"]]
+
+    def icon_url(self, icon, animated=False):
+        """
+        URL of a weather icon: a fragment of the sprite sheet after a build, else the icon's own file.
+        """
+        sprite = "icons/sprite-animated.svg" if animated else "icons/sprite-static.svg"
+        if sprite in self.manifest:
+            return url_for("static", filename=sprite) + "#" + icon_id(icon)
+        return url_for("static", filename=("icons/animated/" if animated else "icons/static/") + icon)
+
+    def serve(self, filename):
+        """
+        Serves a fingerprinted file, as its .br or .gz copy when the client accepts that encoding.
+        """
+        if not os.path.isfile(os.path.join(self.dist_dir, filename)) or filename == MANIFEST_NAME:
+            abort(404)
+        mimetype = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+        encoding = None
+        for name, suffix in (("br", ".br"), ("gzip", ".gz")):
+            if request.accept_encodings[name] and os.path.isfile(os.path.join(self.dist_dir, filename + suffix)):
+                encoding, filename = name, filename + suffix
+                break
+        resp = send_from_directory(self.dist_dir, filename, mimetype=mimetype, max_age=ASSET_MAX_AGE)
+        if encoding:
+            resp.headers["Content-Encoding"] = encoding
+        resp.vary.add("Accept-Encoding")
+        resp.cache_control.public = True
+        resp.cache_control.immutable = True
+        return resp
+
+    def init_app(self, app):
+        self.load_manifest()
+        app.url_defaults(self.url_defaults)
+        app.add_url_rule("/static/dist/<path:filename>", "dist_asset", self.serve)
+        app.jinja_env.globals["icon_url"] = self.icon_url
+
+
+assets = Assets()
+
+
+if __name__ == "__main__":
+    build()
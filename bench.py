@@ -0,0 +1,205 @@
+"""
+bench.py
+
+Micro-benchmarks for the per-request forecast processing.
+
+Usage:
+    python bench.py                 # run all benchmarks
+    python bench.py forecast_view   # run one (forecast_view, memory, classifiers, search)
+"""
+
+import json
+import random
+import sys
+import timeit
+import tracemalloc
+import zoneinfo
+from datetime import datetime, timedelta
+
+import dateutil.parser
+
+import forecast_view
+from city_search import CitySearchIndex
+from hourly_forecast import HourlyForecast
+from weather_helper import (beaufort_scale, wind_direction_cardinal, get_weather_icon, get_weather_simplified,
+                            beaufort_batch, cardinal_batch, icon_batch, simplified_batch, hourly_dicts_from_openmeteo)
+
+
+def make_payload(timezone_str="Europe/London", hours=48, start=None):
+    """
+    An open-meteo shaped forecast payload with `hours` hourly values, by default from local midnight.
+    """
+    tz = zoneinfo.ZoneInfo(timezone_str)
+    start = start or datetime.now(tz).replace(hour=0, minute=0, second=0, microsecond=0)
+    times = [(start + timedelta(hours=i)).strftime("%Y-%m-%dT%H:%M") for i in range(hours)]
+    return {
+        "timezone": timezone_str,
+        "hourly": {
+            "time": times,
+            "temperature_2m": [10.0 + (i % 12) for i in range(hours)],
+            "wind_speed_10m": [float((i * 7) % 120) for i in range(hours)],
+            "wind_direction_10m": [(i * 37) % 360 for i in range(hours)],
+            "weather_code": [(0, 1, 2, 3, 45, 61, 71, 95)[i % 8] for i in range(hours)],
+            "is_day": [1 if 6 <= i % 24 < 20 else 0 for i in range(hours)],
+        },
+    }
+
+
+def legacy_hourly_window(weather, tz):
+    """
+    The loop index() and city_forecast() used to run on every request.
+    """
+    hourly = weather["hourly"]
+    times = hourly.get("time", [])
+    temps = hourly.get("temperature_2m", [])
+    winds = hourly.get("wind_speed_10m", [])
+    wind_directions = hourly.get("wind_direction_10m", [])
+    weather_codes = hourly.get("weather_code", [])
+    is_day_flags = hourly.get("is_day", [])
+    now = datetime.now(tz)
+    start_idx = 0
+    for i, t in enumerate(times):
+        tdt = dateutil.parser.isoparse(t)
+        if tdt.tzinfo is None:
+            tdt = tdt.replace(tzinfo=tz)
+        if tdt.hour == now.hour and tdt.date() == now.date():
+            start_idx = i
+            break
+        elif tdt > now:
+            start_idx = i
+            break
+    end_idx = min(start_idx + 24, len(times))
+    rows = []
+    for i in range(start_idx, end_idx):
+        rows.append({
+            "original_time": times[i],
+            "time": times[i].split("T")[1],
+            "temperature": temps[i] if i < len(temps) else None,
+            "windspeed": winds[i] if i < len(winds) else None,
+            "beaufort": beaufort_scale(winds[i]) if i < len(winds) else None,
+            "winddirection": wind_directions[i] if i < len(wind_directions) else None,
+            "cardinal": wind_direction_cardinal(wind_directions[i]) if i < len(wind_directions) else None,
+            "weather_code": weather_codes[i] if i < len(weather_codes) else None,
+            "icon": get_weather_icon(weather_codes[i], is_day=is_day_flags[i]) if i < len(weather_codes) else None
+        })
+    return rows
+
+
+def report(name, seconds, number, baseline=None):
+    per_call = seconds / number * 1e6
+    speedup = f"  ({baseline / per_call:.1f}x)" if baseline else ""
+    print(f"  {name:<28} {per_call:10.1f} µs/call{speedup}")
+    return per_call
+
+
+def render_rows(rows):
+    # touch every field the hourly strip template uses
+    for hour in rows:
+        (hour.original_time, hour.time, hour.temperature, hour.windspeed, hour.beaufort,
+         hour.winddirection, hour.cardinal, hour.weather_code, hour.icon)
+
+
+def bench_forecast_view(number=2000):
+    print("forecast_view: 24-hour window of a 48-hour payload, rendered")
+    tz = zoneinfo.ZoneInfo("Europe/London")
+    # start 12 hours back, so "now" is in the middle like it is on average
+    start = datetime.now(tz).replace(minute=0, second=0, microsecond=0) - timedelta(hours=12)
+    weather = make_payload(start=start)
+    columnar = {"hourly": HourlyForecast.from_openmeteo(weather["hourly"], tz)}
+    assert [row.as_dict() for row in forecast_view.hourly_window(columnar, tz)] == legacy_hourly_window(weather, tz)
+
+    def legacy():
+        for hour in legacy_hourly_window(weather, tz):
+            (hour["original_time"], hour["time"], hour["temperature"], hour["windspeed"], hour["beaufort"],
+             hour["winddirection"], hour["cardinal"], hour["weather_code"], hour["icon"])
+    baseline = report("legacy loop", timeit.timeit(legacy, number=number), number)
+
+    def cold():
+        forecast = HourlyForecast.from_openmeteo(weather["hourly"], tz)
+        render_rows(forecast_view.hourly_window({"hourly": forecast}, tz))
+    report("convert + window (cold)", timeit.timeit(cold, number=number), number, baseline)
+    report("window (cached forecast)", timeit.timeit(lambda: render_rows(forecast_view.hourly_window(columnar, tz)), number=number), number, baseline)
+
+
+def bench_memory(count=1000):
+    print(f"memory: hourly data of {count} cached 48-hour forecasts")
+    tz = zoneinfo.ZoneInfo("Europe/London")
+
+    def measure(build):
+        tracemalloc.start()
+        kept = [build(i) for i in range(count)]
+        size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        del kept
+        return size
+
+    # json.loads builds fresh objects for every payload, like real responses do
+    raw = json.dumps(make_payload()["hourly"])
+    as_dicts = measure(lambda i: json.loads(raw))
+    as_rows = measure(lambda i: hourly_dicts_from_openmeteo(json.loads(raw)))
+    columnar = measure(lambda i: HourlyForecast.from_openmeteo(json.loads(raw), tz))
+    print(f"  {'open-meteo dict of lists':<28} {as_dicts / count / 1024:8.1f} KiB/forecast")
+    print(f"  {'list of per-hour dicts':<28} {as_rows / count / 1024:8.1f} KiB/forecast")
+    print(f"  {'HourlyForecast':<28} {columnar / count / 1024:8.1f} KiB/forecast")
+    print(f"  {'HourlyForecast.to_bytes()':<28} {len(HourlyForecast.from_openmeteo(json.loads(raw), tz).to_bytes()) / 1024:8.1f} KiB/forecast")
+
+
+def bench_classifiers(cities=1000, hours=48, number=5):
+    print(f"classifiers: beaufort, cardinal, icon and description for {cities} cities x {hours} hours")
+    rng = random.Random(0)
+    n = cities * hours
+    speeds = [rng.uniform(0, 130) for _ in range(n)]
+    degrees = [rng.randrange(360) for _ in range(n)]
+    codes = [rng.choice((0, 1, 2, 3, 45, 51, 61, 63, 71, 80, 95)) for _ in range(n)]
+    is_day = [rng.randrange(2) for _ in range(n)]
+
+    def scalar():
+        return ([beaufort_scale(v) for v in speeds], [wind_direction_cardinal(d) for d in degrees],
+                [get_weather_icon(c, d) for c, d in zip(codes, is_day)],
+                [get_weather_simplified(c, d) for c, d in zip(codes, is_day)])
+
+    def batch():
+        return (beaufort_batch(speeds), cardinal_batch(degrees), icon_batch(codes, is_day), simplified_batch(codes, is_day))
+
+    assert scalar() == batch()
+    baseline = report("scalar, per value", timeit.timeit(scalar, number=number), number)
+    report("batch", timeit.timeit(batch, number=number), number, baseline)
+
+
+def bench_search(cities=100000, number=2000):
+    print(f"search: city autocomplete over {cities} cities")
+    rng = random.Random(0)
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    catalog = []
+    for i in range(cities):
+        name = "".join(rng.choice(letters) for _ in range(rng.randint(4, 10))).title()
+        if rng.random() < 0.3:
+            name = rng.choice(("San", "New", "Port")) + " " + name
+        catalog.append({"id": i, "name": name, "slug": name.lower().replace(" ", "-"), "population": rng.randrange(10 ** 6)})
+    catalog = tuple(catalog)
+    started = timeit.default_timer()
+    index = CitySearchIndex(catalog)
+    print(f"  {'build index':<28} {(timeit.default_timer() - started) * 1000:10.1f} ms")
+
+    for query in ("s", "san", "new yo", catalog[0]["name"]):
+        def scan():
+            prefix = query.lower().replace(" ", "-")
+            matches = [c for c in catalog if any(w.startswith(prefix) for w in c["slug"].split("-"))]
+            return sorted(matches, key=lambda c: -c["population"])[:10]
+
+        baseline = report(f"scan {query!r}", timeit.timeit(scan, number=3), 3)
+        report(f"index {query!r}", timeit.timeit(lambda: index.search(query, 10), number=number), number, baseline)
+
+
+BENCHMARKS = {
+    "forecast_view": bench_forecast_view,
+    "memory": bench_memory,
+    "classifiers": bench_classifiers,
+    "search": bench_search,
+}
+
+
+if __name__ == "__main__":
+    names = sys.argv[1:] or list(BENCHMARKS)
+    for name in names:
+        BENCHMARKS[name]()
@@ -0,0 +1,185 @@
+"""
+city_import.py
+
+Streams a city dataset into the `cities` table, in batches of executemany
+upserts, without touching users or reports.
+
+Supported formats (optionally gzipped):
+- GeoNames dumps (cities15000.txt, allCountries.txt, ...): tab-separated, no header
+- CSV with a header row containing name, timezone, lat and lon
+  (latitude/longitude/lng are accepted too, country and population are optional)
+
+Cities are keyed by slug. Importing an existing slug updates the row in place,
+so city ids and the reports that reference them are kept. When several places
+share a name (there are dozens of Springfields), the most populous one wins.
+
+Usage:
+    python city_import.py cities15000.txt
+    python city_import.py cities.csv.gz --min-population 50000 --batch 5000
+"""
+
+import argparse
+import csv
+import gzip
+import re
+import sqlite3
+import sys
+import time
+import zoneinfo
+
+from slugify import slugify
+
+from db import connect
+from reference_data import bump_version
+
+IMPORT_BATCH = 5000
+
+# GeoNames column positions
+GEONAMES_NAME = 1
+GEONAMES_LAT = 4
+GEONAMES_LON = 5
+GEONAMES_FEATURE_CLASS = 6
+GEONAMES_COUNTRY = 8
+GEONAMES_POPULATION = 14
+GEONAMES_TIMEZONE = 17
+
+UPSERT_CITY = '''
+    INSERT INTO cities (name, slug, timezone, lat, lon, country, population)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(slug) DO UPDATE SET
+        name = excluded.name, timezone = excluded.timezone, lat = excluded.lat, lon = excluded.lon,
+        country = excluded.country, population = excluded.population
+    WHERE COALESCE(excluded.population, 0) >= COALESCE(cities.population, 0)
+'''
+
+_NOT_SLUG = re.compile(r"[^a-z0-9]+")
+# slugify treats these specially (numbers like 1,000 and HTML entities), leave them to it
+_SLUGIFY_ONLY = re.compile(r"\d,\d|&")
+
+
+def fast_slug(name):
+    """
+    Same result as slugify(name). Plain ASCII names, nearly all of a dataset, skip
+    slugify's transliteration and entity handling, which is most of its cost.
+    """
+    if not name.isascii() or _SLUGIFY_ONLY.search(name):
+        return slugify(name)
+    return _NOT_SLUG.sub("-", name.lower()).strip("-")
+
+
+def open_text(path):
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8", newline="")
+    return open(path, encoding="utf-8", newline="")
+
+
+def read_geonames(f):
+    # GeoNames fields never contain tabs or quotes, csv is only used for speed
+    for row in csv.reader(f, delimiter="\t", quoting=csv.QUOTE_NONE):
+        if len(row) <= GEONAMES_TIMEZONE or row[GEONAMES_FEATURE_CLASS] != "P":
+            continue
+        yield (row[GEONAMES_NAME], row[GEONAMES_TIMEZONE], row[GEONAMES_LAT], row[GEONAMES_LON],
+               row[GEONAMES_COUNTRY], row[GEONAMES_POPULATION])
+
+
+def read_csv(f):
+    for row in csv.DictReader(f):
+        yield (row.get("name"), row.get("timezone"),
+               row.get("lat") or row.get("latitude"), row.get("lon") or row.get("longitude") or row.get("lng"),
+               row.get("country"), row.get("population"))
+
+
+def read_cities(path):
+    """
+    Yields (name, timezone, lat, lon, country, population) as strings, straight from the file.
+    """
+    base = path[:-3] if path.endswith(".gz") else path
+    reader = read_csv if base.endswith(".csv") else read_geonames
+    with open_text(path) as f:
+        yield from reader(f)
+
+
+def city_rows(records, min_population=0, log=print):
+    """
+    Validates and converts records into upsert parameters, logging and dropping invalid ones.
+    """
+    timezones = zoneinfo.available_timezones()
+    for name, tz, lat, lon, country, population in records:
+        try:
+            population = int(population) if population else None
+            if min_population and (population or 0) < min_population:
+                continue
+            slug = fast_slug(name) if name else ""
+            if not slug or tz not in timezones:
+                raise ValueError(f"bad name or timezone {tz!r}")
+            yield (name, slug, tz, float(lat), float(lon), country or None, population)
+        except (TypeError, ValueError) as e:
+            log(f"Skipping {name!r}: {e}")
+
+
+def upsert_cities(conn, rows):
+    """
+    Upserts one batch of city rows in a single statement. If the batch hits another
+    constraint (a name used by a different slug), it is retried row by row and those rows
+    are skipped. Returns the number of rows skipped.
+    """
+    # a savepoint, so a failed batch doesn't roll back the caller's other changes
+    conn.execute('SAVEPOINT city_batch')
+    try:
+        conn.executemany(UPSERT_CITY, rows)
+        conn.execute('RELEASE city_batch')
+        return 0
+    except sqlite3.IntegrityError:
+        conn.execute('ROLLBACK TO city_batch')
+        conn.execute('RELEASE city_batch')
+    skipped = 0
+    for row in rows:
+        try:
+            conn.execute(UPSERT_CITY, row)
+        except sqlite3.IntegrityError:
+            skipped += 1
+    return skipped
+
+
+def import_cities(rows, batch_size=IMPORT_BATCH, conn=None, log=print):
+    """
+    Upserts city rows in batches, one transaction per batch. Returns (imported, skipped).
+    """
+    own = conn is None
+    if own:
+        conn = connect()
+    imported = skipped = 0
+    started = time.perf_counter()
+    batch = []
+    try:
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= batch_size:
+                skipped += upsert_cities(conn, batch)
+                conn.commit()
+                imported += len(batch)
+                batch = []
+                log(f"{imported} rows, {imported / (time.perf_counter() - started):.0f} rows/s")
+        if batch:
+            skipped += upsert_cities(conn, batch)
+            imported += len(batch)
+        # running apps reload their cached cities
+        bump_version(conn)
+        conn.commit()
+    finally:
+        if own:
+            conn.close()
+    elapsed = time.perf_counter() - started
+    log(f"Upserted {imported - skipped} cities ({skipped} skipped) in {elapsed:.1f}s, {imported / max(elapsed, 1e-9):.0f} rows/s")
+    return imported - skipped, skipped
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Import a GeoNames TSV or CSV city dataset into the cities table.")
+    parser.add_argument("path", help="dataset file, .txt/.tsv (GeoNames) or .csv, optionally .gz")
+    parser.add_argument("--min-population", type=int, default=0, help="skip places with fewer inhabitants")
+    parser.add_argument("--batch", type=int, default=IMPORT_BATCH, help="rows per transaction")
+    args = parser.parse_args()
+
+    imported, skipped = import_cities(city_rows(read_cities(args.path), args.min_population), args.batch)
+    sys.exit(0 if imported else 1)
@@ -0,0 +1,105 @@
+"""
+city_search.py
+
+In-memory prefix index for the city search / autocomplete endpoint.
+
+Every word of a city's slug is a key ("new-york" is found by "new" and by
+"york"), and the keys are kept in one sorted list, so the matches for a
+prefix are a contiguous range found with two bisects. Results are ranked:
+exact name, then names starting with the query, then other words starting
+with it, each by population.
+
+Short prefixes match a large part of a big catalog ("s" matches a tenth of
+it), so for every prefix matching more than SCAN_LIMIT keys the best results
+are worked out when the index is built; any other query ranks at most
+SCAN_LIMIT keys.
+"""
+
+import heapq
+from bisect import bisect_left, bisect_right
+
+from slugify import slugify
+
+MAX_RESULTS = 20
+# Largest number of keys a query ranks itself
+SCAN_LIMIT = 256
+
+
+def normalize(text):
+    """
+    Queries are matched against city slugs, so case and accents don't matter.
+    """
+    return slugify(text or "")
+
+
+class CitySearchIndex:
+    def __init__(self, cities):
+        """
+        cities: sequence of mappings with at least "slug", "name" and optionally "population"
+        """
+        self.cities = cities
+        # (key, rank, city position); rank sorts better matches first
+        entries = []
+        self._exact = {}
+        for pos, city in enumerate(cities):
+            slug = city["slug"]
+            popularity = -(city.get("population") or 0)
+            self._exact.setdefault(slug, pos)
+            words = slug.split("-")
+            for i in range(len(words)):
+                entries.append(("-".join(words[i:]), (i > 0, popularity, city["name"]), pos))
+        entries.sort()
+        self._keys = [entry[0] for entry in entries]
+        self._entries = entries
+
+        # prefixes matching more than SCAN_LIMIT keys: keys i and i + SCAN_LIMIT share them
+        self._top = {}
+        keys = self._keys
+        for i in range(len(keys) - SCAN_LIMIT):
+            first, last = keys[i], keys[i + SCAN_LIMIT]
+            n = 0
+            while n < len(first) and n < len(last) and first[n] == last[n]:
+                n += 1
+            for j in range(n, 0, -1):
+                if first[:j] in self._top:
+                    break
+                self._top[first[:j]] = []
+        # and their best MAX_RESULTS cities
+        if self._top:
+            for key, rank, pos in sorted(entries, key=lambda entry: entry[1]):
+                for n in range(1, len(key) + 1):
+                    top = self._top.get(key[:n])
+                    if top is None:
+                        break
+                    if len(top) < MAX_RESULTS and pos not in top:
+                        top.append(pos)
+
+    def __len__(self):
+        return len(self.cities)
+
+    def _ranked(self, prefix, limit):
+        if prefix in self._top:
+            return self._top[prefix][:limit]
+        lo = bisect_left(self._keys, prefix)
+        # every key with this prefix sorts before prefix + the highest character
+        hi = bisect_right(self._keys, prefix + "\uffff", lo)
+        best = heapq.nsmallest(limit * 2, self._entries[lo:hi], key=lambda entry: entry[1])
+        positions = []
+        for _, _, pos in best:
+            if pos not in positions:
+                positions.append(pos)
+        return positions[:limit]
+
+    def search(self, query, limit=10):
+        """
+        Returns up to `limit` cities matching the query, best first.
+        """
+        prefix = normalize(query)
+        if not prefix:
+            return []
+        limit = max(1, min(limit, MAX_RESULTS))
+        positions = self._ranked(prefix, limit)
+        exact = self._exact.get(prefix)
+        if exact is not None:
+            positions = [exact] + [pos for pos in positions if pos != exact][:limit - 1]
+        return [self.cities[pos] for pos in positions]
@@ -0,0 +1,164 @@
+"""
+db.py
+
+SQLite connection layer for weather.db.
+
+Connections come from a small per-process pool instead of a fresh
+sqlite3.connect per call, and are tuned once when they are opened:
+- WAL journal mode, so report INSERTs no longer block readers
+- synchronous=NORMAL (safe with WAL), a larger page cache and mmap reads
+- a busy timeout, so a writer waits for the lock instead of failing
+  with "database is locked"
+- a bigger prepared-statement cache
+
+Inside a request, get_db() returns the request's connection; it is given
+back to the pool when the app context tears down, even if the route
+returned early or raised. Outside a request (background threads, CLIs)
+get_db() hands out a pooled connection and close() returns it.
+"""
+
+import os
+import sqlite3
+import threading
+
+from flask import g, has_app_context
+
+DB_PATH = os.environ.get("DB_PATH", os.path.join(os.path.dirname(__file__), 'weather.db'))
+
+# Seconds a connection waits on a locked database before raising
+DB_BUSY_TIMEOUT = float(os.environ.get("DB_BUSY_TIMEOUT", 10))
+# Idle connections kept per process; more can be open, the extra ones are closed when returned
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", 4))
+# Page cache per connection in KiB, and bytes of the file read through mmap
+DB_CACHE_SIZE = int(os.environ.get("DB_CACHE_SIZE", 8192))
+DB_MMAP_SIZE = int(os.environ.get("DB_MMAP_SIZE", 64 * 1024 * 1024))
+DB_SYNCHRONOUS = os.environ.get("DB_SYNCHRONOUS", "NORMAL")
+DB_STATEMENT_CACHE = int(os.environ.get("DB_STATEMENT_CACHE", 256))
+
+
+class PooledConnection(sqlite3.Connection):
+    """
+    A sqlite3 connection whose close() gives it back to its pool.
+    Request connections ignore close(), the app context teardown releases them.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.pool = None
+        self.request_bound = False
+
+    def close(self):
+        if self.request_bound:
+            return
+        if self.pool is not None:
+            self.pool.release(self)
+        else:
+            super().close()
+
+    def discard(self):
+        sqlite3.Connection.close(self)
+
+
+def connect(db_path=DB_PATH):
+    """
+    Opens a new tuned connection that is not part of a pool.
+    """
+    conn = sqlite3.connect(db_path, timeout=DB_BUSY_TIMEOUT, factory=PooledConnection,
+                           cached_statements=DB_STATEMENT_CACHE, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    # auto_vacuum and journal_mode are stored in the database file, the rest is per connection.
+    # auto_vacuum only takes effect on a new database (or after a VACUUM), see retention.py
+    conn.execute('PRAGMA auto_vacuum=INCREMENTAL')
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute(f'PRAGMA synchronous={DB_SYNCHRONOUS}')
+    conn.execute(f'PRAGMA cache_size=-{DB_CACHE_SIZE}')
+    conn.execute(f'PRAGMA mmap_size={DB_MMAP_SIZE}')
+    conn.execute(f'PRAGMA busy_timeout={int(DB_BUSY_TIMEOUT * 1000)}')
+    conn.execute('PRAGMA temp_store=MEMORY')
+    return conn
+
+
+class ConnectionPool:
+    def __init__(self, db_path=DB_PATH, size=DB_POOL_SIZE):
+        self.db_path = db_path
+        self.size = size
+        self._idle = []
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self._stats = {"opened": 0, "reused": 0, "discarded": 0}
+
+    def acquire(self):
+        with self._lock:
+            if self._pid != os.getpid():
+                # forked worker, connections can't be shared with the parent process
+                self._idle = []
+                self._pid = os.getpid()
+            conn = self._idle.pop() if self._idle else None
+            self._stats["reused" if conn else "opened"] += 1
+        if conn is None:
+            conn = connect(self.db_path)
+            conn.pool = self
+        return conn
+
+    def release(self, conn):
+        conn.request_bound = False
+        try:
+            # don't hand a half-finished transaction to the next user
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            conn.discard()
+            return
+        with self._lock:
+            if conn in self._idle:
+                return
+            if len(self._idle) < self.size and self._pid == os.getpid():
+                self._idle.append(conn)
+                return
+            self._stats["discarded"] += 1
+        conn.discard()
+
+    def close_all(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.discard()
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, idle=len(self._idle))
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(db_path=DB_PATH):
+    with _pools_lock:
+        pool = _pools.get(db_path)
+        if pool is None:
+            pool = _pools[db_path] = ConnectionPool(db_path)
+        return pool
+
+
+def get_db():
+    """
+    Returns the current request's connection, or a pooled one outside a request.
+    """
+    if has_app_context():
+        conn = g.get("db")
+        if conn is None:
+            conn = g.db = get_pool().acquire()
+            conn.request_bound = True
+        return conn
+    return get_pool().acquire()
+
+
+def close_db(exception=None):
+    conn = g.pop("db", None)
+    if conn is not None:
+        conn.pool.release(conn)
+
+
+def init_app(app):
+    app.teardown_appcontext(close_db)
@@ -1,13 +1,11 @@
 import sqlite3
 import os
 import json
-from slugify import slugify
 
-DB_PATH = os.path.join(os.path.dirname(__file__), 'weather.db')
+from migrations import migrate
+from city_import import city_rows, import_cities
 
-# remove database first
-if os.path.exists(DB_PATH):
-    os.remove(DB_PATH)
+DB_PATH = os.path.join(os.path.dirname(__file__), 'weather.db')
 
 def get_db():
     conn = sqlite3.connect(DB_PATH)
@@ -15,48 +13,8 @@ def get_db():
     return conn
 
 def init_db():
-    conn = get_db()
-    c = conn.cursor()
-    c.execute('''
-    CREATE TABLE IF NOT EXISTS cities (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        name TEXT UNIQUE NOT NULL,
-        slug TEXT UNIQUE NOT NULL,
-        timezone TEXT NOT NULL,
-        lat REAL NOT NULL,
-        lon REAL NOT NULL
-    )''')
-    c.execute('''
-    CREATE TABLE IF NOT EXISTS styles (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        name TEXT UNIQUE NOT NULL,
-        position INTEGER NOT NULL
-    )''')
-    c.execute('''
-    CREATE TABLE IF NOT EXISTS weather_reports (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        user_id INTEGER,
-        city_id INTEGER NOT NULL,
-        style_id INTEGER NOT NULL,
-        time_period TEXT NOT NULL,
-        date TEXT NOT NULL,
-        weather_json TEXT NOT NULL,
-        report_text TEXT NOT NULL,
-        created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-        FOREIGN KEY(user_id) REFERENCES users(id),
-        FOREIGN KEY(city_id) REFERENCES cities(id),
-        FOREIGN KEY(style_id) REFERENCES styles(id),
-        UNIQUE(city_id, style_id, time_period, date)
-    )''')
-    c.execute('''
-    CREATE TABLE IF NOT EXISTS users (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        username TEXT UNIQUE NOT NULL,
-        password_hash TEXT NOT NULL,
-        created_at DATETIME DEFAULT CURRENT_TIMESTAMP
-    )''')
-    conn.commit()
-    conn.close()
+    # The schema is created and upgraded in place by migrations.py, existing data is kept
+    migrate()
 
 def populate_from_config():
     with open("config.json", encoding="utf-8") as f:
@@ -65,15 +23,14 @@ def populate_from_config():
     styles = config["STYLES"]
     conn = get_db()
     c = conn.cursor()
-    for city in cities:
-        slug = slugify(city['name'])
-        c.execute('INSERT OR IGNORE INTO cities (name, slug, timezone, lat, lon) VALUES (?, ?, ?, ?, ?)', (city['name'], slug, city['timezone'], city['lat'], city['lon']))
     for i, style in enumerate(styles):
         c.execute('INSERT OR IGNORE INTO styles (name, position) VALUES (?, ?)', (style, i))
-    conn.commit()
+    # upserts the cities in one batch and bumps the reference data version, so running apps reload
+    rows = city_rows((city['name'], city['timezone'], city['lat'], city['lon'], None, None) for city in cities)
+    import_cities(rows, conn=conn, log=lambda msg: None)
     conn.close()
 
 if __name__ == "__main__":
     init_db()
     populate_from_config()
-    print("Database initialized and populated from config.json.")
+    print("Database migrated and populated from config.json.")
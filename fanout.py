@@ -0,0 +1,86 @@
+"""
+fanout.py
+
+Runs a page's independent upstream fetches concurrently on a shared thread
+pool, under one deadline for the whole request.
+
+A fetch that misses the deadline is not cancelled: it keeps running in the
+pool and fills its cache (forecast_cache, geo_cache, the warmer snapshot),
+so the next request finds the result. The page renders a placeholder for it
+in the meantime.
+
+map_batches() splits one large upstream call into batches fetched side by
+side, e.g. the current weather of a whole city catalog.
+"""
+
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+# Threads shared by all requests of a worker process
+FANOUT_WORKERS = int(os.environ.get("FANOUT_WORKERS", 16))
+# Threads for map_batches(), as many as upstream.py keeps pooled connections. A separate pool,
+# so page tasks waiting on their batches can't take every thread
+BATCH_WORKERS = int(os.environ.get("BATCH_WORKERS", 20))
+# Seconds a page waits for its upstream data in total before rendering placeholders
+PAGE_DEADLINE = float(os.environ.get("PAGE_DEADLINE", 2.5))
+
+_executors = {}
+_executors_lock = threading.Lock()
+
+
+def get_executor(name="fanout", workers=FANOUT_WORKERS):
+    with _executors_lock:
+        executor, pid = _executors.get(name, (None, None))
+        # forked worker, the parent's threads don't exist in this process
+        if executor is None or pid != os.getpid():
+            executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=name)
+            _executors[name] = (executor, os.getpid())
+        return executor
+
+
+def submit(fn, *args):
+    return get_executor().submit(fn, *args)
+
+
+def map_batches(fn, batches):
+    """
+    Runs fn(batch) for every batch concurrently and returns the results in batch order.
+    A batch that raised gives None, it is logged.
+    """
+    if len(batches) == 1:
+        futures = None
+    else:
+        executor = get_executor("batch", BATCH_WORKERS)
+        futures = [executor.submit(fn, batch) for batch in batches]
+    results = []
+    for i, batch in enumerate(batches):
+        try:
+            # a single batch runs on the calling thread
+            results.append(futures[i].result() if futures else fn(batch))
+        except Exception as e:
+            print(f"[fanout] batch {i} failed: {e!r}")
+            results.append(None)
+    return results
+
+
+def deadline_in(seconds=PAGE_DEADLINE):
+    """
+    Absolute deadline for result_by(), `seconds` from now.
+    """
+    return time.monotonic() + seconds
+
+
+def result_by(future, deadline, default=None):
+    """
+    Returns the future's result if it is ready by the deadline, otherwise default.
+    A fetch that raised also gives default, it is logged.
+    """
+    try:
+        return future.result(timeout=max(0.0, deadline - time.monotonic()))
+    except TimeoutError:
+        return default
+    except Exception as e:
+        print(f"[fanout] {e!r}")
+        return default
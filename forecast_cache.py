@@ -0,0 +1,173 @@
+"""
+forecast_cache.py
+
+In-process cache for open-meteo forecasts with stale-while-revalidate.
+
+open-meteo only updates its models once an hour, so a forecast fetched at 10:05
+is as good as one fetched at 10:55. Entries expire at the next top of the hour
+in the location's own timezone. After that they are still served for a grace
+period while a single background thread fetches the new forecast.
+
+The cache is an LRU of at most FORECAST_CACHE_SIZE locations, and entries past
+their grace period are dropped, so visitors spread over many grid cells don't
+grow it for the life of the process. Concurrent misses for one location share
+a single fetch.
+"""
+
+import os
+import threading
+import time
+import zoneinfo
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from singleflight import SingleFlight
+
+# Upper bound on how long a forecast is considered fresh (seconds)
+FORECAST_TTL = int(os.environ.get("FORECAST_CACHE_TTL", 3600))
+# How long an expired forecast may still be served while it is being refreshed
+FORECAST_STALE_TTL = int(os.environ.get("FORECAST_CACHE_STALE_TTL", 1800))
+# Most locations kept, the least recently used are dropped first
+FORECAST_CACHE_SIZE = int(os.environ.get("FORECAST_CACHE_SIZE", 2048))
+
+
+def next_hour_boundary(timezone_str, now=None):
+    """
+    Returns the epoch timestamp of the next top of the hour in the given timezone.
+    Timezones with a half-hour offset (e.g. Asia/Kolkata) roll over on their own hour.
+    """
+    try:
+        tz = zoneinfo.ZoneInfo(timezone_str)
+    except Exception:
+        tz = zoneinfo.ZoneInfo("UTC")
+    local_now = datetime.fromtimestamp(now if now is not None else time.time(), tz)
+    boundary = local_now.replace(minute=0, second=0, microsecond=0) + timedelta(hours=1)
+    return boundary.timestamp()
+
+
+def forecast_key(lat, lon, timezone_str):
+    # Round so that 49.2827 and 49.28270000001 share an entry
+    return (round(float(lat), 4), round(float(lon), 4), timezone_str)
+
+
+class ForecastCache:
+    """
+    Thread-safe {key: payload} LRU with hourly expiry and background refresh.
+
+    Payloads handed out are shared between requests and must be treated as read-only.
+    """
+
+    def __init__(self, ttl=FORECAST_TTL, stale_ttl=FORECAST_STALE_TTL, maxsize=FORECAST_CACHE_SIZE):
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.maxsize = maxsize
+        self._entries = OrderedDict()  # {key: (payload, expires_at)}
+        self._refreshing = set()
+        # misses only need coalescing within the process, each process has its own cache
+        self._flight = SingleFlight(db_path=None)
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "stale_hits": 0, "misses": 0, "refreshes": 0, "errors": 0, "evictions": 0}
+
+    def _expires_at(self, key, now):
+        return min(now + self.ttl, next_hour_boundary(key[2], now))
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+    def get(self, key, loader):
+        """
+        Returns the cached payload for key, calling loader() on a miss. Concurrent
+        misses for the same key wait for one loader() call.
+        An expired entry is returned as-is while one background refresh runs.
+        Empty payloads (failed fetches) are never cached.
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and now < entry[1]:
+                self._entries.move_to_end(key)
+                self._stats["hits"] += 1
+                return entry[0]
+            if entry and now < entry[1] + self.stale_ttl:
+                self._entries.move_to_end(key)
+                self._stats["stale_hits"] += 1
+                if key not in self._refreshing:
+                    self._refreshing.add(key)
+                    threading.Thread(target=self._refresh, args=(key, loader), daemon=True).start()
+                return entry[0]
+            if entry:
+                del self._entries[key]
+            self._stats["misses"] += 1
+
+        return self._flight.do(key, lambda: self._load(key, loader))
+
+    def _load(self, key, loader):
+        # a waiter of the previous flight may arrive just after it stored its payload
+        payload = self.peek(key)
+        if payload is not None:
+            return payload
+        payload = loader()
+        if payload:
+            self.put(key, payload)
+        else:
+            self._count("errors")
+        return payload
+
+    def _refresh(self, key, loader):
+        try:
+            payload = loader()
+        except Exception:
+            payload = None
+        with self._lock:
+            self._refreshing.discard(key)
+            if payload:
+                self._stats["refreshes"] += 1
+            else:
+                # keep serving the stale entry until it runs out of grace
+                self._stats["errors"] += 1
+                return
+        self.put(key, payload)
+
+    def put(self, key, payload):
+        now = time.time()
+        with self._lock:
+            self._entries[key] = (payload, self._expires_at(key, now))
+            self._entries.move_to_end(key)
+            self._evict(now)
+
+    def _evict(self, now):
+        # entries past their grace period are never served again
+        expired = [key for key, (_, expires_at) in self._entries.items() if now >= expires_at + self.stale_ttl]
+        for key in expired:
+            del self._entries[key]
+        evicted = len(expired)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            evicted += 1
+        self._stats["evictions"] += evicted
+
+    def peek(self, key):
+        """
+        Returns the cached payload (fresh or stale) without loading or counting, else None.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry and time.time() < entry[1] + self.stale_ttl:
+            return entry[0]
+        return None
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["size"] = len(self._entries)
+        lookups = stats["hits"] + stats["stale_hits"] + stats["misses"]
+        stats["hit_ratio"] = (stats["hits"] + stats["stale_hits"]) / lookups if lookups else 0.0
+        return stats
+
+
+forecast_cache = ForecastCache()
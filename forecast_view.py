@@ -0,0 +1,82 @@
+"""
+forecast_view.py
+
+Builds the 24-hour forecast strip shown on the homepage and the city pages.
+
+Forecast payloads from forecast_cache carry their hourly data as an
+HourlyForecast, whose times are already epoch seconds. The window starting
+at the current hour is found with a bisect and returned as a slice view, so
+nothing is copied. The rows' beaufort/cardinal/icon values are computed once
+per forecast and shared by every render.
+"""
+
+import threading
+import time
+from bisect import bisect_left
+from collections import OrderedDict
+from datetime import datetime
+
+from hourly_forecast import HourlyForecast
+
+WINDOW_HOURS = 24
+# Each entry holds a reference to its payload, which keeps the payload's id() from being reused
+MEMO_SIZE = 512
+
+_forecast_memo = OrderedDict()  # {id(hourly): (hourly, tz, HourlyForecast)}
+_memo_lock = threading.Lock()
+
+
+def as_hourly_forecast(hourly, tz):
+    """
+    Returns hourly as an HourlyForecast. Plain open-meteo dicts (e.g. loaded from
+    weather_reports) are converted once per payload.
+    """
+    if isinstance(hourly, HourlyForecast):
+        return hourly
+    key = id(hourly)
+    with _memo_lock:
+        entry = _forecast_memo.get(key)
+        if entry is not None and entry[0] is hourly and entry[1] == tz:
+            _forecast_memo.move_to_end(key)
+            return entry[2]
+    forecast = HourlyForecast.from_openmeteo(hourly, tz)
+    with _memo_lock:
+        _forecast_memo[key] = (hourly, tz, forecast)
+        while len(_forecast_memo) > MEMO_SIZE:
+            _forecast_memo.popitem(last=False)
+    return forecast
+
+
+def local_hour_start(now_epoch, tz):
+    """
+    Epoch of the start of the current local hour. Not simply now % 3600:
+    half-hour offset timezones such as Asia/Kolkata start their hours at :30 UTC.
+    """
+    local = datetime.fromtimestamp(now_epoch, tz)
+    return int(local.replace(minute=0, second=0, microsecond=0).timestamp())
+
+
+def window_start(epochs, hour_epoch):
+    """
+    Index of the first hour that is the current hour or later.
+    """
+    return bisect_left(epochs, hour_epoch)
+
+
+def hourly_window(weather, tz, now=None, hours=WINDOW_HOURS):
+    """
+    Returns an HourlyForecast view from the current hour onwards (at most `hours` long),
+    or None if the payload has no hourly data.
+    - tz: ZoneInfo the payload's times are in
+    - now: epoch seconds, defaults to the current time
+    """
+    if not weather or not weather.get("hourly"):
+        return None
+    forecast = as_hourly_forecast(weather["hourly"], tz)
+    hour_epoch = local_hour_start(now if now is not None else time.time(), tz)
+
+    start = window_start(forecast.epochs, hour_epoch)
+    # nothing left in the payload (stale data), show what we have like before
+    if start >= len(forecast):
+        start = 0
+    return forecast[start:start + hours]
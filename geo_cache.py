@@ -0,0 +1,149 @@
+"""
+geo_cache.py
+
+Two-tier cache for IP geolocation lookups.
+
+Tier 1 is an in-process LRU with a size cap and a TTL. Tier 2 is an
+`ip_locations` table in weather.db, so lookups survive restarts and are
+shared between worker processes. Addresses can be keyed by network prefix
+(/24 for IPv4, /48 for IPv6) so that neighbours share one entry.
+
+Only the location is cached here. The weather for a location is cached
+separately by forecast_cache, on its own hourly schedule.
+"""
+
+import ipaddress
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from db import DB_PATH, get_pool
+
+GEO_CACHE_SIZE = int(os.environ.get("GEO_CACHE_SIZE", 10000))
+# IP to city mappings change rarely, keep them for a day
+GEO_CACHE_TTL = int(os.environ.get("GEO_CACHE_TTL", 86400))
+# Failed lookups (private ranges, reserved addresses) are retried sooner
+GEO_CACHE_NEGATIVE_TTL = int(os.environ.get("GEO_CACHE_NEGATIVE_TTL", 600))
+GEO_CACHE_SUBNET = os.environ.get("GEO_CACHE_SUBNET", "1") == "1"
+
+# Every n-th write to the persisted tier also deletes its expired rows
+PRUNE_EVERY = 500
+
+
+def subnet_key(ip, ipv4_prefix=24, ipv6_prefix=48):
+    """
+    Returns the network prefix for an address, e.g. 75.157.111.33 -> 75.157.111.0/24.
+    Unparseable input is returned unchanged.
+    """
+    try:
+        addr = ipaddress.ip_address(ip.strip())
+    except ValueError:
+        return ip
+    prefix = ipv4_prefix if addr.version == 4 else ipv6_prefix
+    return str(ipaddress.ip_network(f"{addr}/{prefix}", strict=False))
+
+
+class GeoLocationCache:
+    def __init__(self, maxsize=GEO_CACHE_SIZE, ttl=GEO_CACHE_TTL, negative_ttl=GEO_CACHE_NEGATIVE_TTL,
+                 use_subnet=GEO_CACHE_SUBNET, db_path=DB_PATH):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.use_subnet = use_subnet
+        self.db_path = db_path
+        self._entries = OrderedDict()  # {key: (location, expires_at)}
+        self._lock = threading.Lock()
+        self._writes = 0
+        self._stats = {"hits": 0, "db_hits": 0, "misses": 0}
+
+    def key_for(self, ip):
+        # X-Forwarded-For may hold a chain of addresses, the client is the first one
+        ip = (ip or "").split(",")[0].strip()
+        return subnet_key(ip) if self.use_subnet else ip
+
+    def _connect(self):
+        # a pooled connection of our own, commits here must not include a request's pending writes
+        return get_pool(self.db_path).acquire()
+
+    def _db_get(self, key, now):
+        try:
+            conn = self._connect()
+            try:
+                row = conn.execute('SELECT data, expires_at FROM ip_locations WHERE key = ? AND expires_at > ?', (key, now)).fetchone()
+            finally:
+                conn.close()
+        except sqlite3.Error:
+            return None
+        if row:
+            return json.loads(row[0]), row[1]
+        return None
+
+    def _db_put(self, key, location, expires_at):
+        try:
+            conn = self._connect()
+            try:
+                conn.execute('INSERT OR REPLACE INTO ip_locations (key, data, expires_at) VALUES (?, ?, ?)', (key, json.dumps(location), expires_at))
+                self._writes += 1
+                if self._writes % PRUNE_EVERY == 0:
+                    conn.execute('DELETE FROM ip_locations WHERE expires_at <= ?', (time.time(),))
+                conn.commit()
+            finally:
+                conn.close()
+        except sqlite3.Error:
+            # the persisted tier is best effort, tier 1 still works without it
+            pass
+
+    def _remember(self, key, location, expires_at):
+        with self._lock:
+            self._entries[key] = (location, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def get(self, ip, loader):
+        """
+        Returns the cached location for ip, calling loader(ip) on a miss.
+        Successful lookups are kept for ttl, "fail" answers for negative_ttl.
+        Errors such as rate limiting are never cached.
+        """
+        key = self.key_for(ip)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and now < entry[1]:
+                self._entries.move_to_end(key)
+                self._stats["hits"] += 1
+                return entry[0]
+
+        entry = self._db_get(key, now)
+        if entry:
+            self._remember(key, *entry)
+            with self._lock:
+                self._stats["db_hits"] += 1
+            return entry[0]
+
+        with self._lock:
+            self._stats["misses"] += 1
+        location = loader(ip)
+        status = location.get("status")
+        if status in ("success", "fail"):
+            expires_at = now + (self.ttl if status == "success" else self.negative_ttl)
+            self._remember(key, location, expires_at)
+            self._db_put(key, location, expires_at)
+        return location
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["size"] = len(self._entries)
+        return stats
+
+
+geo_cache = GeoLocationCache()
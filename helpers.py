@@ -3,6 +3,7 @@ from datetime import datetime
 import requests
 import sqlite3
 import os
+import threading
 from google import genai
 import json
 from urllib.parse import quote
@@ -10,12 +11,16 @@ from dotenv import load_dotenv
 load_dotenv()
 from datetime import datetime
 import zoneinfo
+from forecast_cache import forecast_cache, forecast_key
+from upstream import upstream
+import fanout
+from prompt_builder import build_weather_table, record_prompt
+# the wind classifiers used to live here; app.py still imports them via `from helpers import *`
+from weather_helper import beaufort_scale, wind_direction_cardinal
+from hourly_forecast import HourlyForecast
 
-DB_PATH = os.path.join(os.path.dirname(__file__), 'weather.db')
-def get_db():
-	conn = sqlite3.connect(DB_PATH)
-	conn.row_factory = sqlite3.Row
-	return conn
+# get_db() used to open a new connection on every call, it now comes from the pool in db.py
+from db import DB_PATH, get_db
 
 def get_user_ip():
     ip = request.headers.get("X-Forwarded-For", request.remote_addr)
@@ -27,7 +32,7 @@ def get_user_location(ip):
     if ip:
         # Fetch location data from ip-api.com
         try:
-            resp = requests.get(f"http://ip-api.com/json/{ip}", timeout=3)
+            resp = upstream.get("ip-api", f"/json/{ip}")
             if resp.status_code == 200:
                 return resp.json()
             
@@ -42,8 +47,10 @@ def get_user_location(ip):
 
     return {"error": "Could not determine location"}
 
-def get_time_period():
-    hour = datetime.now().hour
+# Hour at which each time period starts, in order
+TIME_PERIOD_STARTS = [(0, "morning"), (11, "midday"), (18, "evening"), (22, "night")]
+
+def get_time_period_for_hour(hour):
     if 0 <= hour < 11:
         return "morning"
     elif 11 <= hour < 18:
@@ -52,70 +59,115 @@ def get_time_period():
         return "evening"
     else:
         return "night"
+
+def get_time_period():
+    return get_time_period_for_hour(datetime.now().hour)
     
 def get_time_period_from_json(weather_json):
     current_time = datetime.fromisoformat(weather_json["current"]["time"])
-    hour = current_time.hour
-    if 0 <= hour < 11:
-        return "morning"
-    elif 11 <= hour < 18:
-        return "midday"
-    elif 18 <= hour < 22:
-        return "evening"
-    else:
-        return "night"
+    return get_time_period_for_hour(current_time.hour)
 
 def get_weather(city, timezone_str="America/Los_Angeles"):
+    """
+    Returns the 2-day forecast for a city, served from the in-process forecast cache.
+    The returned dict is shared between requests, so treat it as read-only.
+    """
+    key = forecast_key(city['lat'], city['lon'], timezone_str)
+    return forecast_cache.get(key, lambda: fetch_weather(city['lat'], city['lon'], timezone_str))
+
+def fetch_weather(lat, lon, timezone_str="America/Los_Angeles"):
     tz_param = quote(timezone_str)
-    url = (
-        f"http://api.open-meteo.com/v1/forecast?latitude={city['lat']}&longitude={city['lon']}"
+    path = (
+        f"/v1/forecast?latitude={lat}&longitude={lon}"
         f"&current=temperature_2m,wind_direction_10m,wind_speed_10m,pressure_msl,relative_humidity_2m,weather_code"
         f"&hourly=wind_speed_10m,wind_direction_10m,temperature_2m,weather_code,is_day"
         f"&timezone={tz_param}&forecast_days=2"
     )
-    resp = requests.get(url)
+    url = upstream.url("open-meteo", path)
+    try:
+        resp = upstream.get("open-meteo", path)
+    except requests.RequestException:
+        return {}
     if resp.status_code == 200:
 
         # add url to output
         resp_json = resp.json()
         resp_json["url"] = url
+        # precompute here so callers never have to mutate the cached payload
+        if "current" in resp_json:
+            resp_json["current"]["cardinal"] = wind_direction_cardinal(resp_json["current"]["wind_direction_10m"])
+        # keep the hourly arrays columnar, this payload sits in forecast_cache
+        if "hourly" in resp_json:
+            tz = zoneinfo.ZoneInfo("UTC")
+            for name in (resp_json.get("timezone"), timezone_str):
+                try:
+                    tz = zoneinfo.ZoneInfo(name)
+                    break
+                except Exception:
+                    continue
+            resp_json["hourly"] = HourlyForecast.from_openmeteo(resp_json["hourly"], tz)
         return resp_json
     return {}
 
-def get_current_weather(city, timezone_str="America/Los_Angeles"):
+def dump_weather(weather):
     """
-    Fetches the current weather for a specific city.
+    json.dumps for forecast payloads, whose hourly data is an HourlyForecast.
     """
-    # if cities is a list, comma-separate lat and lon
-    if isinstance(city, list):
-        lat = ",".join(str(c['lat']) for c in city)
-        lon = ",".join(str(c['lon']) for c in city)
-    else:
-        lat = city['lat']
-        lon = city['lon']
+    return json.dumps(weather, default=lambda o: o.to_dict() if isinstance(o, HourlyForecast) else str(o))
+
+# Cities per open-meteo current weather request, which keeps the URL around 5 KB. The batches
+# are fetched concurrently (fanout.map_batches), 5000 cities take about as long as one batch
+CURRENT_WEATHER_BATCH = int(os.environ.get("CURRENT_WEATHER_BATCH", 250))
 
+def fetch_current_weather(cities, timezone_str="America/Los_Angeles"):
+    """
+    One open-meteo request for the current weather of a list of cities.
+    Returns one result per city, in order, or None if the request failed.
+    """
+    lat = ",".join(str(c['lat']) for c in cities)
+    lon = ",".join(str(c['lon']) for c in cities)
     tz_param = quote(timezone_str)
-    url = (
-        f"http://api.open-meteo.com/v1/forecast?latitude={lat}&longitude={lon}"
+    path = (
+        f"/v1/forecast?latitude={lat}&longitude={lon}"
         f"&current=temperature_2m,wind_direction_10m,wind_speed_10m,pressure_msl,relative_humidity_2m,weather_code,is_day"
         f"&timezone={tz_param}"
     )
-    resp = requests.get(url)
-    if resp.status_code == 200:
-        data = resp.json()
-        
-        # attach city information when it's a list or dict
-        if isinstance(city, dict):
-            data['city'] = city
-            data['location_name'] = city['name']
-        elif isinstance(city, list):
-            for i, c in enumerate(city):
-                data[i]['city'] = c
-                data[i]['location_name'] = c['name']
+    try:
+        resp = upstream.get("open-meteo", path)
+    except requests.RequestException:
+        return None
+    if resp.status_code != 200:
+        return None
+    data = resp.json()
+    # open-meteo returns a single object instead of a list for one location
+    if isinstance(data, dict):
+        data = [data]
+    if len(data) != len(cities):
+        return None
+    # attach city information
+    for item, c in zip(data, cities):
+        item['city'] = c
+        item['location_name'] = c['name']
+    return data
 
+def get_current_weather(city, timezone_str="America/Los_Angeles"):
+    """
+    Fetches the current weather for a specific city, or for a list of cities.
+    A list is fetched in batches of CURRENT_WEATHER_BATCH cities, concurrently. The result
+    is a list in the same order, with None for the cities whose batch failed; {} if all failed.
+    """
+    if isinstance(city, list):
+        batches = [city[i:i + CURRENT_WEATHER_BATCH] for i in range(0, len(city), CURRENT_WEATHER_BATCH)]
+        results = fanout.map_batches(lambda batch: fetch_current_weather(batch, timezone_str), batches)
+        if not any(results):
+            return {}
+        data = []
+        for batch, result in zip(batches, results):
+            data.extend(result or [None] * len(batch))
         return data
 
-    return {}
+    data = fetch_current_weather([city], timezone_str)
+    return data[0] if data else {}
     
 STYLE_INSTRUCTIONS = {
     "Normal Weather Report Style": """
@@ -137,26 +189,24 @@ STYLE_INSTRUCTIONS = {
     "Pirate": "Fully commit to Pirate style without mixing in newsletter/blog tone.",
 }
 
-def call_llm_api(city, weather, style):
+def build_llm_prompt(city, weather, style, time_period=None, now=None):
     """
-    Calls Google Gemini API (using google-genai client) to generate a weather report in the selected style.
+    Builds the Gemini prompt for a weather report in the selected style.
+    time_period and now (an aware datetime in the city's timezone) default to the current
+    period and time; the batch pre-generator sets them to write reports ahead of time.
     """
-
-    GEMINI_API_KEY = os.environ.get("GEMINI_API_KEY")
-    if not GEMINI_API_KEY:
-        return "[Error: GEMINI_API_KEY not set in environment.]"
-	
-    GEMINI_API_MODEL = os.environ.get("GEMINI_API_MODEL", "gemini-2.5-flash-lite")
-
     from datetime import datetime, timedelta
     import zoneinfo
 
-    weather_json = json.dumps(weather, indent=2)
-
     # always use the locations local time, not the user's local time.
     tz = zoneinfo.ZoneInfo(weather["timezone"])
-    now = datetime.now(tz)
+    if now is None:
+        now = datetime.now(tz)
+    if time_period is None:
+        time_period = get_time_period_from_json(weather)
     local_date = now.strftime("%Y-%m-%d, %A")
+    # only the hours this period's rules talk about, as a compact table
+    weather_table = build_weather_table(weather, time_period, now)
     tomorrow_date = (now + timedelta(days=1)).strftime("%Y-%m-%d, %A")
 
     # only include relevant style instructions
@@ -170,7 +220,7 @@ def call_llm_api(city, weather, style):
     - timezone: {tz}
     - local_date: {local_date}
     - tomorrow_date: {tomorrow_date}
-    - current_time_of_day: {get_time_period_from_json(weather)}
+    - current_time_of_day: {time_period}
 
     Hard rules (must follow):
     - If current_time_of_day in ["evening","night"]: 
@@ -180,10 +230,10 @@ def call_llm_api(city, weather, style):
     - If current_time_of_day == "morning": focus on the rest of today 08:00–22:00.
     - If current_time_of_day == "midday": ≤1 sentence about the morning, then the rest of today until 22:00.
     - Do not open with current conditions unless it's morning.
-    - Do not invent data not present in JSON.
+    - Do not invent data not present in the weather data.
 
-    Weather JSON:
-    {weather_json}
+    Weather data (local time):
+{weather_table}
 
     STYLE:
     - Always write in the requested style: {style}.
@@ -212,8 +262,37 @@ def call_llm_api(city, weather, style):
     - Ensure the output is lively, readable, and consistent every time.
     """
 
+    record_prompt(prompt)
+    return prompt
+
+_genai_clients = {}  # {api_key: genai.Client}
+_genai_client_lock = threading.Lock()
+
+def get_genai_client(api_key):
+    """
+    Returns one genai.Client per process instead of building one (and its HTTP pool) per call.
+    """
+    with _genai_client_lock:
+        client = _genai_clients.get(api_key)
+        if client is None:
+            client = _genai_clients[api_key] = genai.Client(api_key=api_key)
+        return client
+
+def call_llm_api(city, weather, style, time_period=None, now=None):
+    """
+    Calls Google Gemini API (using google-genai client) to generate a weather report in the selected style.
+    """
+
+    GEMINI_API_KEY = os.environ.get("GEMINI_API_KEY")
+    if not GEMINI_API_KEY:
+        return "[Error: GEMINI_API_KEY not set in environment.]"
+	
+    GEMINI_API_MODEL = os.environ.get("GEMINI_API_MODEL", "gemini-2.5-flash-lite")
+
+    prompt = build_llm_prompt(city, weather, style, time_period, now)
+
     try:
-        client = genai.Client(api_key=GEMINI_API_KEY)
+        client = get_genai_client(GEMINI_API_KEY)
         response = client.models.generate_content(
             model=GEMINI_API_MODEL,
             contents=prompt
@@ -230,46 +309,34 @@ def call_llm_api(city, weather, style):
     except Exception as e:
         return f"[Gemini API exception]: {e}"
 
-
-def beaufort_scale(windspeed):
+class LLMError(Exception):
     """
-    Convert wind speed in km/h to Beaufort scale.
+    Raised by stream_llm_api when no complete report could be generated.
     """
-    if windspeed < 1:
-        return 0  # Calm
-    elif windspeed < 6:
-        return 1  # Light air
-    elif windspeed < 12:
-        return 2  # Light breeze
-    elif windspeed < 20:
-        return 3  # Gentle breeze
-    elif windspeed < 29:
-        return 4  # Moderate breeze
-    elif windspeed < 39:
-        return 5  # Fresh breeze
-    elif windspeed < 50:
-        return 6  # Strong breeze
-    elif windspeed < 62:
-        return 7  # High wind
-    elif windspeed < 75:
-        return 8  # Gale
-    elif windspeed < 89:
-        return 9  # Strong gale
-    elif windspeed < 103:
-        return 10  # Storm
-    elif windspeed < 118:
-        return 11  # Violent storm
-    else:
-        return 12  # Hurricane
-    
-def wind_direction_cardinal(degree):
+
+def stream_llm_api(city, weather, style, time_period=None, now=None):
     """
-    Convert wind direction in degrees to the closest cardinal direction (e.g. N, NNE, NE, etc.).
-    0°/360° is North, 90° is East, 180° is South, 270° is West.
+    Like call_llm_api, but yields the report text in chunks as Gemini produces them.
+    Raises LLMError if the report can't be generated, also after some chunks were
+    yielded, so a partial report is never mistaken for a whole one.
     """
-    directions = [
-        'N', 'NNE', 'NE', 'ENE', 'E', 'ESE', 'SE', 'SSE',
-        'S', 'SSW', 'SW', 'WSW', 'W', 'WNW', 'NW', 'NNW'
-    ]
-    idx = int((degree % 360) / 22.5 + 0.5) % 16
-    return directions[idx]
\ No newline at end of file
+
+    GEMINI_API_KEY = os.environ.get("GEMINI_API_KEY")
+    if not GEMINI_API_KEY:
+        raise LLMError("GEMINI_API_KEY not set in environment.")
+
+    GEMINI_API_MODEL = os.environ.get("GEMINI_API_MODEL", "gemini-2.5-flash-lite")
+
+    prompt = build_llm_prompt(city, weather, style, time_period, now)
+
+    try:
+        client = get_genai_client(GEMINI_API_KEY)
+        for chunk in client.models.generate_content_stream(
+            model=GEMINI_API_MODEL,
+            contents=prompt
+        ):
+            text = getattr(chunk, 'text', None)
+            if text:
+                yield text
+    except Exception as e:
+        raise LLMError(f"Gemini API exception: {e}") from e
@@ -0,0 +1,324 @@
+"""
+hourly_forecast.py
+
+Columnar, array-backed storage for open-meteo hourly data.
+
+open-meteo sends hourly data as parallel arrays. Turning them into one dict
+per hour repeats every key 48 times and boxes every number. HourlyForecast
+keeps the columns as typed arrays instead:
+- slicing returns a view on the same arrays, nothing is copied
+- rows for the templates are small __slots__ objects, created on demand
+- to_bytes() gives a compact binary form for caches
+
+For code that still expects the open-meteo dict, forecast["temperature_2m"],
+.get() and .keys() return the columns as lists, and to_dict() rebuilds the
+original shape.
+"""
+
+import math
+import struct
+from array import array
+from datetime import datetime, timedelta, timezone
+
+from weather_helper import beaufort_batch, cardinal_batch, icon_batch
+
+# open-meteo column -> (array typecode, stand-in for a missing value)
+COLUMNS = {
+    "temperature_2m": ("d", math.nan),
+    "wind_speed_10m": ("d", math.nan),
+    "wind_direction_10m": ("h", -1),
+    "weather_code": ("h", -1),
+    "is_day": ("b", -1),
+}
+
+# per-hour lists in derived()
+DERIVED = ("time", "beaufort", "cardinal", "icon", *COLUMNS)
+
+# local_times are seconds since this naive epoch
+EPOCH = datetime(1970, 1, 1)
+# "THH:00" for each hour of the day
+HOUR_SUFFIXES = [f"T{hour:02d}:00" for hour in range(24)]
+
+# version, tz name length, number of hours
+HEADER = struct.Struct("<BHI")
+FORMAT_VERSION = 1
+
+
+def _missing(value, missing):
+    if isinstance(missing, float):
+        return value is None or math.isnan(value)
+    return value == missing
+
+
+class HourlyForecast:
+    __slots__ = ("timezone", "epochs", "local_times", "columns", "_start", "_stop", "_derived")
+
+    def __init__(self, timezone_str, epochs, local_times, columns, start=0, stop=None, derived=None):
+        """
+        - epochs: array('q') of real epoch seconds for each hour
+        - local_times: array('q') of wall-clock seconds (local time read as if it were UTC),
+          used to format "YYYY-MM-DDTHH:MM" without a timezone lookup
+        - columns: {open-meteo name: array}
+        - derived: one-item list holding the current derived() dict, shared between a forecast
+          and its slices
+        """
+        self.timezone = timezone_str
+        self.epochs = epochs
+        self.local_times = local_times
+        self.columns = columns
+        self._start = start
+        self._stop = len(epochs) if stop is None else stop
+        self._derived = derived if derived is not None else [{}]
+
+    @classmethod
+    def from_openmeteo(cls, hourly, tz):
+        """
+        Builds a forecast from open-meteo's {"time": [...], "temperature_2m": [...], ...}.
+        tz is the ZoneInfo the times are in.
+        """
+        times = hourly.get("time", [])
+        local_times = array("q")
+        epochs = array("q")
+        if times:
+            first = datetime.fromisoformat(times[0])
+            last = datetime.fromisoformat(times[-1])
+            first_local = int(first.replace(tzinfo=timezone.utc).timestamp())
+            span = (len(times) - 1) * 3600
+            consecutive = int(last.replace(tzinfo=timezone.utc).timestamp()) - first_local == span
+            if consecutive:
+                # consecutive hours, only the first and last need parsing
+                local_times = array("q", range(first_local, first_local + span + 1, 3600))
+            else:
+                local_times = array("q", (int(datetime.fromisoformat(t).replace(tzinfo=timezone.utc).timestamp()) for t in times))
+
+            first_offset = first.replace(tzinfo=tz).utcoffset()
+            if first_offset == last.replace(tzinfo=tz).utcoffset():
+                # no DST change inside the forecast, one offset for all hours
+                offset = int(first_offset.total_seconds())
+                if consecutive:
+                    epochs = array("q", range(first_local - offset, first_local - offset + span + 1, 3600))
+                else:
+                    epochs = array("q", (t - offset for t in local_times))
+            else:
+                epochs = array("q", (int(datetime.fromisoformat(t).replace(tzinfo=tz).timestamp()) for t in times))
+
+        columns = {}
+        for name, (typecode, missing) in COLUMNS.items():
+            values = hourly.get(name)
+            if values is not None:
+                try:
+                    columns[name] = array(typecode, values)
+                except TypeError:
+                    # nulls, at the end of the forecast horizon
+                    columns[name] = array(typecode, (missing if v is None else v for v in values))
+        return cls(getattr(tz, "key", str(tz)), epochs, local_times, columns)
+
+    def __len__(self):
+        return self._stop - self._start
+
+    def __iter__(self):
+        derived = self.derived()
+        for i in range(self._start, self._stop):
+            yield HourlyRow(self, i, derived)
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            start, stop, step = key.indices(len(self))
+            if step != 1:
+                raise ValueError("HourlyForecast slices must be contiguous")
+            return HourlyForecast(self.timezone, self.epochs, self.local_times, self.columns,
+                                  self._start + start, self._start + max(start, stop), self._derived)
+        if isinstance(key, int):
+            if key < 0:
+                key += len(self)
+            if not 0 <= key < len(self):
+                raise IndexError(key)
+            return HourlyRow(self, self._start + key, self.derived())
+        # open-meteo dict compatibility
+        if key == "time":
+            return [self.format_time(i) for i in range(self._start, self._stop)]
+        if key in self.columns:
+            missing = COLUMNS[key][1]
+            return [None if _missing(v, missing) else v for v in self.columns[key][self._start:self._stop]]
+        raise KeyError(key)
+
+    def __bool__(self):
+        return len(self) > 0
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def keys(self):
+        return ["time"] + list(self.columns)
+
+    def to_dict(self):
+        return {key: self[key] for key in self.keys()}
+
+    def format_time(self, i):
+        return (EPOCH + timedelta(seconds=self.local_times[i])).isoformat(timespec="minutes")
+
+    def _format_times(self, start, stop):
+        # format_time() for a range: the date part once per day, the time part with arithmetic
+        dates = {}
+        formatted = []
+        for seconds in self.local_times[start:stop]:
+            day, seconds = divmod(seconds, 86400)
+            date = dates.get(day)
+            if date is None:
+                date = dates[day] = (EPOCH + timedelta(days=day)).date().isoformat()
+            hour, rest = divmod(seconds, 3600)
+            formatted.append(date + (HOUR_SUFFIXES[hour] if not rest else f"T{hour:02d}:{rest // 60:02d}"))
+        return formatted
+
+    def derived(self):
+        """
+        Formatted time, Beaufort number, cardinal direction, icon and each column's value (None
+        where it is missing) per hour, indexed like the columns. Only the hours of this view are
+        computed, once: the lists are shared with the forecast and all its slices, and later
+        views only compute the hours not done yet.
+
+        Cached forecasts are rendered by several threads at once, so a published dict is never
+        changed: new hours go into copies, which replace it together with their range.
+        """
+        current = self._derived[0]
+        lo, hi = current.get("range", (0, 0))
+        start, stop = self._start, self._stop
+        if lo <= start and stop <= hi or start >= stop:
+            return current
+        n = len(self.epochs)
+        derived = {name: list(current[name]) if current else [None] * n for name in DERIVED}
+        # the missing hours before and after the computed range; a gap is filled too
+        missing = [(start, stop)] if lo >= hi else [span for span in ((start, lo), (hi, stop)) if span[0] < span[1]]
+        winds = self.columns.get("wind_speed_10m")
+        directions = self.columns.get("wind_direction_10m")
+        codes = self.columns.get("weather_code")
+        is_day = self.columns.get("is_day")
+        for a, b in missing:
+            derived["time"][a:b] = self._format_times(a, b)
+            if winds is not None:
+                derived["beaufort"][a:b] = beaufort_batch(winds[a:b])
+            if directions is not None:
+                derived["cardinal"][a:b] = cardinal_batch(directions[a:b])
+            if codes is not None:
+                derived["icon"][a:b] = icon_batch(codes[a:b], is_day[a:b] if is_day is not None else None)
+            for name, values in self.columns.items():
+                missing_value = COLUMNS[name][1]
+                # NaN is the only value that is not equal to itself
+                derived[name][a:b] = [None if v == missing_value or v != v else v for v in values[a:b]]
+        derived["range"] = (min(lo, start) if lo < hi else start, max(hi, stop))
+        # one assignment, a concurrent render sees either the old lists or all of the new ones
+        self._derived[0] = derived
+        return derived
+
+    def to_bytes(self):
+        """
+        Compact binary form: a small header, the timezone name, then each array's raw bytes.
+        """
+        tz = self.timezone.encode("utf-8")
+        n = len(self)
+        parts = [HEADER.pack(FORMAT_VERSION, len(tz), n), tz,
+                 self.epochs[self._start:self._stop].tobytes(), self.local_times[self._start:self._stop].tobytes()]
+        names = ",".join(self.columns).encode("utf-8")
+        parts.append(struct.pack("<H", len(names)) + names)
+        for values in self.columns.values():
+            parts.append(values[self._start:self._stop].tobytes())
+        return b"".join(parts)
+
+    @classmethod
+    def from_bytes(cls, data):
+        version, tz_len, n = HEADER.unpack_from(data)
+        if version != FORMAT_VERSION:
+            raise ValueError(f"Unknown HourlyForecast format {version}")
+        pos = HEADER.size
+        tz = data[pos:pos + tz_len].decode("utf-8")
+        pos += tz_len
+
+        def take(typecode):
+            nonlocal pos
+            values = array(typecode)
+            size = values.itemsize * n
+            values.frombytes(data[pos:pos + size])
+            pos += size
+            return values
+
+        epochs = take("q")
+        local_times = take("q")
+        (names_len,) = struct.unpack_from("<H", data, pos)
+        pos += 2
+        names = data[pos:pos + names_len].decode("utf-8").split(",") if names_len else []
+        pos += names_len
+        columns = {name: take(COLUMNS[name][0]) for name in names}
+        return cls(tz, epochs, local_times, columns)
+
+
+class HourlyRow:
+    """
+    Read-only view of one hour, with the attribute names the templates use.
+    """
+    __slots__ = ("_forecast", "_i", "_derived")
+
+    def __init__(self, forecast, i, derived):
+        self._forecast = forecast
+        self._i = i
+        # forecast.derived(), looked up once per view instead of on every attribute
+        self._derived = derived
+
+    @property
+    def original_time(self):
+        return self._derived["time"][self._i]
+
+    @property
+    def time(self):
+        return self._derived["time"][self._i][11:]
+
+    @property
+    def epoch(self):
+        return self._forecast.epochs[self._i]
+
+    @property
+    def temperature(self):
+        return self._derived["temperature_2m"][self._i]
+
+    @property
+    def windspeed(self):
+        return self._derived["wind_speed_10m"][self._i]
+
+    @property
+    def winddirection(self):
+        return self._derived["wind_direction_10m"][self._i]
+
+    @property
+    def weather_code(self):
+        return self._derived["weather_code"][self._i]
+
+    @property
+    def is_day(self):
+        return self._derived["is_day"][self._i]
+
+    @property
+    def beaufort(self):
+        return self._derived["beaufort"][self._i]
+
+    @property
+    def cardinal(self):
+        return self._derived["cardinal"][self._i]
+
+    @property
+    def icon(self):
+        return self._derived["icon"][self._i]
+
+    def as_dict(self):
+        return {
+            "original_time": self.original_time,
+            "time": self.time,
+            "temperature": self.temperature,
+            "windspeed": self.windspeed,
+            "beaufort": self.beaufort,
+            "winddirection": self.winddirection,
+            "cardinal": self.cardinal,
+            "weather_code": self.weather_code,
+            "icon": self.icon,
+        }
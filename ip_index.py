@@ -0,0 +1,131 @@
+"""
+ip_index.py
+
+Offline IP range -> location index, used before falling back to ip-api.com.
+
+The dataset is a CSV (optionally gzipped) with a header row:
+
+    start_ip,end_ip,city,country,lat,lon,timezone
+
+start_ip/end_ip are inclusive and may be dotted/colon notation or plain integers.
+timezone may be empty. Ranges must not overlap.
+
+IPv4 ranges live in two typed arrays (starts, ends) plus an array of indexes
+into a deduplicated list of locations. A lookup is a single bisect.
+IPv6 ranges are kept in plain lists, since array has no 128-bit type.
+
+Set IP_INDEX_CSV to the dataset path to enable it.
+"""
+
+import csv
+import gzip
+import ipaddress
+import os
+import sys
+import time
+from array import array
+from bisect import bisect_right
+
+IP_INDEX_CSV = os.environ.get("IP_INDEX_CSV")
+
+# 'I' is 32 bits on every platform we care about, 'L' is the fallback
+IPV4_TYPECODE = "I" if array("I").itemsize >= 4 else "L"
+
+
+def ip_to_int(value):
+    value = value.strip()
+    if value.isdigit():
+        return int(value)
+    return int(ipaddress.ip_address(value))
+
+
+class IPRangeIndex:
+    def __init__(self):
+        self.locations = []  # [(city, country, lat, lon, timezone)]
+        self._v4_starts = array(IPV4_TYPECODE)
+        self._v4_ends = array(IPV4_TYPECODE)
+        self._v4_locs = array("I")
+        self._v6_starts = []
+        self._v6_ends = []
+        self._v6_locs = array("I")
+
+    def __len__(self):
+        return len(self._v4_starts) + len(self._v6_starts)
+
+    @classmethod
+    def from_csv(cls, path):
+        index = cls()
+        opener = gzip.open if path.endswith(".gz") else open
+        location_ids = {}
+        v4, v6 = [], []
+        with opener(path, "rt", encoding="utf-8", newline="") as f:
+            for row in csv.DictReader(f):
+                start = ip_to_int(row["start_ip"])
+                end = ip_to_int(row["end_ip"])
+                location = (row["city"], row.get("country", ""), float(row["lat"]), float(row["lon"]), row.get("timezone") or None)
+                loc_id = location_ids.get(location)
+                if loc_id is None:
+                    loc_id = location_ids[location] = len(index.locations)
+                    index.locations.append(location)
+                # plain integers below 2**32 are treated as IPv4
+                is_v6 = ":" in row["start_ip"] or end > 0xFFFFFFFF
+                (v6 if is_v6 else v4).append((start, end, loc_id))
+
+        v4.sort()
+        v6.sort()
+        for start, end, loc_id in v4:
+            index._v4_starts.append(start)
+            index._v4_ends.append(end)
+            index._v4_locs.append(loc_id)
+        for start, end, loc_id in v6:
+            index._v6_starts.append(start)
+            index._v6_ends.append(end)
+            index._v6_locs.append(loc_id)
+        return index
+
+    def lookup(self, ip):
+        """
+        Returns an ip-api.com shaped dict for ip, or None if no range contains it.
+        """
+        try:
+            addr = ipaddress.ip_address((ip or "").split(",")[0].strip())
+        except ValueError:
+            return None
+        if addr.version == 4:
+            starts, ends, locs = self._v4_starts, self._v4_ends, self._v4_locs
+        else:
+            starts, ends, locs = self._v6_starts, self._v6_ends, self._v6_locs
+
+        value = int(addr)
+        i = bisect_right(starts, value) - 1
+        if i < 0 or value > ends[i]:
+            return None
+
+        city, country, lat, lon, tz = self.locations[locs[i]]
+        location = {"status": "success", "city": city, "country": country, "lat": lat, "lon": lon, "query": str(addr), "source": "local"}
+        if tz:
+            location["timezone"] = tz
+        return location
+
+
+def load_index(path=IP_INDEX_CSV):
+    if not path:
+        return None
+    if not os.path.exists(path):
+        print(f"[ip_index] {path} not found, using ip-api.com only")
+        return None
+    return IPRangeIndex.from_csv(path)
+
+
+ip_index = load_index()
+
+
+if __name__ == "__main__":
+    # Usage: python ip_index.py <dataset.csv> <ip> [<ip> ...]
+    start = time.perf_counter()
+    index = IPRangeIndex.from_csv(sys.argv[1])
+    print(f"Loaded {len(index)} ranges, {len(index.locations)} locations in {time.perf_counter() - start:.2f}s")
+    for ip in sys.argv[2:]:
+        start = time.perf_counter()
+        result = index.lookup(ip)
+        print(f"{ip}: {result} ({(time.perf_counter() - start) * 1e6:.1f} µs)")
@@ -0,0 +1,309 @@
+"""
+migrations.py
+
+Versioned, in-place schema migrations for weather.db.
+
+Each migration has a version number and runs once; applied versions are
+recorded in the `schema_version` table. All pending migrations run in a
+single IMMEDIATE transaction, so a failed migration leaves the database as
+it was, and several workers starting at once apply them only once.
+
+Usage:
+    python migrations.py            # apply pending migrations, then check the query plans
+    python migrations.py --check    # only check that the hot queries use an index
+"""
+
+import sys
+import time
+
+import snapshots
+from db import connect
+
+# The schema db_init.py used to create from scratch
+INITIAL_SCHEMA = [
+    '''
+    CREATE TABLE IF NOT EXISTS cities (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT UNIQUE NOT NULL,
+        slug TEXT UNIQUE NOT NULL,
+        timezone TEXT NOT NULL,
+        lat REAL NOT NULL,
+        lon REAL NOT NULL
+    )''',
+    '''
+    CREATE TABLE IF NOT EXISTS styles (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT UNIQUE NOT NULL,
+        position INTEGER NOT NULL
+    )''',
+    '''
+    CREATE TABLE IF NOT EXISTS weather_reports (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER,
+        city_id INTEGER NOT NULL,
+        style_id INTEGER NOT NULL,
+        time_period TEXT NOT NULL,
+        date TEXT NOT NULL,
+        weather_json TEXT NOT NULL,
+        report_text TEXT NOT NULL,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY(user_id) REFERENCES users(id),
+        FOREIGN KEY(city_id) REFERENCES cities(id),
+        FOREIGN KEY(style_id) REFERENCES styles(id),
+        UNIQUE(city_id, style_id, time_period, date)
+    )''',
+    '''
+    CREATE TABLE IF NOT EXISTS users (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        username TEXT UNIQUE NOT NULL,
+        password_hash TEXT NOT NULL,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+    )''',
+]
+
+# The old UNIQUE(city_id, style_id, time_period, date) made a user's report collide with the
+# shared one. SQLite treats NULLs as distinct, so adding user_id to that constraint would stop
+# shared reports (user_id NULL) from being unique at all; instead there is one partial unique
+# index for shared reports and one for user reports. Their column order follows the lookups in
+# app.py and pregenerate.py, which filter on city, date and period and then maybe style.
+#
+# They are deliberately not covering indexes. The hot lookups select report_text, a few KB of
+# HTML per report: adding it would store every report twice and leave only a handful of entries
+# per index page. A lookup returns at most one row per style, so going back to the table costs
+# one rowid search per row. snapshot_id is only read by the archive job, not by the hot lookups.
+# The narrow lookups (MAX(id), style_id) are answered from the index columns.
+REPORT_INDEXES = [
+    '''
+    CREATE UNIQUE INDEX idx_weather_reports_shared
+    ON weather_reports (city_id, date, time_period, style_id) WHERE user_id IS NULL
+    ''',
+    # also covers the MAX(id) lookup in /generate_report, id is part of every index
+    '''
+    CREATE UNIQUE INDEX idx_weather_reports_user
+    ON weather_reports (user_id, city_id, date, time_period, style_id) WHERE user_id IS NOT NULL
+    ''',
+]
+
+USER_SPECIFIC_REPORTS = [
+    '''
+    CREATE TABLE weather_reports_new (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER,
+        city_id INTEGER NOT NULL,
+        style_id INTEGER NOT NULL,
+        time_period TEXT NOT NULL,
+        date TEXT NOT NULL,
+        weather_json TEXT NOT NULL,
+        report_text TEXT NOT NULL,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY(user_id) REFERENCES users(id),
+        FOREIGN KEY(city_id) REFERENCES cities(id),
+        FOREIGN KEY(style_id) REFERENCES styles(id)
+    )''',
+    '''
+    INSERT INTO weather_reports_new (id, user_id, city_id, style_id, time_period, date, weather_json, report_text, created_at)
+    SELECT id, user_id, city_id, style_id, time_period, date, weather_json, report_text, created_at FROM weather_reports
+    ''',
+    'DROP TABLE weather_reports',
+    'ALTER TABLE weather_reports_new RENAME TO weather_reports',
+] + REPORT_INDEXES
+
+# Tables singleflight.py and geo_cache.py used to create on first use
+CACHE_TABLES = [
+    '''
+    CREATE TABLE IF NOT EXISTS leases (
+        key TEXT PRIMARY KEY,
+        owner TEXT NOT NULL,
+        expires_at REAL NOT NULL
+    )''',
+    '''
+    CREATE TABLE IF NOT EXISTS ip_locations (
+        key TEXT PRIMARY KEY,
+        data TEXT NOT NULL,
+        expires_at REAL NOT NULL
+    )''',
+    'CREATE INDEX IF NOT EXISTS idx_ip_locations_expires_at ON ip_locations (expires_at)',
+]
+
+# weather_json held a full copy of the forecast in every report; reports now reference a
+# deduplicated, compressed row in weather_snapshots (see snapshots.py)
+WEATHER_SNAPSHOTS = [
+    '''
+    CREATE TABLE IF NOT EXISTS weather_snapshots (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        hash TEXT UNIQUE NOT NULL,
+        data BLOB NOT NULL,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+    )''',
+    'ALTER TABLE weather_reports ADD COLUMN snapshot_id INTEGER REFERENCES weather_snapshots(id)',
+    snapshots.backfill,
+    '''
+    CREATE TABLE weather_reports_new (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER,
+        city_id INTEGER NOT NULL,
+        style_id INTEGER NOT NULL,
+        time_period TEXT NOT NULL,
+        date TEXT NOT NULL,
+        snapshot_id INTEGER NOT NULL,
+        report_text TEXT NOT NULL,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY(user_id) REFERENCES users(id),
+        FOREIGN KEY(city_id) REFERENCES cities(id),
+        FOREIGN KEY(style_id) REFERENCES styles(id),
+        FOREIGN KEY(snapshot_id) REFERENCES weather_snapshots(id)
+    )''',
+    '''
+    INSERT INTO weather_reports_new (id, user_id, city_id, style_id, time_period, date, snapshot_id, report_text, created_at)
+    SELECT id, user_id, city_id, style_id, time_period, date, snapshot_id, report_text, created_at FROM weather_reports
+    ''',
+    'DROP TABLE weather_reports',
+    'ALTER TABLE weather_reports_new RENAME TO weather_reports',
+] + REPORT_INDEXES
+
+# retention.py archives reports by date
+REPORT_DATE_INDEX = [
+    'CREATE INDEX IF NOT EXISTS idx_weather_reports_date ON weather_reports (date)',
+]
+
+# Bumped whenever cities or styles change, see reference_data.py
+REFERENCE_VERSION = [
+    'CREATE TABLE IF NOT EXISTS reference_version (version INTEGER NOT NULL)',
+    'INSERT INTO reference_version (version) SELECT 1 WHERE NOT EXISTS (SELECT 1 FROM reference_version)',
+]
+
+# city_import.py keeps the most populous place when several share a name
+CITY_DETAILS = [
+    'ALTER TABLE cities ADD COLUMN country TEXT',
+    'ALTER TABLE cities ADD COLUMN population INTEGER',
+]
+
+# (version, description, statements or callables taking the connection)
+MIGRATIONS = [
+    (1, "initial schema", INITIAL_SCHEMA),
+    (2, "user-specific report uniqueness and lookup indexes", USER_SPECIFIC_REPORTS),
+    (3, "lease and ip location tables", CACHE_TABLES),
+    (4, "deduplicated, compressed weather snapshots", WEATHER_SNAPSHOTS),
+    (5, "report date index for retention", REPORT_DATE_INDEX),
+    (6, "reference data version stamp", REFERENCE_VERSION),
+    (7, "city country and population", CITY_DETAILS),
+]
+
+# Queries run on every page view or per generated report, with the indexes their plan must use
+# ("COVERING INDEX name" if it must not touch the table, None for the integer primary key). Keep in
+# sync with app.py, pregenerate.py, geo_cache.py and singleflight.py; check_query_plans() fails if
+# any of them scans a table or searches it some other way.
+SHARED = "idx_weather_reports_shared"
+USER = "idx_weather_reports_user"
+HOT_QUERIES = [
+    ('SELECT * FROM users WHERE username = ?', ["sqlite_autoindex_users_1"]),
+    ('''SELECT report_text FROM weather_reports
+    WHERE user_id IS NULL AND city_id = ? AND style_id = ? AND time_period = ? AND date = ?''', [SHARED]),
+    ('''SELECT style_id, report_text, user_id FROM weather_reports
+    WHERE user_id = ? AND city_id = ? AND date = ? AND time_period = ?
+    UNION ALL
+    SELECT style_id, report_text, user_id FROM weather_reports
+    WHERE user_id IS NULL AND city_id = ? AND date = ? AND time_period = ?''', [USER, SHARED]),
+    ('SELECT MAX(id) FROM weather_reports WHERE user_id = ? AND city_id = ? AND style_id = ? AND time_period = ? AND date = ?',
+     ["COVERING INDEX " + USER]),
+    ('''SELECT report_text FROM weather_reports
+    WHERE user_id = ? AND city_id = ? AND style_id = ? AND time_period = ? AND date = ? AND id > ?''', [USER]),
+    ('DELETE FROM weather_reports WHERE user_id = ? AND city_id = ? AND style_id = ? AND time_period = ? AND date = ?', [USER]),
+    ('''SELECT style_id FROM weather_reports
+    WHERE user_id IS NULL AND city_id = ? AND time_period = ? AND date = ?''', [SHARED]),
+    ('''SELECT report_text, user_id FROM weather_reports
+    WHERE (user_id = ? OR user_id IS NULL) AND city_id = ? AND style_id = ? AND time_period = ? AND date = ?
+    ORDER BY user_id IS NULL LIMIT 1''', [USER, SHARED]),
+    ('SELECT data, expires_at FROM ip_locations WHERE key = ? AND expires_at > ?', ["sqlite_autoindex_ip_locations_1"]),
+    ('DELETE FROM ip_locations WHERE expires_at <= ?', ["idx_ip_locations_expires_at"]),
+    ('SELECT 1 FROM leases WHERE key = ? AND expires_at > ?', ["sqlite_autoindex_leases_1"]),
+    ('SELECT id FROM weather_snapshots WHERE hash = ?', ["COVERING INDEX sqlite_autoindex_weather_snapshots_1"]),
+    ('SELECT data FROM weather_snapshots WHERE id = ?', [None]),
+]
+
+
+def schema_version(conn):
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS schema_version (
+        version INTEGER PRIMARY KEY,
+        description TEXT NOT NULL,
+        applied_at REAL NOT NULL
+    )''')
+    return conn.execute('SELECT MAX(version) FROM schema_version').fetchone()[0] or 0
+
+
+def migrate(conn=None, log=print):
+    """
+    Applies all pending migrations. Returns the schema version afterwards.
+    """
+    own = conn is None
+    if own:
+        conn = connect()
+    # transactions are managed here, not by the sqlite3 module
+    isolation_level = conn.isolation_level
+    conn.isolation_level = None
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            current = schema_version(conn)
+            for version, description, steps in MIGRATIONS:
+                if version <= current:
+                    continue
+                for step in steps:
+                    if callable(step):
+                        step(conn)
+                    else:
+                        conn.execute(step)
+                conn.execute('INSERT INTO schema_version (version, description, applied_at) VALUES (?, ?, ?)',
+                             (version, description, time.time()))
+                log(f"[migrations] applied {version}: {description}")
+                current = version
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        return current
+    finally:
+        conn.isolation_level = isolation_level
+        if own:
+            conn.discard()
+
+
+def query_plan(conn, sql):
+    # EXPLAIN QUERY PLAN needs every parameter bound, the values don't matter
+    return [row[3] for row in conn.execute('EXPLAIN QUERY PLAN ' + sql, [None] * sql.count('?'))]
+
+
+def uses_index(plan, index):
+    if index is None:
+        return any('USING INTEGER PRIMARY KEY' in step for step in plan)
+    # "INDEX name (" also matches "COVERING INDEX name (", but not the other way round
+    return any(f'{index} (' in step for step in plan)
+
+
+def check_query_plans(conn, queries=HOT_QUERIES):
+    """
+    Returns [(sql, plan)] for every query whose plan scans a whole table or doesn't use
+    the indexes listed for it.
+    """
+    failures = []
+    for sql, indexes in queries:
+        plan = query_plan(conn, sql)
+        searches = [step for step in plan if step.startswith(('SCAN ', 'SEARCH '))]
+        if (any(step.startswith('SCAN ') for step in plan)
+                or not all(uses_index(plan, index) for index in indexes)
+                or len(searches) != len(indexes)):
+            failures.append((sql, plan))
+    return failures
+
+
+if __name__ == "__main__":
+    conn = connect()
+    if "--check" not in sys.argv[1:]:
+        print(f"Schema version {migrate(conn)}")
+    failures = check_query_plans(conn)
+    for sql, plan in failures:
+        print(f"Unexpected plan:\n  {' '.join(sql.split())}\n  " + "\n  ".join(plan))
+    print(f"{len(HOT_QUERIES) - len(failures)}/{len(HOT_QUERIES)} hot queries use their intended indexes")
+    conn.discard()
+    sys.exit(1 if failures else 0)
@@ -0,0 +1,115 @@
+"""
+page_cache.py
+
+Cache for rendered responses: the homepage city grid, the city pages seen by
+anonymous visitors and the JSON API's bodies.
+
+Entries are keyed by what the HTML is rendered from (city, style, time period,
+date and hour) and remember the forecast or snapshot object they were rendered
+from. forecast_cache and the warmer replace those objects when new data
+arrives, so an entry is only used while its source is still the current one.
+
+Full pages are encoded and, when large, gzipped once when they are rendered,
+and are served with a strong ETag; a matching If-None-Match gets a 304.
+Pages are marked `private, no-cache` because the navigation bar depends on
+the visitor's session.
+"""
+
+import gzip
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict, namedtuple
+
+from flask import Response, request
+
+PAGE_CACHE_SIZE = int(os.environ.get("PAGE_CACHE_SIZE", 512))
+# Smaller bodies are not worth compressing
+GZIP_MIN_SIZE = 1024
+GZIP_LEVEL = 6
+
+# body: encoded HTML, gzipped: its gzip encoding or None, etag: hash of body
+RenderedPage = namedtuple("RenderedPage", ["body", "gzipped", "etag"])
+
+
+def render_page(html, compress=True):
+    """
+    Encodes a rendered page once: body, optional gzip body and ETag.
+    """
+    body = html.encode("utf-8")
+    gzipped = gzip.compress(body, GZIP_LEVEL) if compress and len(body) >= GZIP_MIN_SIZE else None
+    return RenderedPage(body=body, gzipped=gzipped, etag=hashlib.sha256(body).hexdigest()[:32])
+
+
+def render_json(data, compress=True):
+    """
+    render_page() for a JSON body, without whitespace.
+    """
+    return render_page(json.dumps(data, separators=(",", ":")), compress)
+
+
+def page_response(page, mimetype="text/html"):
+    """
+    Response for a RenderedPage, gzipped if the client accepts it, 304 if its ETag matches.
+    """
+    use_gzip = page.gzipped is not None and request.accept_encodings["gzip"] > 0
+    resp = Response(page.gzipped if use_gzip else page.body, mimetype=mimetype)
+    # each encoding is a different representation, so gets its own strong ETag
+    if use_gzip:
+        resp.headers["Content-Encoding"] = "gzip"
+        resp.set_etag(page.etag + "-gz")
+    else:
+        resp.set_etag(page.etag)
+    resp.vary.add("Accept-Encoding")
+    resp.vary.add("Cookie")
+    resp.headers["Cache-Control"] = "private, no-cache"
+    return resp.make_conditional(request)
+
+
+class PageCache:
+    """
+    Thread-safe LRU of {key: value}, each value valid only while its source object is current.
+    """
+
+    def __init__(self, maxsize=PAGE_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()  # {key: (source, value)}
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0}
+
+    def get(self, key, source):
+        with self._lock:
+            entry = self._entries.get(key)
+            # identity, not equality: a new forecast is a new object
+            if entry is not None and entry[0] is source:
+                self._entries.move_to_end(key)
+                self._stats["hits"] += 1
+                return entry[1]
+            self._stats["misses"] += 1
+            return None
+
+    def put(self, key, source, value):
+        with self._lock:
+            self._entries[key] = (source, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def get_or_render(self, key, source, render):
+        value = self.get(key, source)
+        if value is None:
+            value = render()
+            self.put(key, source, value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, size=len(self._entries))
+
+
+page_cache = PageCache()
@@ -0,0 +1,233 @@
+"""
+pregenerate.py
+
+Generates the shared weather reports ahead of each time period, so the first
+visitor of a period does not have to wait for Gemini.
+
+Periods start at fixed local hours (see helpers.TIME_PERIOD_STARTS). Shortly
+before a city's next period starts, a report is written for each configured
+style and stored in `weather_reports` with user_id NULL. A pool of worker
+threads does the work, under a shared requests-per-minute limit.
+
+Usage:
+    python pregenerate.py                  # periods starting within the next --lead minutes
+    python pregenerate.py --current        # fill in missing reports for the current period
+    python pregenerate.py --dry-run        # use a stub LLM and write nothing
+    python pregenerate.py --styles all --workers 8 --rate 60
+
+The app can also run this on a schedule, set PREGENERATE_ENABLED=1.
+"""
+
+import argparse
+import os
+import threading
+import time
+import zoneinfo
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta
+
+from helpers import get_db, get_weather, call_llm_api, get_time_period_for_hour, TIME_PERIOD_STARTS
+from snapshots import store_snapshot
+
+# Comma-separated style names, or "all". Default: the first style only, which is the one guests see
+PREGENERATE_STYLES = os.environ.get("PREGENERATE_STYLES", "")
+PREGENERATE_LEAD_MINUTES = int(os.environ.get("PREGENERATE_LEAD_MINUTES", 15))
+PREGENERATE_WORKERS = int(os.environ.get("PREGENERATE_WORKERS", 4))
+# LLM requests per minute across all workers
+PREGENERATE_RATE = float(os.environ.get("PREGENERATE_RATE", 30))
+PREGENERATE_INTERVAL = 60
+
+
+def next_period_start(now):
+    """
+    Returns (start, period) of the first period that starts after now (an aware datetime).
+    """
+    for hour, period in TIME_PERIOD_STARTS:
+        start = now.replace(hour=hour, minute=0, second=0, microsecond=0)
+        if start > now:
+            return start, period
+    # next morning
+    start = (now + timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+    return start, TIME_PERIOD_STARTS[0][1]
+
+
+def stub_llm(city, weather, style, time_period=None, now=None):
+    """
+    Stand-in for call_llm_api used by --dry-run.
+    """
+    time.sleep(0.05)
+    return f"<h1>{city}, {now:%Y-%m-%d}</h1><p>Stub {style} report for the {time_period}.</p>"
+
+
+class RateLimiter:
+    """
+    Spaces calls evenly so that no more than per_minute start in any minute.
+    """
+
+    def __init__(self, per_minute):
+        self.interval = 60.0 / per_minute if per_minute > 0 else 0
+        self._next = time.monotonic()
+        self._lock = threading.Lock()
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next)
+            self._next = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+def load_catalog(conn, style_names=PREGENERATE_STYLES):
+    c = conn.cursor()
+    c.execute('SELECT id, name, lat, lon, timezone FROM cities ORDER BY name')
+    cities = [dict(id=row[0], name=row[1], lat=row[2], lon=row[3], timezone=row[4]) for row in c.fetchall()]
+    c.execute('SELECT id, name, position FROM styles ORDER BY position ASC')
+    styles = [dict(id=row[0], name=row[1], position=row[2]) for row in c.fetchall()]
+    if style_names == "all":
+        return cities, styles
+    if style_names:
+        wanted = {name.strip() for name in style_names.split(",")}
+        return cities, [s for s in styles if s["name"] in wanted]
+    return cities, styles[:1]
+
+
+def find_jobs(conn, cities, styles, lead_minutes=PREGENERATE_LEAD_MINUTES, current=False):
+    """
+    Returns the (city, style, time_period, date, now) jobs that have no shared report yet.
+    With current=True the jobs are for the period that is running now, otherwise for
+    periods that start within lead_minutes. now is the time the report is written for.
+    """
+    jobs = []
+    c = conn.cursor()
+    for city in cities:
+        local_now = datetime.now(zoneinfo.ZoneInfo(city["timezone"]))
+        if current:
+            report_time, period = local_now, get_time_period_for_hour(local_now.hour)
+        else:
+            report_time, period = next_period_start(local_now)
+            if report_time - local_now > timedelta(minutes=lead_minutes):
+                continue
+        date = report_time.strftime("%Y-%m-%d")
+        c.execute('''SELECT style_id FROM weather_reports
+                    WHERE user_id IS NULL AND city_id = ? AND time_period = ? AND date = ?''',
+                  (city["id"], period, date))
+        existing = {row[0] for row in c.fetchall()}
+        for style in styles:
+            if style["id"] not in existing:
+                jobs.append((city, style, period, date, report_time))
+    return jobs
+
+
+def generate_one(job, llm, limiter):
+    city, style, period, date, report_time = job
+    start = time.perf_counter()
+    weather = get_weather(city, city["timezone"])
+    if not weather:
+        return job, None, None, time.perf_counter() - start
+    limiter.wait()
+    report = llm(city["name"], weather, style["name"], time_period=period, now=report_time)
+    return job, weather, report, time.perf_counter() - start
+
+
+def run_batch(jobs, workers=PREGENERATE_WORKERS, rate=PREGENERATE_RATE, dry_run=False, log=print):
+    """
+    Generates and stores a report for every job. Returns (stored, failed).
+    """
+    if not jobs:
+        return 0, 0
+    llm = stub_llm if dry_run else call_llm_api
+    limiter = RateLimiter(rate)
+    stored = failed = 0
+    started = time.perf_counter()
+
+    conn = None if dry_run else get_db()
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(generate_one, job, llm, limiter) for job in jobs]
+            for done, future in enumerate(as_completed(futures), start=1):
+                try:
+                    (city, style, period, date, _), weather, report, elapsed = future.result()
+                except Exception as e:
+                    failed += 1
+                    log(f"[{done}/{len(jobs)}] failed: {e}")
+                    continue
+
+                # call_llm_api reports errors in-band, don't cache those
+                if not report or report.startswith("["):
+                    failed += 1
+                    log(f"[{done}/{len(jobs)}] {city['name']} / {style['name']} / {period} {date} failed: {report or 'no weather data'}")
+                    continue
+
+                if conn is not None:
+                    conn.execute('''INSERT OR IGNORE INTO weather_reports (city_id, style_id, time_period, date, snapshot_id, report_text)
+                                VALUES (?, ?, ?, ?, ?, ?)''',
+                                 (city["id"], style["id"], period, date, store_snapshot(conn, weather), report))
+                    conn.commit()
+                stored += 1
+                log(f"[{done}/{len(jobs)}] {city['name']} / {style['name']} / {period} {date} ok ({elapsed:.1f}s)")
+    finally:
+        if conn is not None:
+            conn.close()
+
+    log(f"Done: {stored} {'generated' if dry_run else 'stored'}, {failed} failed in {time.perf_counter() - started:.1f}s")
+    return stored, failed
+
+
+def pregenerate(current=False, lead_minutes=PREGENERATE_LEAD_MINUTES, style_names=PREGENERATE_STYLES,
+                workers=PREGENERATE_WORKERS, rate=PREGENERATE_RATE, dry_run=False, log=print):
+    conn = get_db()
+    try:
+        cities, styles = load_catalog(conn, style_names)
+        jobs = find_jobs(conn, cities, styles, lead_minutes, current)
+    finally:
+        conn.close()
+    if jobs:
+        log(f"{len(jobs)} reports to generate with {workers} workers at {rate:g}/min" + (" (dry run)" if dry_run else ""))
+    return run_batch(jobs, workers, rate, dry_run, log)
+
+
+class PregenerateScheduler:
+    """
+    Runs pregenerate() every PREGENERATE_INTERVAL seconds in a background thread.
+    """
+
+    def __init__(self, interval=PREGENERATE_INTERVAL):
+        self.interval = interval
+        self._thread = None
+        self._stop = threading.Event()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                pregenerate(log=lambda msg: print(f"[pregenerate] {msg}"))
+            except Exception as e:
+                print(f"[pregenerate] run failed: {e}")
+            self._stop.wait(self.interval)
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="report-pregenerator", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+
+pregenerate_scheduler = PregenerateScheduler()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pre-generate shared weather reports ahead of each time period.")
+    parser.add_argument("--current", action="store_true", help="generate missing reports for the current period instead of the next one")
+    parser.add_argument("--lead", type=int, default=PREGENERATE_LEAD_MINUTES, help="minutes before a period starts to generate its reports")
+    parser.add_argument("--styles", default=PREGENERATE_STYLES, help='comma-separated style names or "all" (default: first style)')
+    parser.add_argument("--workers", type=int, default=PREGENERATE_WORKERS, help="number of concurrent LLM calls")
+    parser.add_argument("--rate", type=float, default=PREGENERATE_RATE, help="maximum LLM calls per minute")
+    parser.add_argument("--dry-run", action="store_true", help="use a stub LLM and don't write to the database")
+    args = parser.parse_args()
+
+    pregenerate(current=args.current, lead_minutes=args.lead, style_names=args.styles,
+                workers=args.workers, rate=args.rate, dry_run=args.dry_run)
@@ -0,0 +1,121 @@
+"""
+prompt_builder.py
+
+Turns an open-meteo forecast into the compact weather table used in the LLM prompt.
+
+Dumping the whole payload as JSON costs thousands of input tokens: two days
+of hourly arrays, repeated keys, the request url and the indentation. The
+report rules only ever look at part of the day, so only those hours are sent,
+one short line per hour with the weather code already spelled out in words.
+"""
+
+import json
+import sys
+import threading
+from datetime import datetime, timedelta
+
+from weather_helper import cardinal_batch, get_weather_oneword, wind_direction_cardinal as cardinal
+
+# (day offset from the report date, first hour, last hour) of the hours each period's rules talk about
+PERIOD_WINDOWS = {
+    "morning": [(0, 6, 22)],
+    "midday": [(0, 6, 22)],
+    # tonight gets a single sentence, so every third hour is enough
+    "evening": [(0, 18, 23, 3), (1, 6, 22)],
+    "night": [(0, 21, 23, 3), (1, 0, 5, 3), (1, 6, 22)],
+}
+
+# Rough average for English text and tables with Gemini-style tokenizers
+CHARS_PER_TOKEN = 4
+
+prompt_stats = {"prompts": 0, "estimated_tokens": 0}
+_stats_lock = threading.Lock()
+
+
+def estimate_tokens(text):
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def record_prompt(prompt):
+    """
+    Adds a prompt to the running totals and returns its estimated token count.
+    """
+    tokens = estimate_tokens(prompt)
+    with _stats_lock:
+        prompt_stats["prompts"] += 1
+        prompt_stats["estimated_tokens"] += tokens
+    return tokens
+
+
+def select_hours(times, time_period, report_date):
+    """
+    Returns the indexes into the hourly time array that fall in the period's windows.
+    times are open-meteo local "YYYY-MM-DDTHH:MM" strings, so no datetime parsing is needed.
+    """
+    wanted = {}
+    for window in PERIOD_WINDOWS.get(time_period, PERIOD_WINDOWS["morning"]):
+        day_offset, first, last = window[:3]
+        step = window[3] if len(window) > 3 else 1
+        day = (report_date + timedelta(days=day_offset)).strftime("%Y-%m-%d")
+        for hour in range(first, last + 1, step):
+            wanted[f"{day}T{hour:02d}:00"] = True
+
+    return [i for i, t in enumerate(times) if t in wanted]
+
+
+def build_weather_table(weather, time_period, now):
+    """
+    Returns the current conditions and the relevant hours as a small text table:
+
+        2025-06-01 Sunday
+        06:00 14.2C 8km/h SW partly cloudy
+    """
+    lines = []
+    current = weather.get("current")
+    if current:
+        lines.append(
+            f"Now ({current['time'][11:16]}): {current['temperature_2m']}C, "
+            f"wind {current['wind_speed_10m']}km/h {cardinal(current['wind_direction_10m'])}, "
+            f"{current['pressure_msl']}hPa, humidity {current['relative_humidity_2m']}%, "
+            f"{get_weather_oneword(current['weather_code'], current.get('is_day', 1))}"
+        )
+
+    hourly = weather.get("hourly") or {}
+    times = hourly.get("time", [])
+    temps = hourly.get("temperature_2m", [])
+    winds = hourly.get("wind_speed_10m", [])
+    directions = hourly.get("wind_direction_10m", [])
+    codes = hourly.get("weather_code", [])
+    is_day = hourly.get("is_day", [])
+
+    lines.append("Hourly (time temp wind direction weather):")
+    day = None
+    selected = select_hours(times, time_period, now.date())
+    # open-meteo sends null for hours it has no value for, those are written as "?"
+    cardinals = cardinal_batch([directions[i] for i in selected])
+    for i, direction in zip(selected, cardinals):
+        if times[i][:10] != day:
+            day = times[i][:10]
+            lines.append(datetime.strptime(day, "%Y-%m-%d").strftime("%Y-%m-%d %A"))
+        temp = "?" if temps[i] is None else temps[i]
+        wind = "?" if winds[i] is None else round(winds[i])
+        lines.append(
+            f"{times[i][11:16]} {temp}C {wind}km/h {direction or '?'} "
+            f"{get_weather_oneword(codes[i], is_day[i] if i < len(is_day) else 1)}"
+        )
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    # Usage: python prompt_builder.py <forecast.json>
+    # Prints the estimated prompt size per time period, and the old full-JSON payload for comparison.
+    from helpers import build_llm_prompt
+
+    with open(sys.argv[1], encoding="utf-8") as f:
+        weather = json.load(f)
+    now = datetime.fromisoformat(weather["current"]["time"])
+    print(f"full JSON payload alone: ~{estimate_tokens(json.dumps(weather, indent=2))} tokens")
+    for period in PERIOD_WINDOWS:
+        table = build_weather_table(weather, period, now)
+        prompt = build_llm_prompt("City", weather, "Normal Weather Report", period, now)
+        print(f"{period}: table ~{estimate_tokens(table)} tokens, prompt ~{estimate_tokens(prompt)} tokens")
@@ -0,0 +1,157 @@
+"""
+reference_data.py
+
+In-process, read-only copy of the static reference data: cities, styles and
+their timezones.
+
+Cities and styles only change when db_init.py (or an import) rewrites them,
+so the routes look them up in dicts instead of querying SQLite on every
+request. Writers bump the version stamp in `reference_version`; every
+REFERENCE_CHECK_INTERVAL seconds one request reads the stamp and, if it
+changed, a new snapshot is built on the fanout pool. Requests keep using the
+current snapshot until the new one is swapped in, so rebuilding the city
+indexes of a large catalog doesn't hold any of them up.
+"""
+
+import os
+import threading
+import time
+import zoneinfo
+from collections import namedtuple
+from types import MappingProxyType
+
+import fanout
+from city_search import CitySearchIndex
+from db import DB_PATH, get_pool
+from spatial import CityIndex
+
+# Seconds between version stamp checks; the routes do no queries in between
+REFERENCE_CHECK_INTERVAL = float(os.environ.get("REFERENCE_CHECK_INTERVAL", 30))
+
+# cities: tuple of read-only city mappings (id, name, slug, timezone, lat, lon, country, population), ordered by name
+# cities_by_slug, cities_by_id: read-only indexes into cities
+# styles: tuple of read-only style mappings (id, name, position), ordered by position
+# styles_by_id: read-only index into styles
+# style_names: style names ordered by name
+# timezones: {timezone name: ZoneInfo}, one object per distinct timezone
+# city_index: spatial.CityIndex used to snap visitors onto a nearby city
+# search_index: city_search.CitySearchIndex behind /api/cities/search
+ReferenceData = namedtuple("ReferenceData", [
+    "version", "cities", "cities_by_slug", "cities_by_id", "styles", "styles_by_id",
+    "style_names", "timezones", "city_index", "search_index",
+])
+
+
+def read_version(conn):
+    row = conn.execute('SELECT version FROM reference_version').fetchone()
+    return row[0] if row else 0
+
+
+def bump_version(conn):
+    """
+    Marks the reference data as changed. Call it in the transaction that changes cities or styles.
+    """
+    conn.execute('UPDATE reference_version SET version = version + 1')
+
+
+def load_reference_data(conn):
+    version = read_version(conn)
+    timezones = {}
+    cities = []
+    for row in conn.execute('SELECT id, name, slug, timezone, lat, lon, country, population FROM cities ORDER BY name'):
+        if row[3] not in timezones:
+            timezones[row[3]] = zoneinfo.ZoneInfo(row[3])
+        cities.append(MappingProxyType({"id": row[0], "name": row[1], "slug": row[2], "timezone": row[3], "lat": row[4], "lon": row[5],
+                                        "country": row[6], "population": row[7]}))
+    styles = tuple(
+        MappingProxyType({"id": row[0], "name": row[1], "position": row[2]})
+        for row in conn.execute('SELECT id, name, position FROM styles ORDER BY position ASC')
+    )
+    return ReferenceData(
+        version=version,
+        cities=tuple(cities),
+        cities_by_slug=MappingProxyType({city["slug"]: city for city in cities}),
+        cities_by_id=MappingProxyType({city["id"]: city for city in cities}),
+        styles=styles,
+        styles_by_id=MappingProxyType({style["id"]: style for style in styles}),
+        style_names=tuple(sorted(style["name"] for style in styles)),
+        timezones=MappingProxyType(timezones),
+        city_index=CityIndex(cities),
+        search_index=CitySearchIndex(tuple(cities)),
+    )
+
+
+class ReferenceCache:
+    def __init__(self, check_interval=REFERENCE_CHECK_INTERVAL, db_path=DB_PATH):
+        self.check_interval = check_interval
+        self.db_path = db_path
+        self._data = None
+        self._checked_at = 0.0
+        self._reloading = False
+        self._lock = threading.Lock()
+
+    def get(self):
+        """
+        Returns the current ReferenceData. If the version stamp changed, the new snapshot
+        is built in the background and the current one is served until it is swapped in.
+        """
+        data = self._data
+        if data is not None and time.monotonic() - self._checked_at < self.check_interval:
+            return data
+        if data is None:
+            # first use, there is nothing to serve yet
+            with self._lock:
+                if self._data is None:
+                    self.reload()
+                return self._data
+        # one request reads the stamp, the others don't wait for it
+        if not self._lock.acquire(blocking=False):
+            return data
+        try:
+            if time.monotonic() - self._checked_at < self.check_interval:
+                return self._data
+            self._checked_at = time.monotonic()
+            if not self._reloading and self._read_version() != data.version:
+                self._reloading = True
+                fanout.submit(self._reload_in_background)
+        finally:
+            self._lock.release()
+        return data
+
+    def _read_version(self):
+        conn = get_pool(self.db_path).acquire()
+        try:
+            return read_version(conn)
+        finally:
+            conn.close()
+
+    def _reload_in_background(self):
+        try:
+            self.reload()
+        except Exception as e:
+            # the next check retries, the version still differs
+            print(f"[reference_data] reload failed: {e!r}")
+        finally:
+            self._reloading = False
+
+    def reload(self):
+        """
+        Loads a new snapshot and swaps it in. Returns it.
+        """
+        conn = get_pool(self.db_path).acquire()
+        try:
+            data = load_reference_data(conn)
+        finally:
+            conn.close()
+        self._data = data
+        self._checked_at = time.monotonic()
+        return data
+
+    def invalidate(self):
+        """
+        Makes the next get() check the version stamp.
+        """
+        self._checked_at = 0.0
+
+
+reference_data = ReferenceCache()
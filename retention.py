@@ -0,0 +1,229 @@
+"""
+retention.py
+
+Keeps weather_reports to a rolling window of recent days.
+
+Reports older than RETENTION_DAYS are appended to one gzip-compressed JSONL
+file per report date in ARCHIVE_DIR (weather_reports-YYYY-MM-DD.jsonl.gz),
+together with the forecast they were written from, and then deleted.
+Snapshots no report references any more are deleted too. Afterwards the
+freed pages are handed back to the filesystem with PRAGMA incremental_vacuum,
+a bounded number of pages at a time, so the app's writers are never blocked
+for long.
+
+Rows are written to the archive before they are deleted, so a crash in
+between can leave a row in the archive twice but never loses one.
+
+Usage:
+    python retention.py                     # archive and delete reports older than RETENTION_DAYS
+    python retention.py --days 7 --dry-run  # only report what would be archived
+    python retention.py --vacuum            # one-off full VACUUM, enables incremental vacuum on older databases
+
+The app can also run this on a schedule, set RETENTION_ENABLED=1. Every
+worker process runs the schedule, and a lease in weather.db lets only one of
+them run per interval.
+"""
+
+import argparse
+import gzip
+import json
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from itertools import groupby
+
+from db import connect
+from singleflight import report_flight
+from snapshots import decompress
+
+RETENTION_DAYS = int(os.environ.get("RETENTION_DAYS", 30))
+ARCHIVE_DIR = os.environ.get("ARCHIVE_DIR", os.path.join(os.path.dirname(__file__), 'archive'))
+# Rows archived and deleted per transaction
+RETENTION_BATCH = int(os.environ.get("RETENTION_BATCH", 500))
+# Pages freed per incremental_vacuum call, and the pause between calls
+VACUUM_PAGES = int(os.environ.get("VACUUM_PAGES", 1000))
+VACUUM_PAUSE = 0.05
+RETENTION_INTERVAL = int(os.environ.get("RETENTION_INTERVAL", 6 * 3600))
+# Lease that keeps other worker processes from running retention at the same time.
+# It must outlast the longest archive and vacuum run
+RETENTION_LEASE_TTL = int(os.environ.get("RETENTION_LEASE_TTL", 4 * 3600))
+
+
+def retention_cutoff(days, now=None):
+    """
+    First report date that is kept, as "YYYY-MM-DD". weather_reports.date is the city's
+    local date, which is up to a day ahead of or behind UTC, so the cutoff is taken in UTC
+    with one extra day: no report younger than `days` days in its own city is archived.
+    """
+    now = now or datetime.now(timezone.utc)
+    return (now.astimezone(timezone.utc).date() - timedelta(days=days + 1)).isoformat()
+
+
+def archive_path(archive_dir, report_date):
+    return os.path.join(archive_dir, f"weather_reports-{report_date}.jsonl.gz")
+
+
+def archive_rows(rows, archive_dir):
+    """
+    Appends rows to their date's archive file. Appending to a gzip file adds a new
+    gzip member, which gzip readers (and zcat) read as one stream.
+    """
+    os.makedirs(archive_dir, exist_ok=True)
+    for report_date, group in groupby(rows, key=lambda row: row["date"]):
+        with gzip.open(archive_path(archive_dir, report_date), "at", encoding="utf-8") as f:
+            for row in group:
+                f.write(json.dumps(row) + "\n")
+
+
+def fetch_expired(conn, cutoff, limit):
+    rows = conn.execute('''
+        SELECT r.id, r.user_id, r.city_id, c.slug, r.style_id, s.name, r.time_period, r.date,
+               r.report_text, r.created_at, w.data
+        FROM weather_reports r
+        LEFT JOIN cities c ON c.id = r.city_id
+        LEFT JOIN styles s ON s.id = r.style_id
+        LEFT JOIN weather_snapshots w ON w.id = r.snapshot_id
+        WHERE r.date < ?
+        ORDER BY r.date, r.id
+        LIMIT ?''', (cutoff, limit)).fetchall()
+    return [{
+        "id": row[0], "user_id": row[1], "city_id": row[2], "city": row[3], "style_id": row[4],
+        "style": row[5], "time_period": row[6], "date": row[7], "report_text": row[8],
+        "created_at": row[9], "weather": json.loads(decompress(row[10])) if row[10] is not None else None,
+    } for row in rows]
+
+
+def incremental_vacuum(conn, pages=VACUUM_PAGES, pause=VACUUM_PAUSE):
+    """
+    Returns free pages to the filesystem in batches of `pages`. Returns the number of pages freed.
+    Only works once the database is in auto_vacuum=INCREMENTAL mode (see --vacuum).
+    """
+    if conn.execute('PRAGMA auto_vacuum').fetchone()[0] != 2:
+        return 0
+    freed = 0
+    while True:
+        free = conn.execute('PRAGMA freelist_count').fetchone()[0]
+        if not free:
+            break
+        # the pragma only does its work while its rows are being stepped through
+        conn.execute(f'PRAGMA incremental_vacuum({pages})').fetchall()
+        left = conn.execute('PRAGMA freelist_count').fetchone()[0]
+        if left >= free:
+            break
+        freed += free - left
+        time.sleep(pause)
+    # shrink the WAL file too, it keeps the size of the largest batch otherwise
+    conn.execute('PRAGMA wal_checkpoint(TRUNCATE)').fetchall()
+    return freed
+
+
+def apply_retention(days=RETENTION_DAYS, archive_dir=ARCHIVE_DIR, batch_size=RETENTION_BATCH,
+                    dry_run=False, log=print, conn=None):
+    """
+    Archives and deletes reports older than `days` days. Returns the number of reports archived.
+    """
+    cutoff = retention_cutoff(days)
+    own = conn is None
+    if own:
+        conn = connect()
+    try:
+        if dry_run:
+            count = conn.execute('SELECT COUNT(*) FROM weather_reports WHERE date < ?', (cutoff,)).fetchone()[0]
+            log(f"{count} reports from before {cutoff} would be archived to {archive_dir}")
+            return count
+
+        archived = 0
+        while True:
+            rows = fetch_expired(conn, cutoff, batch_size)
+            if not rows:
+                break
+            archive_rows(rows, archive_dir)
+            conn.executemany('DELETE FROM weather_reports WHERE id = ?', [(row["id"],) for row in rows])
+            conn.commit()
+            archived += len(rows)
+
+        # only snapshots from before the cutoff, a request may be about to reference a newer one
+        orphans = conn.execute('''DELETE FROM weather_snapshots
+            WHERE created_at < ? AND id NOT IN (SELECT snapshot_id FROM weather_reports)''', (cutoff,)).rowcount
+        conn.commit()
+        freed = incremental_vacuum(conn)
+        if archived or orphans or freed:
+            log(f"Archived {archived} reports from before {cutoff}, deleted {orphans} snapshots, freed {freed} pages")
+        return archived
+    finally:
+        if own:
+            conn.close()
+
+
+def full_vacuum(log=print):
+    """
+    Rebuilds the database file. Needed once on databases created before incremental
+    vacuum was enabled, as auto_vacuum only changes on a VACUUM.
+    """
+    conn = connect()
+    try:
+        conn.execute('PRAGMA auto_vacuum=INCREMENTAL')
+        conn.execute('VACUUM')
+        log(f"Vacuumed, auto_vacuum is now {conn.execute('PRAGMA auto_vacuum').fetchone()[0]}")
+    finally:
+        conn.close()
+
+
+class RetentionScheduler:
+    """
+    Runs apply_retention() every RETENTION_INTERVAL seconds in a background thread.
+    Every worker process has one; a run is skipped while another process holds the lease.
+    """
+
+    def __init__(self, interval=RETENTION_INTERVAL, lease_ttl=RETENTION_LEASE_TTL):
+        self.interval = interval
+        self.lease_ttl = lease_ttl
+        self._thread = None
+        self._stop = threading.Event()
+
+    def run_once(self):
+        """
+        Runs apply_retention() unless another process is running it or did so less than
+        an interval ago. Returns the number of reports archived, or None if skipped.
+        """
+        # the lease is kept for an interval after the start, so the other processes skip
+        # their turn instead of repeating the run
+        return report_flight.run_exclusive("retention", lambda: apply_retention(log=lambda msg: print(f"[retention] {msg}")),
+                                           ttl=max(self.lease_ttl, self.interval), hold=self.interval)
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.run_once()
+            except Exception as e:
+                print(f"[retention] run failed: {e}")
+            self._stop.wait(self.interval)
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="report-retention", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+
+retention_scheduler = RetentionScheduler()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Archive and delete old weather reports.")
+    parser.add_argument("--days", type=int, default=RETENTION_DAYS, help="days of reports to keep")
+    parser.add_argument("--archive-dir", default=ARCHIVE_DIR, help="directory for the gzip JSONL archives")
+    parser.add_argument("--batch", type=int, default=RETENTION_BATCH, help="reports archived per transaction")
+    parser.add_argument("--dry-run", action="store_true", help="only count the reports that would be archived")
+    parser.add_argument("--vacuum", action="store_true", help="run a full VACUUM (enables incremental vacuum on older databases)")
+    args = parser.parse_args()
+
+    if args.vacuum:
+        full_vacuum()
+    else:
+        apply_retention(days=args.days, archive_dir=args.archive_dir, batch_size=args.batch, dry_run=args.dry_run)
@@ -0,0 +1,176 @@
+"""
+singleflight.py
+
+Coalesces concurrent cache misses for the same key into a single generation.
+
+Within a process, the first caller for a key runs the work and any other thread
+asking for the same key waits for its result. Across worker processes, the first
+caller also takes a lease row in the `leases` table of weather.db. Other processes
+that find the lease poll the cache (via the lookup callback) until the leader has
+stored its result. If the lease expires without a result they try to take over.
+A SingleFlight with db_path=None coalesces within the process only.
+"""
+
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+from db import DB_PATH, get_pool
+
+
+# How long a leader may hold a lease before others assume it died
+LEASE_TTL = float(os.environ.get("SINGLEFLIGHT_LEASE_TTL", 60))
+POLL_INTERVAL = 0.25
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    def __init__(self, db_path=DB_PATH, lease_ttl=LEASE_TTL, poll_interval=POLL_INTERVAL):
+        self.db_path = db_path
+        self.lease_ttl = lease_ttl
+        self.poll_interval = poll_interval
+        self._calls = {}
+        self._lock = threading.Lock()
+        self._stats = {"leaders": 0, "waiters": 0, "remote_waits": 0}
+
+    def _connect(self):
+        # a pooled connection of our own, commits here must not include a request's pending writes
+        return get_pool(self.db_path).acquire()
+
+    def _acquire_lease(self, key, owner, ttl=None):
+        """
+        Returns True if this owner now holds the lease for key.
+        If the database is unavailable we act as leader, coalescing in-process only.
+        """
+        try:
+            conn = self._connect()
+            try:
+                now = time.time()
+                conn.execute('DELETE FROM leases WHERE key = ? AND expires_at <= ?', (key, now))
+                cur = conn.execute('INSERT OR IGNORE INTO leases (key, owner, expires_at) VALUES (?, ?, ?)',
+                                   (key, owner, now + (ttl or self.lease_ttl)))
+                conn.commit()
+                return cur.rowcount == 1
+            finally:
+                conn.close()
+        except sqlite3.Error:
+            return True
+
+    def _lease_held(self, key):
+        try:
+            conn = self._connect()
+            try:
+                row = conn.execute('SELECT 1 FROM leases WHERE key = ? AND expires_at > ?', (key, time.time())).fetchone()
+            finally:
+                conn.close()
+        except sqlite3.Error:
+            return False
+        return row is not None
+
+    def _release_lease(self, key, owner, keep_until=None):
+        try:
+            conn = self._connect()
+            try:
+                if keep_until is not None and keep_until > time.time():
+                    conn.execute('UPDATE leases SET expires_at = ? WHERE key = ? AND owner = ?', (keep_until, key, owner))
+                else:
+                    conn.execute('DELETE FROM leases WHERE key = ? AND owner = ?', (key, owner))
+                conn.commit()
+            finally:
+                conn.close()
+        except sqlite3.Error:
+            pass
+
+    def _lead(self, key, generate, lookup):
+        if self.db_path is None:
+            return generate()
+        owner = f"{os.getpid()}:{uuid.uuid4().hex}"
+        deadline = time.time() + self.lease_ttl
+        while not self._acquire_lease(key, owner):
+            # another process is generating, wait for its result to show up
+            with self._lock:
+                self._stats["remote_waits"] += 1
+            while self._lease_held(key) and time.time() < deadline:
+                result = lookup()
+                if result is not None:
+                    return result
+                time.sleep(self.poll_interval)
+            result = lookup()
+            if result is not None:
+                return result
+            if time.time() >= deadline:
+                # give up waiting and generate without a lease
+                return generate()
+        try:
+            # the other process may have finished between our lookup and taking the lease
+            result = lookup()
+            if result is None:
+                result = generate()
+            return result
+        finally:
+            self._release_lease(key, owner)
+
+    def do(self, key, generate, lookup=lambda: None):
+        """
+        Returns generate() for key, sharing one call between all concurrent callers.
+        lookup() should return the stored result or None; it lets callers in other
+        processes pick up the leader's result and lets the leader skip work that
+        another process already finished.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                self._stats["waiters"] += 1
+                leader = False
+            else:
+                call = self._calls[key] = _Call()
+                self._stats["leaders"] += 1
+                leader = True
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = self._lead(key, generate, lookup)
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def run_exclusive(self, key, work, ttl, hold=0):
+        """
+        Runs work() if no thread or process holds the lease for key, else returns None
+        at once. Meant for periodic jobs, where a second run should be skipped rather
+        than wait: ttl must be longer than the job. The lease is kept until `hold`
+        seconds after the start, so other processes skip the job for that long.
+        """
+        owner = f"{os.getpid()}:{uuid.uuid4().hex}"
+        started = time.time()
+        if not self._acquire_lease(key, owner, ttl):
+            return None
+        try:
+            return work()
+        finally:
+            self._release_lease(key, owner, started + hold if hold else None)
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats)
+
+
+report_flight = SingleFlight()
@@ -0,0 +1,90 @@
+"""
+snapshots.py
+
+Deduplicated, compressed storage for the forecast payload behind each report.
+
+Every style and user asking for a city in the same hour gets a report from
+the same forecast, so weather_reports only references a row in
+`weather_snapshots`. Snapshots are keyed by the SHA-256 of their JSON and
+stored zlib-compressed once. They are only decompressed when a caller
+actually asks for the payload.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import zlib
+from collections import OrderedDict
+
+from helpers import dump_weather
+
+SNAPSHOT_COMPRESSION_LEVEL = int(os.environ.get("SNAPSHOT_COMPRESSION_LEVEL", 6))
+# Decompressed payloads kept in memory, snapshots never change so entries never go stale
+SNAPSHOT_CACHE_SIZE = int(os.environ.get("SNAPSHOT_CACHE_SIZE", 64))
+
+_loaded = OrderedDict()  # {snapshot id: payload}
+_loaded_lock = threading.Lock()
+
+
+def snapshot_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def compress(text):
+    return zlib.compress(text.encode("utf-8"), SNAPSHOT_COMPRESSION_LEVEL)
+
+
+def decompress(data):
+    return zlib.decompress(data).decode("utf-8")
+
+
+def store_text(conn, text):
+    """
+    Stores an already serialized payload (if it isn't stored yet) and returns its id.
+    """
+    digest = snapshot_hash(text)
+    row = conn.execute('SELECT id FROM weather_snapshots WHERE hash = ?', (digest,)).fetchone()
+    if row:
+        return row[0]
+    conn.execute('INSERT OR IGNORE INTO weather_snapshots (hash, data) VALUES (?, ?)', (digest, compress(text)))
+    # another connection may have inserted the same snapshot first
+    return conn.execute('SELECT id FROM weather_snapshots WHERE hash = ?', (digest,)).fetchone()[0]
+
+
+def store_snapshot(conn, weather):
+    """
+    Returns the id of the snapshot for a forecast payload, storing it on first use.
+    Commits are left to the caller, together with the report that references it.
+    """
+    return store_text(conn, dump_weather(weather))
+
+
+def load_snapshot(conn, snapshot_id):
+    """
+    The forecast payload (plain open-meteo dict) of a snapshot, or None if it doesn't exist.
+    """
+    with _loaded_lock:
+        if snapshot_id in _loaded:
+            _loaded.move_to_end(snapshot_id)
+            return _loaded[snapshot_id]
+    row = conn.execute('SELECT data FROM weather_snapshots WHERE id = ?', (snapshot_id,)).fetchone()
+    if row is None:
+        return None
+    weather = json.loads(decompress(row[0]))
+    with _loaded_lock:
+        _loaded[snapshot_id] = weather
+        while len(_loaded) > SNAPSHOT_CACHE_SIZE:
+            _loaded.popitem(last=False)
+    return weather
+
+
+def backfill(conn):
+    """
+    Migration step: moves weather_reports.weather_json into weather_snapshots and
+    sets snapshot_id, one distinct payload at a time.
+    """
+    rows = conn.execute('SELECT DISTINCT weather_json FROM weather_reports WHERE snapshot_id IS NULL').fetchall()
+    for (text,) in rows:
+        snapshot_id = store_text(conn, text)
+        conn.execute('UPDATE weather_reports SET snapshot_id = ? WHERE snapshot_id IS NULL AND weather_json = ?', (snapshot_id, text))
@@ -0,0 +1,95 @@
+"""
+spatial.py
+
+Snaps visitor coordinates onto locations whose forecast is likely cached.
+
+Every visitor has slightly different coordinates, so fetching the forecast for
+their exact lat/lon almost never hits forecast_cache. Instead we look for the
+nearest configured city within SNAP_RADIUS_KM and reuse its forecast. If there
+is none, the coordinates are rounded to a GRID_STEP degree grid, so everybody
+in the same cell shares one forecast. A grid cell takes the visitor's
+timezone, or, when the IP lookup had none, that of the nearest city within
+TIMEZONE_RADIUS_KM (else UTC), so the forecast key and the hourly times
+always use a real timezone name.
+
+Cities are bucketed in a grid of CELL_DEGREES cells. A lookup only measures
+the cities in the cells that overlap the search radius.
+"""
+
+import math
+import os
+from collections import defaultdict
+
+SNAP_RADIUS_KM = float(os.environ.get("SNAP_RADIUS_KM", 50))
+# How far to look for a city to borrow the timezone from
+TIMEZONE_RADIUS_KM = float(os.environ.get("TIMEZONE_RADIUS_KM", 1000))
+# 0.1 degree is roughly 11 km north-south, well below forecast model resolution differences
+GRID_STEP = float(os.environ.get("GRID_STEP", 0.1))
+CELL_DEGREES = 1.0
+EARTH_RADIUS_KM = 6371.0
+KM_PER_DEGREE = 111.2
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+def quantize(lat, lon, step=GRID_STEP):
+    """
+    Rounds coordinates to the centre of their grid cell.
+    """
+    return round(round(lat / step) * step, 4), round(round(lon / step) * step, 4)
+
+
+class CityIndex:
+    def __init__(self, cities, cell=CELL_DEGREES):
+        """
+        cities: iterable of dicts with at least "lat" and "lon"
+        """
+        self.cell = cell
+        self._cells = defaultdict(list)
+        for city in cities:
+            self._cells[self._cell_of(city["lat"], city["lon"])].append(city)
+
+    def _cell_of(self, lat, lon):
+        return int(math.floor(lat / self.cell)), int(math.floor(lon / self.cell))
+
+    def nearest(self, lat, lon, radius_km=SNAP_RADIUS_KM):
+        """
+        Returns (city, distance_km) for the closest city within radius_km, else (None, None).
+        """
+        lat_cells = int(math.ceil(radius_km / (KM_PER_DEGREE * self.cell)))
+        # longitude degrees shrink towards the poles, so search more cells there
+        cos_lat = max(math.cos(math.radians(lat)), 0.01)
+        lon_cells = min(int(math.ceil(radius_km / (KM_PER_DEGREE * cos_lat * self.cell))), int(180 / self.cell))
+        lon_cell_count = int(360 / self.cell)
+
+        cy, cx = self._cell_of(lat, lon)
+        best, best_distance = None, None
+        for dy in range(-lat_cells, lat_cells + 1):
+            for dx in range(-lon_cells, lon_cells + 1):
+                # wrap around the antimeridian
+                x = (cx + dx + lon_cell_count // 2) % lon_cell_count - lon_cell_count // 2
+                for city in self._cells.get((cy + dy, x), ()):
+                    distance = haversine_km(lat, lon, city["lat"], city["lon"])
+                    if distance <= radius_km and (best_distance is None or distance < best_distance):
+                        best, best_distance = city, distance
+        return best, best_distance
+
+
+def snap_location(lat, lon, timezone_str=None, city_index=None, radius_km=SNAP_RADIUS_KM):
+    """
+    Returns the {"lat", "lon", "timezone"} to fetch the forecast for and, when snapped, the matched city.
+    timezone_str is the visitor's timezone, if known.
+    """
+    if city_index is not None:
+        city, _ = city_index.nearest(lat, lon, radius_km)
+        if city is not None:
+            return {"lat": city["lat"], "lon": city["lon"], "timezone": city["timezone"]}, city
+        if not timezone_str:
+            city, _ = city_index.nearest(lat, lon, TIMEZONE_RADIUS_KM)
+            timezone_str = city["timezone"] if city is not None else None
+    lat, lon = quantize(lat, lon)
+    return {"lat": lat, "lon": lon, "timezone": timezone_str or "UTC"}, None
@@ -0,0 +1,80 @@
+import importlib
+import os
+import sys
+import tempfile
+
+import pytest
+
+# the app's modules live at the top of the repository
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# The app module opens db.DB_PATH when it is imported, point it at a scratch database
+# and keep the warmer from calling open-meteo
+TEST_DIR = tempfile.mkdtemp(prefix="weather-tests-")
+os.environ["DB_PATH"] = os.path.join(TEST_DIR, "weather.db")
+os.environ["WARMER_ENABLED"] = "0"
+
+import db
+from migrations import migrate
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    """
+    A migrated, empty weather.db in a temporary directory.
+    """
+    path = str(tmp_path / "weather.db")
+    conn = db.connect(path)
+    migrate(conn, log=lambda msg: None)
+    conn.discard()
+    yield path
+    db.get_pool(path).close_all()
+
+
+@pytest.fixture
+def conn(db_path):
+    conn = db.connect(db_path)
+    yield conn
+    conn.discard()
+
+
+@pytest.fixture(scope="session")
+def app_module():
+    """
+    The Flask app module, on the DB_PATH database. Sessions are stored under TEST_DIR.
+    """
+    cwd = os.getcwd()
+    os.chdir(TEST_DIR)
+    try:
+        return importlib.import_module("app")
+    finally:
+        os.chdir(cwd)
+
+
+@pytest.fixture
+def app_conn(app_module):
+    conn = db.connect(db.DB_PATH)
+    yield conn
+    conn.discard()
+
+
+def add_city(conn, name="London", timezone="Europe/London", lat=51.5, lon=-0.13):
+    slug = name.lower().replace(" ", "-")
+    cur = conn.execute('INSERT INTO cities (name, slug, timezone, lat, lon) VALUES (?, ?, ?, ?, ?)',
+                       (name, slug, timezone, lat, lon))
+    conn.execute('UPDATE reference_version SET version = version + 1')
+    conn.commit()
+    return dict(id=cur.lastrowid, name=name, slug=slug, timezone=timezone, lat=lat, lon=lon)
+
+
+def add_style(conn, name="Plain", position=0):
+    cur = conn.execute('INSERT INTO styles (name, position) VALUES (?, ?)', (name, position))
+    conn.execute('UPDATE reference_version SET version = version + 1')
+    conn.commit()
+    return dict(id=cur.lastrowid, name=name, position=position)
+
+
+def add_user(conn, username):
+    cur = conn.execute('INSERT INTO users (username, password_hash) VALUES (?, ?)', (username, "x"))
+    conn.commit()
+    return cur.lastrowid
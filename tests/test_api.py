@@ -0,0 +1,147 @@
+import time
+import zoneinfo
+from datetime import datetime, timedelta
+
+import pytest
+
+from conftest import add_city, add_style, add_user
+from hourly_forecast import HourlyForecast
+from page_cache import page_cache
+from reference_data import reference_data
+from snapshots import store_snapshot
+from warmer import Snapshot, freeze
+
+TZ = zoneinfo.ZoneInfo("Europe/London")
+CURRENT = {"time": "2026-10-18T09:00", "interval": 900, "temperature_2m": 12.5, "wind_direction_10m": 225,
+           "wind_speed_10m": 10.4, "pressure_msl": 1012.0, "relative_humidity_2m": 80, "weather_code": 2}
+
+
+def make_weather(tz=TZ, hours=48):
+    start = datetime.now(tz).replace(minute=0, second=0, microsecond=0, tzinfo=None) - timedelta(hours=2)
+    hourly = {
+        "time": [(start + timedelta(hours=h)).isoformat(timespec="minutes") for h in range(hours)],
+        "temperature_2m": [float(h) for h in range(hours)],
+        "wind_speed_10m": [10.0] * hours,
+        "wind_direction_10m": [180] * hours,
+        "weather_code": [2] * hours,
+        "is_day": [1] * hours,
+    }
+    return {"timezone": tz.key, "current": dict(CURRENT, cardinal="SW"), "hourly": HourlyForecast.from_openmeteo(hourly, tz)}
+
+
+@pytest.fixture
+def api(app_module, app_conn, monkeypatch, request):
+    name = request.node.name.replace("_", "-")
+    cities = [add_city(app_conn, name=f"{name} {i}", timezone="Europe/London") for i in range(2)]
+    style = add_style(app_conn, name=f"Style {name}", position=1)
+    reference_data.reload()
+    page_cache.clear()
+    weather = make_weather()
+    monkeypatch.setattr(app_module, "get_weather", lambda city, timezone_str: weather)
+    snapshot = Snapshot(
+        cities=tuple(freeze({"city": city, "location_name": city["name"],
+                             "current": dict(CURRENT, is_day=1, icon="partly-cloudy-day.svg", description="cloudy")})
+                     for city in cities),
+        timezones={city["slug"]: TZ for city in cities},
+        fetched_at=time.time(),
+    )
+    monkeypatch.setattr(app_module.current_weather_warmer, "_snapshot", snapshot)
+    return app_module.app.test_client(), cities, style
+
+
+def test_current_is_503_before_the_first_snapshot(app_module, monkeypatch):
+    monkeypatch.setattr(app_module.current_weather_warmer, "_snapshot", None)
+    resp = app_module.app.test_client().get("/api/current")
+    assert resp.status_code == 503
+    assert "error" in resp.get_json()
+
+
+def test_current_filters_cities_and_fields(api):
+    client, cities, _ = api
+    resp = client.get(f"/api/current?cities={cities[1]['slug']}&fields=temperature_2m,icon_url")
+    data = resp.get_json()
+
+    assert resp.status_code == 200
+    assert [city["slug"] for city in data["cities"]] == [cities[1]["slug"]]
+    current = data["cities"][0]["current"]
+    assert set(current) == {"temperature_2m", "icon_url"}
+    assert current["temperature_2m"] == 12.5
+    assert current["icon_url"]
+
+    everything = client.get(f"/api/current?cities={cities[0]['slug']},{cities[1]['slug']}").get_json()
+    assert len(everything["cities"]) == 2
+    assert {"temperature_2m", "description", "icon", "icon_animated_url"} <= set(everything["cities"][0]["current"])
+
+
+def test_current_etag_and_304(api):
+    client, cities, _ = api
+    url = f"/api/current?cities={cities[0]['slug']}"
+    resp = client.get(url)
+    again = client.get(url, headers={"If-None-Match": resp.headers["ETag"]})
+
+    assert resp.headers["Content-Type"] == "application/json"
+    assert again.status_code == 304
+    assert again.data == b""
+
+
+def test_unknown_fields_are_a_400(api):
+    client, cities, _ = api
+    resp = client.get("/api/current?fields=temperature_2m,temprature")
+    assert resp.status_code == 400
+    assert "temprature" in resp.get_json()["error"]
+    # hourly row names are not current condition names
+    assert client.get(f"/api/cities/{cities[0]['slug']}/hourly?fields=temperature").status_code == 400
+    assert client.get(f"/api/cities/{cities[0]['slug']}/hourly?hourly_fields=temperature_2m").status_code == 400
+
+
+def test_hourly_selects_current_and_hour_fields_separately(api):
+    client, cities, _ = api
+    resp = client.get(f"/api/cities/{cities[0]['slug']}/hourly"
+                      "?fields=temperature_2m,cardinal&hourly_fields=original_time,temperature")
+    data = resp.get_json()
+
+    assert resp.status_code == 200
+    assert data["current"] == {"temperature_2m": 12.5, "cardinal": "SW"}
+    assert len(data["hourly"]) == 24
+    assert set(data["hourly"][0]) == {"original_time", "temperature"}
+    # the window starts at the current hour, two hours into the forecast
+    assert data["hourly"][0]["temperature"] == 2.0
+
+    again = client.get(f"/api/cities/{cities[0]['slug']}/hourly"
+                       "?fields=temperature_2m,cardinal&hourly_fields=original_time,temperature",
+                       headers={"If-None-Match": resp.headers["ETag"]})
+    assert again.status_code == 304
+
+
+def test_hourly_unknown_city_is_a_404(api):
+    client, _, _ = api
+    assert client.get("/api/cities/atlantis/hourly").status_code == 404
+
+
+def test_report_prefers_the_users_own(api, app_conn):
+    client, cities, style = api
+    city = cities[0]
+    user_id = add_user(app_conn, f"user-{city['slug']}")
+    snapshot_id = store_snapshot(app_conn, {"current": CURRENT})
+    for owner, text in ((None, "shared"), (user_id, "own")):
+        app_conn.execute('''INSERT INTO weather_reports (user_id, city_id, style_id, time_period, date, snapshot_id, report_text)
+            VALUES (?, ?, ?, 'morning', '2026-10-18', ?, ?)''', (owner, city["id"], style["id"], snapshot_id, text))
+    app_conn.commit()
+    url = f"/api/reports/{city['slug']}?style={style['id']}&period=morning&date=2026-10-18"
+
+    assert client.get(url).get_json()["report"] == "shared"
+    with client.session_transaction() as sess:
+        sess["user_id"] = user_id
+    data = client.get(url).get_json()
+    assert data["report"] == "own"
+    assert data["own"] is True
+
+
+def test_report_errors(api):
+    client, cities, style = api
+    slug = cities[0]["slug"]
+    assert client.get(f"/api/reports/atlantis?style={style['id']}").status_code == 404
+    assert client.get(f"/api/reports/{slug}?style=999999").status_code == 404
+    assert client.get(f"/api/reports/{slug}?style={style['id']}&period=teatime").status_code == 400
+    # no report stored for that day
+    assert client.get(f"/api/reports/{slug}?style={style['id']}&period=morning&date=2000-01-01").status_code == 404
@@ -0,0 +1,158 @@
+import json
+import os
+
+import pytest
+from flask import Flask, render_template_string, url_for
+
+import assets as assets_module
+from assets import ASSET_MAX_AGE, Assets, build, fingerprint
+
+ICON = """<svg width="56" height="48" xmlns="http://www.w3.org/2000/svg">
+  <defs><filter id="blur"><feGaussianBlur stdDeviation="3" /></filter>
+    <style type="text/css">.sun { animation-name: spin } @keyframes spin { to { opacity: 1 } }</style></defs>
+  <g filter="url(#blur)"><circle class="sun" r="8" /></g>
+</svg>
+"""
+
+
+class FakeBrotli:
+    @staticmethod
+    def compress(data):
+        return b"br:" + data
+
+
+def write(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(data)
+
+
+@pytest.fixture
+def static_dir(tmp_path):
+    static = tmp_path / "static"
+    write(str(static / "css" / "styles.css"), "@font-face { src: url('../font/icons.woff2?v=2#iefix') }\n"
+                                              "body { background: url(missing.png) }\n")
+    write(str(static / "font" / "icons.woff2"), "woff2")
+    for icon_dir in ("icons/static", "icons/animated"):
+        # a mapped icon and the default one, the others the sprite wants are missing
+        write(str(static / icon_dir / "clear-day.svg"), ICON)
+        write(str(static / icon_dir / "cloudy.svg"), ICON)
+    return str(static)
+
+
+@pytest.fixture
+def built(static_dir, tmp_path, monkeypatch):
+    monkeypatch.setattr(assets_module, "brotli", FakeBrotli)
+    dist_dir = str(tmp_path / "static" / "dist")
+    log = []
+    manifest = build(static_dir, dist_dir, log=log.append)
+    return manifest, dist_dir, log
+
+
+def read(dist_dir, path):
+    with open(os.path.join(dist_dir, path), "rb") as f:
+        return f.read()
+
+
+@pytest.fixture
+def app(built):
+    manifest, dist_dir, _ = built
+    app = Flask(__name__, static_folder=os.path.dirname(dist_dir))
+    Assets(dist_dir).init_app(app)
+    return app
+
+
+def test_build_fingerprints_every_asset(built):
+    manifest, dist_dir, log = built
+
+    assert manifest == json.loads(read(dist_dir, "manifest.json"))
+    assert manifest["font/icons.woff2"] == fingerprint("font/icons.woff2", b"woff2")
+    for path, hashed in manifest.items():
+        assert hashed.startswith(os.path.splitext(path)[0] + ".")
+        assert os.path.isfile(os.path.join(dist_dir, hashed))
+    css = read(dist_dir, manifest["css/styles.css"]).decode("utf-8")
+    # relative to the stylesheet, query and fragment kept, unknown files left alone
+    assert f"url('../{manifest['font/icons.woff2']}?v=2#iefix')" in css
+    assert "url(missing.png)" in css
+
+
+def test_build_precompresses_text_assets(built):
+    manifest, dist_dir, _ = built
+    css = manifest["css/styles.css"]
+
+    assert read(dist_dir, css + ".br") == b"br:" + read(dist_dir, css)
+    assert os.path.isfile(os.path.join(dist_dir, css + ".gz"))
+    # woff2 is compressed already
+    assert not os.path.exists(os.path.join(dist_dir, manifest["font/icons.woff2"] + ".gz"))
+
+
+def test_a_font_change_renames_the_stylesheet(built, static_dir, tmp_path):
+    manifest, _, _ = built
+    write(os.path.join(static_dir, "font", "icons.woff2"), "woff2, version 2")
+
+    rebuilt = build(static_dir, str(tmp_path / "dist2"), log=lambda msg: None)
+    assert rebuilt["font/icons.woff2"] != manifest["font/icons.woff2"]
+    assert rebuilt["css/styles.css"] != manifest["css/styles.css"]
+    assert rebuilt["icons/static/cloudy.svg"] == manifest["icons/static/cloudy.svg"]
+
+
+def test_sprites_scope_each_icon(built):
+    manifest, dist_dir, log = built
+    sprite = read(dist_dir, manifest["icons/sprite-static.svg"]).decode("utf-8")
+
+    assert 'id="clear-day"' in sprite and 'id="cloudy"' in sprite
+    assert 'id="clear-day--blur"' in sprite and 'filter="url(#clear-day--blur)"' in sprite
+    assert "@keyframes clear-day-spin" in sprite and "#clear-day .sun" in sprite
+    # icons missing from the source directory are left out of the sprite
+    assert 'id="clear-night"' not in sprite
+    assert any("clear-night.svg, skipped" in line for line in log)
+
+
+def test_urls_point_at_the_build(app, built):
+    manifest, _, _ = built
+    sprite = manifest["icons/sprite-animated.svg"]
+
+    with app.test_request_context():
+        assert url_for("static", filename="css/styles.css") == "/static/dist/" + manifest["css/styles.css"]
+        assert render_template_string("{{ icon_url('cloudy.svg') }}") == (
+            "/static/dist/" + manifest["icons/sprite-static.svg"] + "#cloudy")
+        assert render_template_string("{{ icon_url('clear-day.svg', animated=True) }}") == (
+            f"/static/dist/{sprite}#clear-day")
+        # not built, the plain file
+        assert url_for("static", filename="js/app.js") == "/static/js/app.js"
+
+
+def test_urls_without_a_build(tmp_path):
+    app = Flask(__name__)
+    unbuilt = Assets(str(tmp_path / "no-dist"))
+    unbuilt.init_app(app)
+
+    assert unbuilt.manifest == {}
+    with app.test_request_context():
+        assert url_for("static", filename="css/styles.css") == "/static/css/styles.css"
+        assert unbuilt.icon_url("cloudy.svg") == "/static/icons/static/cloudy.svg"
+        assert unbuilt.icon_url("cloudy.svg", animated=True) == "/static/icons/animated/cloudy.svg"
+
+
+@pytest.mark.parametrize("accept, encoding, prefix", [
+    ("br, gzip", "br", b"br:"),
+    ("gzip", "gzip", b"\x1f\x8b"),
+    ("", None, b"@font-face"),
+])
+def test_fingerprinted_files_are_cached_for_a_year(app, built, accept, encoding, prefix):
+    manifest, _, _ = built
+    resp = app.test_client().get("/static/dist/" + manifest["css/styles.css"], headers={"Accept-Encoding": accept})
+
+    assert resp.status_code == 200
+    assert resp.mimetype == "text/css"
+    assert resp.headers.get("Content-Encoding") == encoding
+    assert resp.data.startswith(prefix)
+    assert resp.cache_control.max_age == ASSET_MAX_AGE
+    assert resp.cache_control.public and resp.cache_control.immutable
+    assert "Accept-Encoding" in resp.vary
+
+
+def test_missing_files_and_the_manifest_are_not_served(app):
+    client = app.test_client()
+    assert client.get("/static/dist/css/styles.000000000000.css").status_code == 404
+    assert client.get("/static/dist/manifest.json").status_code == 404
@@ -0,0 +1,90 @@
+import random
+import string
+
+import pytest
+from slugify import slugify
+
+from city_import import city_rows, fast_slug, import_cities, read_cities
+from reference_data import read_version
+
+NAMES = [
+    "London", "New York", "Rio de Janeiro", "St. John's", "Val-d'Or", "Winston-Salem", "  Area 51  ",
+    "1,000 Islands", "Fish & Chips", "Zürich", "São Paulo", "Île-de-France", "Ho Chi Minh City",
+    "Kraków", "Ōsaka", "Xi'an", "Washington, D.C.", "--Dash--", "A  B\tC",
+]
+
+GEONAMES = "\n".join("\t".join(row) for row in [
+    # geonameid, name, asciiname, alternatenames, lat, lon, feature class, feature code, country, cc2,
+    # admin1-4, population, elevation, dem, timezone, modification date
+    ["1", "Springfield", "Springfield", "", "39.80", "-89.64", "P", "PPLA", "US", "", "IL", "", "", "", "114000", "", "", "America/Chicago", ""],
+    ["2", "Springfield", "Springfield", "", "37.21", "-93.29", "P", "PPLA2", "US", "", "MO", "", "", "", "169000", "", "", "America/Chicago", ""],
+    ["3", "Springfield", "Springfield", "", "42.10", "-72.59", "P", "PPLA2", "US", "", "MA", "", "", "", "155000", "", "", "America/New_York", ""],
+    ["4", "Mount Everest", "Mount Everest", "", "27.98", "86.92", "T", "MT", "NP", "", "", "", "", "", "0", "", "", "Asia/Kathmandu", ""],
+    ["5", "Zürich", "Zurich", "", "47.37", "8.55", "P", "PPLA", "CH", "", "ZH", "", "", "", "341730", "", "", "Europe/Zurich", ""],
+]) + "\n"
+
+
+@pytest.mark.parametrize("name", NAMES)
+def test_fast_slug_matches_slugify(name):
+    assert fast_slug(name) == slugify(name)
+
+
+def test_fast_slug_matches_slugify_on_random_ascii():
+    rng = random.Random(1)
+    for _ in range(5000):
+        name = "".join(rng.choice(string.printable) for _ in range(rng.randint(1, 12)))
+        assert fast_slug(name) == slugify(name), name
+
+
+def cities(conn):
+    return {row["slug"]: dict(row) for row in conn.execute('SELECT * FROM cities')}
+
+
+def test_geonames_import_keeps_the_most_populous_namesake(conn, tmp_path):
+    path = tmp_path / "cities15000.txt"
+    path.write_text(GEONAMES, encoding="utf-8")
+    log = []
+
+    # counts upserted rows, the mountain is not a populated place
+    assert import_cities(city_rows(read_cities(str(path))), batch_size=2, conn=conn, log=log.append) == (4, 0)
+    rows = cities(conn)
+    assert set(rows) == {"springfield", "zurich"}
+    # Missouri's is the largest, it wins whichever batch it is in
+    assert (rows["springfield"]["lat"], rows["springfield"]["population"]) == (37.21, 169000)
+    assert rows["zurich"]["name"] == "Zürich"
+
+
+def test_reimport_is_idempotent_and_keeps_ids(conn, tmp_path):
+    path = tmp_path / "cities.csv"
+    path.write_text("name,timezone,latitude,lng,country,population\n"
+                    "Vancouver,America/Vancouver,49.28,-123.12,CA,662248\n"
+                    "Nowhere,Not/AZone,0,0,,\n"
+                    "Paris,Europe/Paris,48.86,2.35,FR,2138551\n", encoding="utf-8")
+    log = []
+    assert import_cities(city_rows(read_cities(str(path)), log=log.append), conn=conn, log=log.append) == (2, 0)
+    assert any("Nowhere" in line for line in log)
+    first = cities(conn)
+    version = read_version(conn)
+
+    import_cities(city_rows(read_cities(str(path)), log=log.append), conn=conn, log=log.append)
+
+    assert cities(conn) == first
+    # running apps are told to reload their cities
+    assert read_version(conn) == version + 1
+
+
+def test_rows_colliding_on_another_constraint_are_skipped(conn):
+    conn.execute('''INSERT INTO cities (name, slug, timezone, lat, lon) VALUES ('Paris', 'paris-fr', 'Europe/Paris', 48.86, 2.35)''')
+    conn.commit()
+    rows = list(city_rows([("Paris", "Europe/Paris", "48.86", "2.35", "FR", "2138551"),
+                           ("Lyon", "Europe/Paris", "45.76", "4.84", "FR", "513275")]))
+
+    # the name is taken by another slug, the batch is retried row by row
+    assert import_cities(rows, conn=conn, log=lambda msg: None) == (1, 1)
+    assert set(cities(conn)) == {"paris-fr", "lyon"}
+
+
+def test_min_population_filter():
+    records = [("Big", "Europe/Paris", "1", "2", "FR", "60000"), ("Small", "Europe/Paris", "1", "2", "FR", "800"),
+               ("Unknown", "Europe/Paris", "1", "2", "FR", "")]
+    assert [row[0] for row in city_rows(records, min_population=50000)] == ["Big"]
@@ -0,0 +1,73 @@
+import random
+
+from slugify import slugify
+
+from city_search import MAX_RESULTS, SCAN_LIMIT, CitySearchIndex
+
+
+def city(name, population=0):
+    return {"name": name, "slug": slugify(name), "population": population}
+
+
+CITIES = [
+    city("York", 200_000),
+    city("New York", 8_000_000),
+    city("Yorkton", 16_000),
+    city("East York", 100_000),
+    city("Newark", 300_000),
+    city("São Paulo", 12_000_000),
+]
+
+
+def names(results):
+    return [c["name"] for c in results]
+
+
+def test_exact_name_then_name_prefixes_then_word_prefixes():
+    index = CitySearchIndex(CITIES)
+
+    # York is the exact match despite New York's population, East York and New York match on a later word
+    assert names(index.search("york")) == ["York", "Yorkton", "New York", "East York"]
+    assert names(index.search("new")) == ["New York", "Newark"]
+
+
+def test_queries_are_normalized_like_slugs():
+    index = CitySearchIndex(CITIES)
+
+    assert names(index.search("  NEW york ")) == ["New York"]
+    assert names(index.search("sao p")) == ["São Paulo"]
+    assert index.search("") == [] and index.search("!!") == []
+
+
+def test_limit():
+    index = CitySearchIndex(CITIES)
+
+    assert names(index.search("york", limit=2)) == ["York", "Yorkton"]
+    assert len(index.search("y", limit=1000)) <= MAX_RESULTS
+
+
+def test_precomputed_prefixes_rank_like_a_full_scan():
+    rng = random.Random(7)
+    syllables = ["sa", "san", "st", "ma", "mar", "ber", "lin", "o", "to", "ville", "new"]
+    cities = [city(" ".join("".join(rng.choice(syllables) for _ in range(rng.randint(1, 3))) for _ in range(rng.randint(1, 2))) + f" {i}",
+                   rng.randint(0, 1_000_000)) for i in range(3000)]
+    index = CitySearchIndex(cities)
+
+    def brute_force(prefix, limit):
+        ranks = {}
+        for pos, c in enumerate(cities):
+            words = c["slug"].split("-")
+            for i in range(len(words)):
+                if "-".join(words[i:]).startswith(prefix):
+                    rank = (i > 0, -c["population"], c["name"])
+                    ranks[pos] = min(ranks.get(pos, rank), rank)
+        return [cities[pos] for pos in sorted(ranks, key=ranks.get)[:limit]]
+
+    for prefix in ("s", "sa", "m", "ma", "new", "o", "ville"):
+        assert prefix in index._top, prefix
+        assert names(index.search(prefix, MAX_RESULTS)) == names(brute_force(prefix, MAX_RESULTS)), prefix
+    # a narrow prefix is ranked at query time
+    for prefix in ("sama", "berlin", "toville"):
+        assert prefix not in index._top, prefix
+        assert names(index.search(prefix, 10)) == names(brute_force(prefix, 10)), prefix
+    assert SCAN_LIMIT < len(cities)
@@ -0,0 +1,106 @@
+import sqlite3
+
+import pytest
+from flask import Flask
+
+import db
+
+
+@pytest.fixture
+def pools(monkeypatch):
+    # get_db() uses the pool of db.DB_PATH, start with an empty one
+    monkeypatch.setattr(db, "_pools", {})
+    yield db._pools
+    for pool in db._pools.values():
+        pool.close_all()
+
+
+@pytest.fixture
+def app(pools):
+    app = Flask(__name__)
+    db.init_app(app)
+    seen = []
+
+    @app.route("/query")
+    def query():
+        conn = db.get_db()
+        assert db.get_db() is conn
+        # close() inside a request is left to the teardown
+        conn.close()
+        seen.append(conn)
+        return str(conn.execute('SELECT 1').fetchone()[0])
+
+    @app.route("/fail")
+    def fail():
+        seen.append(db.get_db())
+        raise RuntimeError("route failed")
+
+    app.seen = seen
+    return app
+
+
+def test_connections_are_tuned(tmp_path):
+    conn = db.connect(str(tmp_path / "new.db"))
+    try:
+        assert conn.execute('PRAGMA journal_mode').fetchone()[0] == "wal"
+        # NORMAL
+        assert conn.execute('PRAGMA synchronous').fetchone()[0] == 1
+        assert conn.execute('PRAGMA busy_timeout').fetchone()[0] == int(db.DB_BUSY_TIMEOUT * 1000)
+        assert conn.execute('PRAGMA cache_size').fetchone()[0] == -db.DB_CACHE_SIZE
+        # MEMORY
+        assert conn.execute('PRAGMA temp_store').fetchone()[0] == 2
+        # INCREMENTAL, set before the first table is created
+        assert conn.execute('PRAGMA auto_vacuum').fetchone()[0] == 2
+        assert isinstance(conn.execute('SELECT 1 AS one').fetchone(), sqlite3.Row)
+    finally:
+        conn.discard()
+
+
+def test_request_connection_returns_to_the_pool(app):
+    client = app.test_client()
+    assert client.get("/query").data == b"1"
+
+    pool = db.get_pool()
+    first = app.seen[0]
+    assert pool.stats() == {"opened": 1, "reused": 0, "discarded": 0, "idle": 1}
+    assert not first.request_bound
+
+    client.get("/query")
+    assert app.seen[1] is first
+    assert pool.stats()["reused"] == 1
+
+
+def test_request_connection_returns_after_an_error(app):
+    app.testing = False
+    assert app.test_client().get("/fail").status_code == 500
+
+    assert db.get_pool().stats()["idle"] == 1
+
+
+def test_pool_keeps_at_most_size_idle_connections(tmp_path):
+    pool = db.ConnectionPool(str(tmp_path / "pool.db"), size=2)
+    conns = [pool.acquire() for _ in range(3)]
+    assert len({id(conn) for conn in conns}) == 3
+    for conn in conns:
+        conn.close()
+
+    assert pool.stats() == {"opened": 3, "reused": 0, "discarded": 1, "idle": 2}
+    # the extra connection was really closed
+    with pytest.raises(sqlite3.ProgrammingError):
+        conns[2].execute('SELECT 1')
+    assert pool.acquire() in conns[:2]
+    pool.close_all()
+
+
+def test_release_rolls_back_an_open_transaction(tmp_path):
+    pool = db.ConnectionPool(str(tmp_path / "pool.db"), size=1)
+    conn = pool.acquire()
+    conn.execute('CREATE TABLE t (x INTEGER)')
+    conn.commit()
+    conn.execute('INSERT INTO t VALUES (1)')
+    conn.close()
+
+    conn = pool.acquire()
+    assert not conn.in_transaction
+    assert conn.execute('SELECT COUNT(*) FROM t').fetchone()[0] == 0
+    pool.close_all()
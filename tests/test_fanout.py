@@ -0,0 +1,45 @@
+import threading
+import time
+
+import fanout
+from fanout import deadline_in, map_batches, result_by
+
+
+def test_results_come_back_in_batch_order():
+    def fetch(batch):
+        # the first batches finish last
+        time.sleep(0.01 * (5 - batch[0]))
+        return [n * 10 for n in batch]
+
+    assert map_batches(fetch, [[n] for n in range(5)]) == [[0], [10], [20], [30], [40]]
+
+
+def test_a_failed_batch_gives_none():
+    def fetch(batch):
+        if batch == ["b"]:
+            raise ConnectionError("upstream down")
+        return batch
+
+    assert map_batches(fetch, [["a"], ["b"], ["c"]]) == [["a"], None, ["c"]]
+    assert map_batches(fetch, [["b"]]) == [None]
+
+
+def test_a_single_batch_runs_on_the_calling_thread():
+    threads = []
+    map_batches(lambda batch: threads.append(threading.current_thread()), [["a"]])
+    assert threads == [threading.current_thread()]
+
+    map_batches(lambda batch: threads.append(threading.current_thread()), [["a"], ["b"]])
+    assert threading.current_thread() not in threads[1:]
+
+
+def test_result_by_the_deadline():
+    release = threading.Event()
+    slow = fanout.submit(release.wait, 5)
+    failed = fanout.submit(lambda: 1 / 0)
+
+    assert result_by(slow, deadline_in(0.01), default="placeholder") == "placeholder"
+    assert result_by(failed, deadline_in(1), default="placeholder") == "placeholder"
+    release.set()
+    # the fetch kept running after the deadline
+    assert result_by(slow, deadline_in(1)) is True
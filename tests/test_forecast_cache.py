@@ -0,0 +1,152 @@
+import threading
+import time
+from datetime import datetime, timezone
+
+import pytest
+
+import forecast_cache as forecast_cache_module
+from forecast_cache import ForecastCache, forecast_key, next_hour_boundary
+
+# 10:20 UTC
+NOW = datetime(2026, 10, 18, 10, 20, tzinfo=timezone.utc).timestamp()
+
+
+class Clock:
+    def __init__(self, now):
+        self.now = now
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock(NOW)
+    monkeypatch.setattr(forecast_cache_module, "time", clock)
+    return clock
+
+
+def test_next_hour_boundary_follows_the_local_hour():
+    assert next_hour_boundary("Europe/London", NOW) == NOW + 40 * 60
+    # UTC+5:30, 15:50 local time
+    assert next_hour_boundary("Asia/Kolkata", NOW) == NOW + 10 * 60
+    assert next_hour_boundary("Not/AZone", NOW) == NOW + 40 * 60
+
+
+def test_forecast_key_rounds_coordinates():
+    assert forecast_key(49.2827, -123.1207, "America/Vancouver") == forecast_key("49.28270000001", -123.12070000001, "America/Vancouver")
+
+
+def test_fresh_until_the_top_of_the_hour(clock):
+    cache = ForecastCache()
+    key = forecast_key(51.5, -0.13, "Europe/London")
+    loads = []
+
+    def loader():
+        loads.append(clock.now)
+        return {"loaded_at": clock.now}
+
+    assert cache.get(key, loader) == {"loaded_at": NOW}
+    clock.now = NOW + 39 * 60
+    assert cache.get(key, loader) == {"loaded_at": NOW}
+    assert loads == [NOW]
+    assert cache.stats()["hits"] == 1
+
+
+def test_expired_entry_is_served_while_one_refresh_runs(clock):
+    cache = ForecastCache()
+    key = forecast_key(51.5, -0.13, "Europe/London")
+    cache.get(key, lambda: {"version": 1})
+    clock.now = NOW + 41 * 60
+
+    release = threading.Event()
+    refreshes = []
+
+    def slow_loader():
+        refreshes.append(1)
+        release.wait(5)
+        return {"version": 2}
+
+    # both stale lookups get the old payload at once, only one refresh is started
+    assert cache.get(key, slow_loader) == {"version": 1}
+    assert cache.get(key, slow_loader) == {"version": 1}
+    release.set()
+    deadline = time.monotonic() + 5
+    while cache.stats()["refreshes"] == 0 and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    assert refreshes == [1]
+    assert cache.peek(key) == {"version": 2}
+    assert cache.stats()["stale_hits"] == 2
+
+
+def test_too_old_entry_is_a_miss(clock):
+    cache = ForecastCache(stale_ttl=600)
+    key = forecast_key(51.5, -0.13, "Europe/London")
+    cache.get(key, lambda: {"version": 1})
+    clock.now = NOW + 40 * 60 + 601
+
+    assert cache.peek(key) is None
+    assert cache.get(key, lambda: {"version": 2}) == {"version": 2}
+
+
+def test_failed_loads_are_not_cached(clock):
+    cache = ForecastCache()
+    key = forecast_key(51.5, -0.13, "Europe/London")
+
+    assert cache.get(key, lambda: {}) == {}
+    assert cache.get(key, lambda: {"version": 1}) == {"version": 1}
+    assert cache.stats()["errors"] == 1
+
+
+def test_least_recently_used_locations_are_evicted(clock):
+    cache = ForecastCache(maxsize=2)
+    keys = [forecast_key(50 + i, 0, "Europe/London") for i in range(3)]
+    cache.get(keys[0], lambda: {"city": 0})
+    cache.get(keys[1], lambda: {"city": 1})
+    # a hit makes keys[0] the most recently used
+    cache.get(keys[0], lambda: {"city": "reloaded"})
+    cache.get(keys[2], lambda: {"city": 2})
+
+    assert cache.peek(keys[0]) == {"city": 0}
+    assert cache.peek(keys[1]) is None
+    assert cache.peek(keys[2]) == {"city": 2}
+    assert cache.stats()["size"] == 2
+    assert cache.stats()["evictions"] == 1
+
+
+def test_entries_past_their_grace_period_are_dropped(clock):
+    cache = ForecastCache(stale_ttl=600)
+    old = forecast_key(51.5, -0.13, "Europe/London")
+    cache.get(old, lambda: {"version": 1})
+    clock.now = NOW + 40 * 60 + 601
+    cache.get(forecast_key(48.9, 2.35, "Europe/Paris"), lambda: {"version": 1})
+
+    assert cache.stats()["size"] == 1
+    assert cache.stats()["evictions"] == 1
+
+
+def test_concurrent_misses_share_one_load(clock):
+    cache = ForecastCache()
+    key = forecast_key(51.5, -0.13, "Europe/London")
+    release = threading.Event()
+    loads = []
+
+    def slow_loader():
+        loads.append(1)
+        release.wait(5)
+        return {"version": 1}
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get(key, slow_loader))) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    deadline = time.monotonic() + 5
+    while cache._flight.stats()["waiters"] < 3 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert loads == [1]
+    assert results == [{"version": 1}] * 4
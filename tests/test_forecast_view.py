@@ -0,0 +1,92 @@
+import zoneinfo
+from datetime import datetime, timedelta
+
+from forecast_view import as_hourly_forecast, hourly_window, local_hour_start
+from hourly_forecast import HourlyForecast
+
+LONDON = zoneinfo.ZoneInfo("Europe/London")
+KOLKATA = zoneinfo.ZoneInfo("Asia/Kolkata")
+
+
+def make_hourly(start, hours=48):
+    first = datetime.fromisoformat(start)
+    return {
+        "time": [(first + timedelta(hours=h)).isoformat(timespec="minutes") for h in range(hours)],
+        "temperature_2m": [float(h) for h in range(hours)],
+    }
+
+
+def epoch(local, tz=LONDON):
+    return datetime.fromisoformat(local).replace(tzinfo=tz).timestamp()
+
+
+def times(window):
+    return [row.original_time for row in window]
+
+
+def test_window_starting_mid_hour_includes_the_current_hour():
+    weather = {"hourly": make_hourly("2026-10-18T00:00")}
+    window = hourly_window(weather, LONDON, now=epoch("2026-10-18T10:20"))
+
+    assert len(window) == 24
+    assert times(window)[0] == "2026-10-18T10:00"
+    assert times(window)[-1] == "2026-10-19T09:00"
+
+
+def test_half_hour_offset_timezone_starts_on_its_own_hour():
+    weather = {"hourly": make_hourly("2026-10-18T00:00")}
+    # 10:20 local in Kolkata is 04:50 UTC
+    assert local_hour_start(epoch("2026-10-18T10:20", KOLKATA), KOLKATA) == epoch("2026-10-18T10:00", KOLKATA)
+    assert times(hourly_window(weather, KOLKATA, now=epoch("2026-10-18T10:20", KOLKATA)))[0] == "2026-10-18T10:00"
+
+
+def test_window_before_the_first_hour_starts_at_the_beginning():
+    weather = {"hourly": make_hourly("2026-10-18T00:00")}
+    window = hourly_window(weather, LONDON, now=epoch("2026-10-17T18:45"))
+
+    assert times(window)[0] == "2026-10-18T00:00"
+    assert len(window) == 24
+
+
+def test_window_running_past_the_end_is_shorter():
+    weather = {"hourly": make_hourly("2026-10-18T00:00")}
+    window = hourly_window(weather, LONDON, now=epoch("2026-10-19T20:05"))
+
+    assert times(window) == ["2026-10-19T20:00", "2026-10-19T21:00", "2026-10-19T22:00", "2026-10-19T23:00"]
+
+
+def test_stale_payload_shows_what_it_has():
+    weather = {"hourly": make_hourly("2026-10-18T00:00")}
+    window = hourly_window(weather, LONDON, now=epoch("2026-10-21T12:00"))
+
+    assert times(window)[0] == "2026-10-18T00:00"
+    assert len(window) == 24
+
+
+def test_window_across_a_dst_change():
+    # clocks go forward at 01:00 GMT on 2026-03-29, open-meteo's local times skip 01:00
+    hourly = make_hourly("2026-03-28T20:00", hours=12)
+    hourly["time"] = [t for t in hourly["time"] if t != "2026-03-29T01:00"] + ["2026-03-29T08:00"]
+    forecast = HourlyForecast.from_openmeteo(hourly, LONDON)
+    assert all(b - a == 3600 for a, b in zip(forecast.epochs, forecast.epochs[1:]))
+
+    # 00:30 GMT and 02:30 BST are an hour apart
+    window = hourly_window({"hourly": forecast}, LONDON, now=epoch("2026-03-29T00:30"))
+    assert times(window)[:2] == ["2026-03-29T00:00", "2026-03-29T02:00"]
+    window = hourly_window({"hourly": forecast}, LONDON, now=epoch("2026-03-29T02:30"))
+    assert times(window)[0] == "2026-03-29T02:00"
+
+
+def test_plain_dicts_are_converted_once_per_payload():
+    hourly = make_hourly("2026-10-18T00:00")
+
+    forecast = as_hourly_forecast(hourly, LONDON)
+    assert as_hourly_forecast(hourly, LONDON) is forecast
+    # another timezone gives other epochs
+    assert as_hourly_forecast(hourly, KOLKATA) is not forecast
+    assert as_hourly_forecast(forecast, LONDON) is forecast
+
+
+def test_no_hourly_data():
+    assert hourly_window({}, LONDON) is None
+    assert hourly_window({"hourly": {}}, LONDON) is None
@@ -0,0 +1,119 @@
+import pytest
+
+import geo_cache as geo_cache_module
+from geo_cache import GeoLocationCache, subnet_key
+
+NOW = 1_800_000_000.0
+VANCOUVER = {"status": "success", "city": "Vancouver", "lat": 49.28, "lon": -123.12, "timezone": "America/Vancouver"}
+
+
+class Clock:
+    def __init__(self, now):
+        self.now = now
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock(NOW)
+    monkeypatch.setattr(geo_cache_module, "time", clock)
+    return clock
+
+
+class Loader:
+    def __init__(self, location=VANCOUVER):
+        self.location = location
+        self.calls = []
+
+    def __call__(self, ip):
+        self.calls.append(ip)
+        return dict(self.location)
+
+
+def test_subnet_keys():
+    assert subnet_key("75.157.111.33") == "75.157.111.0/24"
+    assert subnet_key(" 75.157.111.200 ") == "75.157.111.0/24"
+    assert subnet_key("2001:db8:1234:5678::1") == "2001:db8:1234::/48"
+    assert subnet_key("2001:db8:1234:ffff::2") == "2001:db8:1234::/48"
+    assert subnet_key("2001:db8:1235::1") == "2001:db8:1235::/48"
+    assert subnet_key("not an ip") == "not an ip"
+
+
+def test_neighbours_share_one_entry(db_path, clock):
+    cache = GeoLocationCache(db_path=db_path)
+    loader = Loader()
+
+    assert cache.get("75.157.111.33", loader) == VANCOUVER
+    assert cache.get("75.157.111.34", loader) == VANCOUVER
+    # the client is the first address of an X-Forwarded-For chain
+    assert cache.get("75.157.111.35, 10.0.0.1", loader) == VANCOUVER
+    assert cache.get("2001:db8:1234:5678::1", loader) == VANCOUVER
+    assert cache.get("2001:db8:1234:9999::1", loader) == VANCOUVER
+    assert loader.calls == ["75.157.111.33", "2001:db8:1234:5678::1"]
+    assert cache.stats()["hits"] == 3
+
+
+def test_exact_keys_without_subnets(db_path, clock):
+    cache = GeoLocationCache(db_path=db_path, use_subnet=False)
+    loader = Loader()
+    cache.get("75.157.111.33", loader)
+    cache.get("75.157.111.34", loader)
+
+    assert loader.calls == ["75.157.111.33", "75.157.111.34"]
+
+
+def test_least_recently_used_entries_are_evicted(db_path, clock):
+    cache = GeoLocationCache(maxsize=2, db_path=db_path)
+    loader = Loader()
+    cache.get("10.0.1.1", loader)
+    cache.get("10.0.2.1", loader)
+    cache.get("10.0.1.1", loader)
+    cache.get("10.0.3.1", loader)
+
+    assert cache.stats()["size"] == 2
+    assert list(cache._entries) == ["10.0.1.0/24", "10.0.3.0/24"]
+    # the evicted entry comes back from SQLite, not the loader
+    assert cache.get("10.0.2.1", loader) == VANCOUVER
+    assert loader.calls == ["10.0.1.1", "10.0.2.1", "10.0.3.1"]
+    assert cache.stats()["db_hits"] == 1
+
+
+def test_persisted_rows_are_shared_and_expire(db_path, clock):
+    GeoLocationCache(db_path=db_path, ttl=100).get("75.157.111.33", Loader())
+    # another process, with an empty in-memory tier
+    other = GeoLocationCache(db_path=db_path, ttl=100)
+    loader = Loader(dict(VANCOUVER, city="Burnaby"))
+
+    assert other.get("75.157.111.40", loader)["city"] == "Vancouver"
+    clock.now = NOW + 101
+    other.clear()
+    assert other.get("75.157.111.40", loader)["city"] == "Burnaby"
+    assert loader.calls == ["75.157.111.40"]
+
+
+def test_failed_lookups_expire_sooner_and_errors_are_not_cached(db_path, clock):
+    cache = GeoLocationCache(db_path=db_path, ttl=1000, negative_ttl=10)
+    failed = Loader({"status": "fail", "message": "private range"})
+    cache.get("10.0.0.1", failed)
+    cache.get("10.0.0.1", failed)
+    assert len(failed.calls) == 1
+    clock.now = NOW + 11
+    cache.get("10.0.0.1", failed)
+    assert len(failed.calls) == 2
+
+    limited = Loader({"status": "error", "message": "rate limited"})
+    cache.get("10.0.9.1", limited)
+    cache.get("10.0.9.1", limited)
+    assert len(limited.calls) == 2
+
+
+def test_expired_rows_are_pruned(db_path, clock, conn, monkeypatch):
+    monkeypatch.setattr(geo_cache_module, "PRUNE_EVERY", 2)
+    cache = GeoLocationCache(db_path=db_path, ttl=100)
+    cache.get("10.0.1.1", Loader())
+    clock.now = NOW + 101
+    cache.get("10.0.2.1", Loader())
+
+    assert [row[0] for row in conn.execute('SELECT key FROM ip_locations')] == ["10.0.2.0/24"]
@@ -0,0 +1,82 @@
+import sys
+import threading
+import zoneinfo
+
+from hourly_forecast import HourlyForecast
+
+TZ = zoneinfo.ZoneInfo("Europe/London")
+
+
+def make_hourly(hours=48):
+    return {
+        "time": [f"2026-10-{18 + h // 24:02d}T{h % 24:02d}:00" for h in range(hours)],
+        "temperature_2m": [10.0 + h for h in range(hours)],
+        "wind_speed_10m": [float(h) for h in range(hours)],
+        "wind_direction_10m": [(h * 15) % 360 for h in range(hours)],
+        "weather_code": [0] * hours,
+        "is_day": [1] * hours,
+    }
+
+
+def test_windows_only_derive_their_hours():
+    forecast = HourlyForecast.from_openmeteo(make_hourly(), TZ)
+    window = forecast[30:34]
+    assert [row.original_time for row in window] == [f"2026-10-19T{h:02d}:00" for h in range(6, 10)]
+    derived = forecast._derived[0]
+    assert derived["range"] == (30, 34)
+    assert derived["time"][29] is None and derived["time"][34] is None
+
+    # a later window on either side fills the gap in between
+    assert [row.temperature for row in forecast[20:22]] == [30.0, 31.0]
+    derived = forecast._derived[0]
+    assert derived["range"] == (20, 34)
+    assert None not in derived["time"][20:34]
+    assert [row.windspeed for row in forecast[40:42]] == [40.0, 41.0]
+    assert forecast._derived[0]["range"] == (20, 42)
+
+
+def test_concurrent_first_renders_see_complete_rows():
+    # switch threads as often as possible, so the renders interleave inside derived()
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        render_concurrently()
+    finally:
+        sys.setswitchinterval(interval)
+
+
+def render_concurrently():
+    windows = [(start, start + 4) for start in range(0, 44, 2)]
+    for _ in range(50):
+        forecast = HourlyForecast.from_openmeteo(make_hourly(), TZ)
+        barrier = threading.Barrier(len(windows))
+        results = {}
+
+        def render(window):
+            barrier.wait()
+            results[window] = [row.temperature for row in forecast[window[0]:window[1]]]
+
+        threads = [threading.Thread(target=render, args=(window,)) for window in windows]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert len(results) == len(windows)
+        for (start, stop), temperatures in results.items():
+            assert temperatures == [10.0 + h for h in range(start, stop)]
+
+
+def test_rows_match_the_open_meteo_dict():
+    hourly = make_hourly()
+    hourly["temperature_2m"][47] = None
+    hourly["wind_direction_10m"][47] = None
+    forecast = HourlyForecast.from_openmeteo(hourly, TZ)
+
+    rows = [row.as_dict() for row in forecast[44:]]
+    assert [row["original_time"] for row in rows] == hourly["time"][44:]
+    assert rows[-1]["temperature"] is None
+    assert rows[-1]["winddirection"] is None
+    assert rows[-1]["cardinal"] is None
+    assert rows[0]["temperature"] == hourly["temperature_2m"][44]
+    assert forecast["temperature_2m"][47] is None
+    assert forecast.to_dict()["time"] == hourly["time"]
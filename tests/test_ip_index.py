@@ -0,0 +1,71 @@
+import gzip
+
+import pytest
+
+from ip_index import IPRangeIndex, ip_to_int, load_index
+
+CSV = """start_ip,end_ip,city,country,lat,lon,timezone
+75.157.0.0,75.157.255.255,Vancouver,CA,49.28,-123.12,America/Vancouver
+81.2.69.0,81.2.69.255,London,GB,51.51,-0.13,Europe/London
+1360052224,1360052479,Vancouver,CA,49.28,-123.12,America/Vancouver
+2001:db8::,2001:db8:ffff:ffff:ffff:ffff:ffff:ffff,Sydney,AU,-33.87,151.21,Australia/Sydney
+"""
+
+
+@pytest.fixture
+def index(tmp_path):
+    path = tmp_path / "ranges.csv"
+    path.write_text(CSV, encoding="utf-8")
+    return IPRangeIndex.from_csv(str(path))
+
+
+def test_ip_to_int():
+    assert ip_to_int("0.0.0.1") == 1
+    assert ip_to_int(" 1360052224 ") == 1360052224
+    assert ip_to_int("::1") == 1
+
+
+def test_range_edges_are_inclusive(index):
+    assert index.lookup("75.157.0.0")["city"] == "Vancouver"
+    assert index.lookup("75.157.255.255")["city"] == "Vancouver"
+    assert index.lookup("81.2.69.0")["city"] == "London"
+    assert index.lookup("81.2.69.255")["city"] == "London"
+
+
+def test_addresses_outside_every_range(index):
+    # before the first range, between two ranges and after the last one
+    assert index.lookup("1.1.1.1") is None
+    assert index.lookup("75.158.0.0") is None
+    assert index.lookup("75.156.255.255") is None
+    assert index.lookup("81.2.70.0") is None
+    assert index.lookup("255.255.255.255") is None
+    assert index.lookup("2001:db9::1") is None
+    assert index.lookup("::1") is None
+
+
+def test_lookup_shape(index):
+    location = index.lookup("81.2.69.160, 10.0.0.1")
+    assert location == {"status": "success", "city": "London", "country": "GB", "lat": 51.51, "lon": -0.13,
+                        "query": "81.2.69.160", "source": "local", "timezone": "Europe/London"}
+    assert index.lookup("not an ip") is None
+    assert index.lookup(None) is None
+
+
+def test_integer_ranges_and_ipv6(index):
+    # 1360052224 is 81.16.192.0
+    assert index.lookup("81.16.192.255")["city"] == "Vancouver"
+    assert index.lookup("2001:db8:1234::1")["city"] == "Sydney"
+    assert len(index) == 4
+    # the two Vancouver ranges share one location
+    assert len(index.locations) == 3
+
+
+def test_empty_timezone_is_left_out(tmp_path):
+    path = tmp_path / "ranges.csv.gz"
+    with gzip.open(path, "wt", encoding="utf-8") as f:
+        f.write("start_ip,end_ip,city,country,lat,lon,timezone\n10.0.0.0,10.0.0.255,Nowhere,XX,0,0,\n")
+    index = load_index(str(path))
+
+    assert "timezone" not in index.lookup("10.0.0.7")
+    assert load_index(None) is None
+    assert load_index(str(tmp_path / "missing.csv")) is None
@@ -0,0 +1,105 @@
+import json
+import sqlite3
+
+import pytest
+
+import db
+import migrations
+from migrations import INITIAL_SCHEMA, MIGRATIONS, check_query_plans, migrate
+from snapshots import decompress
+
+LATEST = MIGRATIONS[-1][0]
+WEATHER = {"current": {"time": "2026-10-18T09:00", "temperature_2m": 12.5}}
+
+
+@pytest.fixture
+def legacy_db(tmp_path):
+    """
+    A database as db_init.py created it before migrations existed, with some data.
+    """
+    path = str(tmp_path / "weather.db")
+    conn = sqlite3.connect(path)
+    for statement in INITIAL_SCHEMA:
+        conn.execute(statement)
+    conn.execute("INSERT INTO cities (name, slug, timezone, lat, lon) VALUES ('London', 'london', 'Europe/London', 51.5, -0.13)")
+    conn.execute("INSERT INTO styles (name, position) VALUES ('Plain', 0), ('Pirate', 1)")
+    conn.execute("INSERT INTO users (username, password_hash) VALUES ('ann', 'x')")
+    for style_id, user_id in ((1, None), (2, 1)):
+        conn.execute('''INSERT INTO weather_reports (user_id, city_id, style_id, time_period, date, weather_json, report_text)
+                     VALUES (?, 1, ?, 'morning', '2026-10-18', ?, ?)''', (user_id, style_id, json.dumps(WEATHER), f"report {style_id}"))
+    conn.commit()
+    conn.close()
+    yield path
+    db.get_pool(path).close_all()
+
+
+def test_upgrades_an_existing_database_in_place(legacy_db):
+    conn = db.connect(legacy_db)
+    try:
+        assert migrate(conn, log=lambda msg: None) == LATEST
+
+        rows = conn.execute('SELECT user_id, style_id, report_text, snapshot_id FROM weather_reports ORDER BY id').fetchall()
+        assert [tuple(row)[:3] for row in rows] == [(None, 1, "report 1"), (1, 2, "report 2")]
+        # both reports had the same forecast, it is stored once
+        assert rows[0]["snapshot_id"] == rows[1]["snapshot_id"]
+        assert conn.execute('SELECT COUNT(*) FROM weather_snapshots').fetchone()[0] == 1
+        data = conn.execute('SELECT data FROM weather_snapshots WHERE id = ?', (rows[0]["snapshot_id"],)).fetchone()[0]
+        assert json.loads(decompress(data)) == WEATHER
+        assert "weather_json" not in [row[1] for row in conn.execute('PRAGMA table_info(weather_reports)')]
+        assert tuple(conn.execute('SELECT country, population FROM cities').fetchone()) == (None, None)
+        assert check_query_plans(conn) == []
+    finally:
+        conn.discard()
+
+
+def test_is_a_no_op_when_up_to_date(legacy_db):
+    conn = db.connect(legacy_db)
+    try:
+        migrate(conn, log=lambda msg: None)
+        applied = []
+        assert migrate(conn, log=applied.append) == LATEST
+        assert applied == []
+        assert conn.execute('SELECT COUNT(*) FROM schema_version').fetchone()[0] == len(MIGRATIONS)
+    finally:
+        conn.discard()
+
+
+def test_user_and_shared_reports_no_longer_collide(legacy_db):
+    conn = db.connect(legacy_db)
+    try:
+        migrate(conn, log=lambda msg: None)
+        snapshot_id = conn.execute('SELECT snapshot_id FROM weather_reports').fetchone()[0]
+        # a user's report for the shared report's city, style, period and date
+        conn.execute('''INSERT INTO weather_reports (user_id, city_id, style_id, time_period, date, snapshot_id, report_text)
+                     VALUES (1, 1, 1, 'morning', '2026-10-18', ?, 'mine')''', (snapshot_id,))
+        with pytest.raises(sqlite3.IntegrityError):
+            conn.execute('''INSERT INTO weather_reports (user_id, city_id, style_id, time_period, date, snapshot_id, report_text)
+                         VALUES (NULL, 1, 1, 'morning', '2026-10-18', ?, 'second shared')''', (snapshot_id,))
+    finally:
+        conn.discard()
+
+
+def test_a_failing_migration_leaves_the_database_as_it_was(legacy_db, monkeypatch):
+    monkeypatch.setattr(migrations, "MIGRATIONS", MIGRATIONS + [(LATEST + 1, "broken", ['CREATE TABLE broken (', ])])
+    conn = db.connect(legacy_db)
+    try:
+        with pytest.raises(sqlite3.Error):
+            migrate(conn, log=lambda msg: None)
+        # not even the earlier migrations of the run were applied
+        assert conn.execute("SELECT COUNT(*) FROM sqlite_master WHERE name IN ('schema_version', 'weather_snapshots')").fetchone()[0] == 0
+        assert conn.execute('SELECT COUNT(*) FROM weather_reports WHERE weather_json IS NOT NULL').fetchone()[0] == 2
+    finally:
+        conn.discard()
+
+
+def test_query_plan_check_wants_the_intended_index(conn):
+    assert check_query_plans(conn) == []
+    # an OR over both partial indexes without style_id is planned on the date index
+    query = ('''SELECT report_text FROM weather_reports
+        WHERE (user_id = ? OR user_id IS NULL) AND city_id = ? AND date = ? AND time_period = ?''',
+             [migrations.USER, migrations.SHARED])
+    assert [sql for sql, _ in check_query_plans(conn, [query])] == [query[0]]
+    # a covering index is required where one is listed
+    query = ('SELECT report_text FROM weather_reports WHERE user_id = ? AND city_id = ? AND style_id = ? AND time_period = ? AND date = ?',
+             ["COVERING INDEX " + migrations.USER])
+    assert len(check_query_plans(conn, [query])) == 1
@@ -0,0 +1,103 @@
+import gzip
+
+import pytest
+from flask import Flask
+
+from page_cache import GZIP_MIN_SIZE, PageCache, page_response, render_json, render_page
+
+BIG = "<p>" + "sunny " * GZIP_MIN_SIZE + "</p>"
+
+
+@pytest.fixture
+def client():
+    app = Flask(__name__)
+    pages = {"big": render_page(BIG), "small": render_page("<p>sunny</p>"), "json": render_json({"temperature_2m": 12.5})}
+
+    @app.route("/<name>")
+    def page(name):
+        return page_response(pages[name], mimetype="application/json" if name == "json" else "text/html")
+
+    return app.test_client()
+
+
+def test_render_page_compresses_only_large_bodies():
+    big, small = render_page(BIG), render_page("<p>sunny</p>")
+
+    assert gzip.decompress(big.gzipped) == BIG.encode()
+    assert small.gzipped is None
+    assert render_page(BIG, compress=False).gzipped is None
+    # the ETag depends on the body only
+    assert render_page(BIG).etag == big.etag != small.etag
+
+
+def test_etag_and_304(client):
+    resp = client.get("/small")
+    etag = resp.headers["ETag"]
+
+    assert resp.status_code == 200 and resp.data == b"<p>sunny</p>"
+    assert resp.headers["Cache-Control"] == "private, no-cache"
+    assert set(resp.headers["Vary"].replace(" ", "").split(",")) == {"Accept-Encoding", "Cookie"}
+
+    resp = client.get("/small", headers={"If-None-Match": etag})
+    assert resp.status_code == 304 and resp.data == b""
+    assert resp.headers["ETag"] == etag
+
+    assert client.get("/small", headers={"If-None-Match": '"something-else"'}).status_code == 200
+
+
+def test_gzip_representation_has_its_own_etag(client):
+    plain = client.get("/big")
+    zipped = client.get("/big", headers={"Accept-Encoding": "gzip"})
+
+    assert "Content-Encoding" not in plain.headers
+    assert zipped.headers["Content-Encoding"] == "gzip"
+    assert gzip.decompress(zipped.data) == plain.data
+    assert zipped.headers["ETag"] != plain.headers["ETag"]
+    assert client.get("/big", headers={"Accept-Encoding": "gzip", "If-None-Match": zipped.headers["ETag"]}).status_code == 304
+    # the plain ETag doesn't match the gzipped representation
+    assert client.get("/big", headers={"Accept-Encoding": "gzip", "If-None-Match": plain.headers["ETag"]}).status_code == 200
+
+
+def test_json_pages(client):
+    resp = client.get("/json")
+
+    assert resp.mimetype == "application/json"
+    assert resp.get_json() == {"temperature_2m": 12.5}
+    assert client.get("/json", headers={"If-None-Match": resp.headers["ETag"]}).status_code == 304
+
+
+def test_entries_are_valid_only_for_their_source():
+    cache = PageCache()
+    forecast = {"hourly": []}
+    cache.put("london", forecast, "page")
+
+    assert cache.get("london", forecast) == "page"
+    # an equal but new forecast object is new data
+    assert cache.get("london", {"hourly": []}) is None
+    assert cache.stats() == {"hits": 1, "misses": 1, "size": 1}
+
+
+def test_get_or_render_renders_once():
+    cache = PageCache()
+    source = object()
+    renders = []
+
+    def render():
+        renders.append(1)
+        return "page"
+
+    assert cache.get_or_render("key", source, render) == "page"
+    assert cache.get_or_render("key", source, render) == "page"
+    assert renders == [1]
+
+
+def test_least_recently_used_entries_are_evicted():
+    cache = PageCache(maxsize=2)
+    source = object()
+    cache.put("a", source, 1)
+    cache.put("b", source, 2)
+    cache.get("a", source)
+    cache.put("c", source, 3)
+
+    assert cache.get("b", source) is None
+    assert cache.get("a", source) == 1 and cache.get("c", source) == 3
@@ -0,0 +1,51 @@
+import json
+from datetime import datetime
+
+import pregenerate
+from conftest import add_city, add_style
+from db import get_pool
+from snapshots import decompress
+
+WEATHER = {"latitude": 51.5, "longitude": -0.13, "current": {"temperature_2m": 12.5}}
+
+
+def stub_run(monkeypatch, db_path, report="<p>Mild and grey.</p>"):
+    calls = []
+
+    def llm(city, weather, style, time_period=None, now=None):
+        calls.append((city, style, time_period))
+        return report
+
+    monkeypatch.setattr(pregenerate, "get_db", lambda: get_pool(db_path).acquire())
+    monkeypatch.setattr(pregenerate, "get_weather", lambda city, timezone_str: WEATHER)
+    monkeypatch.setattr(pregenerate, "call_llm_api", llm)
+    return calls
+
+
+def jobs_for(conn):
+    city, style = add_city(conn), add_style(conn)
+    return [(city, style, "morning", "2026-10-18", datetime(2026, 10, 18, 6))]
+
+
+def test_run_batch_stores_report_and_snapshot(monkeypatch, db_path, conn):
+    calls = stub_run(monkeypatch, db_path)
+    jobs = jobs_for(conn)
+
+    assert pregenerate.run_batch(jobs, workers=2, rate=0, log=lambda msg: None) == (1, 0)
+
+    assert calls == [("London", "Plain", "morning")]
+    row = conn.execute('''SELECT user_id, time_period, date, snapshot_id, report_text
+                       FROM weather_reports''').fetchone()
+    assert tuple(row)[:3] == (None, "morning", "2026-10-18")
+    assert row["report_text"] == "<p>Mild and grey.</p>"
+    data = conn.execute('SELECT data FROM weather_snapshots WHERE id = ?', (row["snapshot_id"],)).fetchone()[0]
+    assert json.loads(decompress(data)) == WEATHER
+
+
+def test_run_batch_does_not_store_llm_errors(monkeypatch, db_path, conn):
+    stub_run(monkeypatch, db_path, report="[Gemini API exception]: quota exceeded")
+    jobs = jobs_for(conn)
+
+    assert pregenerate.run_batch(jobs, workers=1, rate=0, log=lambda msg: None) == (0, 1)
+    assert conn.execute('SELECT COUNT(*) FROM weather_reports').fetchone()[0] == 0
+    assert conn.execute('SELECT COUNT(*) FROM weather_snapshots').fetchone()[0] == 0
@@ -0,0 +1,41 @@
+import zoneinfo
+from datetime import datetime
+
+from hourly_forecast import HourlyForecast
+from prompt_builder import build_weather_table
+
+
+def make_hourly():
+    times = [f"2026-10-18T{h:02d}:00" for h in range(24)]
+    return {
+        "time": times,
+        "temperature_2m": [12.5] * 24,
+        "wind_speed_10m": [10.4] * 24,
+        "wind_direction_10m": [225] * 24,
+        "weather_code": [2] * 24,
+        "is_day": [1] * 24,
+    }
+
+
+def test_table_lists_the_period_hours():
+    table = build_weather_table({"hourly": make_hourly()}, "morning", datetime(2026, 10, 18, 7))
+    lines = table.splitlines()
+    assert lines[1] == "2026-10-18 Sunday"
+    assert lines[2].startswith("06:00 12.5C 10km/h SW ")
+    assert lines[-1].startswith("22:00 ")
+
+
+def test_null_hours_are_written_as_unknown():
+    hourly = make_hourly()
+    for name in ("temperature_2m", "wind_speed_10m", "wind_direction_10m", "weather_code"):
+        hourly[name][8] = None
+    now = datetime(2026, 10, 18, 7)
+    expected = "08:00 ?C ?km/h ? unknown"
+
+    table = build_weather_table({"hourly": hourly}, "morning", now)
+    assert expected in table.splitlines()
+
+    # the same hour read back from the columnar forecast
+    forecast = HourlyForecast.from_openmeteo(hourly, zoneinfo.ZoneInfo("Europe/London"))
+    table = build_weather_table({"hourly": forecast}, "morning", now)
+    assert expected in table.splitlines()
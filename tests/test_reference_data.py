@@ -0,0 +1,77 @@
+import threading
+import time
+
+import reference_data as reference_data_module
+from conftest import add_city, add_style
+from reference_data import ReferenceCache
+
+
+def test_first_get_loads_the_snapshot(db_path, conn):
+    add_city(conn, "London")
+    add_style(conn, "Plain")
+    data = ReferenceCache(db_path=db_path).get()
+
+    assert [city["name"] for city in data.cities] == ["London"]
+    assert data.cities_by_slug["london"]["timezone"] == "Europe/London"
+    assert data.style_names == ("Plain",)
+    assert [city["name"] for city in data.search_index.search("lon")] == ["London"]
+
+
+def test_changes_are_reloaded_in_the_background(db_path, conn, monkeypatch):
+    add_city(conn, "London")
+    cache = ReferenceCache(check_interval=0, db_path=db_path)
+    old = cache.get()
+
+    started, release = threading.Event(), threading.Event()
+    load = reference_data_module.load_reference_data
+
+    def slow_load(conn):
+        started.set()
+        release.wait(5)
+        return load(conn)
+
+    monkeypatch.setattr(reference_data_module, "load_reference_data", slow_load)
+    add_city(conn, "Paris", timezone="Europe/Paris", lat=48.86, lon=2.35)
+
+    # the request that notices the change, and the ones after it, get the old snapshot right away
+    begin = time.monotonic()
+    assert cache.get() is old
+    assert started.wait(5)
+    assert cache.get() is old
+    assert time.monotonic() - begin < 1
+
+    release.set()
+    deadline = time.monotonic() + 5
+    while cache.get() is old and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert [city["name"] for city in cache.get().cities] == ["London", "Paris"]
+
+
+def test_unchanged_version_keeps_the_snapshot(db_path, conn):
+    add_city(conn, "London")
+    cache = ReferenceCache(check_interval=0, db_path=db_path)
+    data = cache.get()
+
+    assert cache.get() is data
+
+
+def test_failed_reload_keeps_serving_the_old_snapshot(db_path, conn, monkeypatch):
+    add_city(conn, "London")
+    cache = ReferenceCache(check_interval=0, db_path=db_path)
+    old = cache.get()
+    failed = threading.Event()
+
+    def broken_load(conn):
+        failed.set()
+        raise RuntimeError("bad row")
+
+    monkeypatch.setattr(reference_data_module, "load_reference_data", broken_load)
+    add_city(conn, "Paris", timezone="Europe/Paris", lat=48.86, lon=2.35)
+    assert cache.get() is old
+    assert failed.wait(5)
+
+    monkeypatch.undo()
+    deadline = time.monotonic() + 5
+    while cache.get() is old and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert len(cache.get().cities) == 2
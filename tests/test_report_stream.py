@@ -0,0 +1,122 @@
+import json
+import threading
+import time
+
+import pytest
+
+from conftest import add_city, add_style, add_user
+from helpers import LLMError
+from reference_data import reference_data
+from singleflight import report_flight
+
+WEATHER = {"current": {"time": "2026-10-18T09:00", "temperature_2m": 12.5}}
+
+
+@pytest.fixture
+def report_setup(app_module, app_conn, monkeypatch, request):
+    name = request.node.name
+    city = add_city(app_conn, name=f"City {name}")
+    style = add_style(app_conn, name=f"Style {name}", position=1)
+    user_id = add_user(app_conn, f"user-{name}")
+    reference_data.reload()
+    monkeypatch.setattr(app_module, "get_weather", lambda city, timezone_str: WEATHER)
+
+    client = app_module.app.test_client()
+    with client.session_transaction() as sess:
+        sess["user_id"] = user_id
+    return client, city, style, user_id
+
+
+def stream(client, city, style):
+    return client.post("/generate_report/stream", json={"city_id": city["id"], "style_id": style["id"]})
+
+
+def events(response):
+    """
+    [(event, data)] of a Server-Sent Events body.
+    """
+    parsed = []
+    for raw in response.get_data(as_text=True).split("\n\n"):
+        if not raw:
+            continue
+        event = "message"
+        for line in raw.split("\n"):
+            if line.startswith("event: "):
+                event = line[len("event: "):]
+            elif line.startswith("data: "):
+                data = json.loads(line[len("data: "):])
+        parsed.append((event, data))
+    return parsed
+
+
+def stored_reports(conn, user_id, city):
+    rows = conn.execute('SELECT report_text FROM weather_reports WHERE user_id = ? AND city_id = ?',
+                        (user_id, city["id"])).fetchall()
+    return [row[0] for row in rows]
+
+
+def test_stream_stores_the_whole_report(app_module, app_conn, report_setup, monkeypatch):
+    client, city, style, user_id = report_setup
+    monkeypatch.setattr(app_module, "stream_llm_api", lambda *args: iter(["<h1>Dry</h1>", "<p>and mild</p>"]))
+
+    assert events(stream(client, city, style)) == [
+        ("message", {"chunk": "<h1>Dry</h1>"}),
+        ("message", {"chunk": "<p>and mild</p>"}),
+        ("done", {"report": "<h1>Dry</h1><p>and mild</p>"}),
+    ]
+    assert stored_reports(app_conn, user_id, city) == ["<h1>Dry</h1><p>and mild</p>"]
+
+
+def test_stream_failing_halfway_keeps_the_stored_report(app_module, app_conn, report_setup, monkeypatch):
+    client, city, style, user_id = report_setup
+    monkeypatch.setattr(app_module, "stream_llm_api", lambda *args: iter(["<h1>Dry</h1>"]))
+    stream(client, city, style).get_data()
+
+    def failing(*args):
+        yield "<h1>Wet</h1>"
+        raise LLMError("Gemini API exception: connection reset")
+
+    monkeypatch.setattr(app_module, "stream_llm_api", failing)
+    assert events(stream(client, city, style)) == [
+        ("message", {"chunk": "<h1>Wet</h1>"}),
+        ("error", {"error": "Gemini API exception: connection reset"}),
+    ]
+    assert stored_reports(app_conn, user_id, city) == ["<h1>Dry</h1>"]
+
+
+def test_concurrent_streams_share_one_generation(app_module, app_conn, report_setup, monkeypatch):
+    client, city, style, user_id = report_setup
+    calls = []
+    release = threading.Event()
+
+    def slow(*args):
+        calls.append(args)
+        release.wait(5)
+        yield "<p>Shared</p>"
+
+    monkeypatch.setattr(app_module, "stream_llm_api", slow)
+    waiters = report_flight.stats()["waiters"]
+    responses = [None, None]
+
+    def request(i):
+        other = app_module.app.test_client()
+        with other.session_transaction() as sess:
+            sess["user_id"] = user_id
+        responses[i] = events(stream(other, city, style))
+
+    threads = [threading.Thread(target=request, args=(i,)) for i in range(2)]
+    for thread in threads:
+        thread.start()
+    # the second request waits for the first one's generation
+    deadline = time.monotonic() + 5
+    while report_flight.stats()["waiters"] == waiters and time.monotonic() < deadline:
+        time.sleep(0.01)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert sorted(responses) == [
+        [("message", {"chunk": "<p>Shared</p>"}), ("done", {"report": "<p>Shared</p>"})],
+    ] * 2
+    assert stored_reports(app_conn, user_id, city) == ["<p>Shared</p>"]
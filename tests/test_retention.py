@@ -0,0 +1,55 @@
+import gzip
+import json
+import time
+from datetime import datetime, timedelta, timezone
+
+import retention
+from conftest import add_city, add_style
+from retention import RetentionScheduler, apply_retention, archive_path, retention_cutoff
+from singleflight import SingleFlight
+from snapshots import store_snapshot
+
+
+def test_cutoff_is_a_day_before_utc():
+    # just after midnight on a server in UTC+10 it is still the 17th in UTC
+    now = datetime(2026, 10, 18, 0, 30, tzinfo=timezone(timedelta(hours=10)))
+    assert retention_cutoff(30, now) == "2026-09-16"
+
+
+def test_reports_within_the_window_in_any_timezone_are_kept(conn, tmp_path):
+    city = add_city(conn)
+    style = add_style(conn)
+    snapshot_id = store_snapshot(conn, {"current": {"temperature_2m": 12}})
+    today = datetime.now(timezone.utc).date()
+    # the oldest date that is still inside 30 days for a city ahead of UTC, and the day before it
+    kept = (today - timedelta(days=31)).isoformat()
+    expired = (today - timedelta(days=32)).isoformat()
+    for report_date in (kept, expired):
+        conn.execute('''INSERT INTO weather_reports (city_id, style_id, time_period, date, snapshot_id, report_text)
+            VALUES (?, ?, 'morning', ?, ?, 'report')''', (city["id"], style["id"], report_date, snapshot_id))
+    conn.commit()
+
+    assert apply_retention(days=30, archive_dir=str(tmp_path), log=lambda msg: None, conn=conn) == 1
+    assert [row[0] for row in conn.execute('SELECT date FROM weather_reports')] == [kept]
+    with gzip.open(archive_path(str(tmp_path), expired), "rt", encoding="utf-8") as f:
+        archived = [json.loads(line) for line in f]
+    assert [row["date"] for row in archived] == [expired]
+    assert archived[0]["weather"] == {"current": {"temperature_2m": 12}}
+
+
+def test_scheduler_skips_the_run_another_process_holds(db_path, conn, monkeypatch):
+    monkeypatch.setattr(retention, "report_flight", SingleFlight(db_path=db_path))
+    runs = []
+    monkeypatch.setattr(retention, "apply_retention", lambda log: runs.append(1) or 0)
+    conn.execute('INSERT INTO leases (key, owner, expires_at) VALUES (?, ?, ?)', ("retention", "other", time.time() + 60))
+    conn.commit()
+    scheduler = RetentionScheduler(interval=3600, lease_ttl=7200)
+
+    assert scheduler.run_once() is None
+    conn.execute('DELETE FROM leases')
+    conn.commit()
+    assert scheduler.run_once() == 0
+    # this process ran it, the others skip until the next interval
+    assert scheduler.run_once() is None
+    assert runs == [1]
+    assert conn.execute('SELECT expires_at FROM leases').fetchone()[0] > time.time() + 3500
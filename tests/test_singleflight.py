@@ -0,0 +1,112 @@
+import threading
+import time
+
+import pytest
+
+from singleflight import SingleFlight
+
+
+@pytest.fixture
+def flight(db_path):
+    return SingleFlight(db_path=db_path, lease_ttl=5, poll_interval=0.01)
+
+
+def test_concurrent_callers_share_one_generation(flight):
+    calls = []
+    release = threading.Event()
+
+    def generate():
+        calls.append(1)
+        release.wait(5)
+        return "report"
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(flight.do("key", generate))) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    deadline = time.monotonic() + 5
+    while flight.stats()["waiters"] < 4 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert calls == [1]
+    assert results == ["report"] * 5
+    assert flight.stats() == {"leaders": 1, "waiters": 4, "remote_waits": 0}
+
+
+def test_the_leaders_error_reaches_the_waiters(flight):
+    release = threading.Event()
+
+    def generate():
+        release.wait(5)
+        raise RuntimeError("upstream down")
+
+    errors = []
+
+    def call():
+        try:
+            flight.do("key", generate)
+        except RuntimeError as e:
+            errors.append(str(e))
+
+    threads = [threading.Thread(target=call) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    deadline = time.monotonic() + 5
+    while flight.stats()["waiters"] < 1 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert errors == ["upstream down"] * 2
+    # the key is free again
+    assert flight.do("key", lambda: "retry") == "retry"
+
+
+def test_waits_for_a_lease_held_by_another_process(flight, conn):
+    conn.execute('INSERT INTO leases (key, owner, expires_at) VALUES (?, ?, ?)', ("key", "other", time.time() + 5))
+    conn.commit()
+    stored = []
+    # the other process stores its result a little later
+    threading.Timer(0.1, stored.append, ("theirs",)).start()
+
+    result = flight.do("key", lambda: "ours", lambda: stored[0] if stored else None)
+
+    assert result == "theirs"
+    assert flight.stats()["remote_waits"] == 1
+
+
+def test_takes_over_an_expired_lease(flight, conn):
+    conn.execute('INSERT INTO leases (key, owner, expires_at) VALUES (?, ?, ?)', ("key", "crashed", time.time() - 1))
+    conn.commit()
+
+    assert flight.do("key", lambda: "ours") == "ours"
+    # and releases it when done
+    assert conn.execute('SELECT COUNT(*) FROM leases').fetchone()[0] == 0
+
+
+def test_skips_generation_when_the_result_is_already_stored(flight):
+    assert flight.do("key", lambda: pytest.fail("generated"), lambda: "stored") == "stored"
+
+
+def test_run_exclusive_skips_while_the_lease_is_held(flight, conn):
+    conn.execute('INSERT INTO leases (key, owner, expires_at) VALUES (?, ?, ?)', ("job", "other", time.time() + 5))
+    conn.commit()
+
+    assert flight.run_exclusive("job", lambda: pytest.fail("ran"), ttl=60) is None
+
+
+def test_run_exclusive_holds_the_lease_after_the_run(flight, conn):
+    assert flight.run_exclusive("job", lambda: "done", ttl=60, hold=30) == "done"
+    expires_at = conn.execute('SELECT expires_at FROM leases WHERE key = ?', ("job",)).fetchone()[0]
+    assert time.time() + 25 < expires_at <= time.time() + 30
+    assert flight.run_exclusive("job", lambda: pytest.fail("ran again"), ttl=60, hold=30) is None
+
+
+def test_run_exclusive_releases_the_lease_without_hold(flight, conn):
+    assert flight.run_exclusive("job", lambda: 1, ttl=60) == 1
+    assert flight.run_exclusive("job", lambda: 2, ttl=60) == 2
+    assert conn.execute('SELECT COUNT(*) FROM leases').fetchone()[0] == 0
@@ -0,0 +1,67 @@
+import pytest
+
+from spatial import CityIndex, haversine_km, quantize, snap_location
+
+CITIES = [
+    {"name": "London", "lat": 51.5072, "lon": -0.1276, "timezone": "Europe/London"},
+    {"name": "Paris", "lat": 48.8566, "lon": 2.3522, "timezone": "Europe/Paris"},
+    {"name": "Suva", "lat": -18.1416, "lon": 178.4419, "timezone": "Pacific/Fiji"},
+]
+
+
+@pytest.fixture
+def index():
+    return CityIndex(CITIES)
+
+
+def test_haversine_london_paris():
+    assert haversine_km(51.5072, -0.1276, 48.8566, 2.3522) == pytest.approx(344, abs=1)
+
+
+def test_quantize_rounds_to_the_cell_centre():
+    assert quantize(49.2827, -123.1207) == (49.3, -123.1)
+    assert quantize(49.2499, -123.1499) == (49.2, -123.1)
+    assert quantize(-0.04, 0.04) == (-0.0, 0.0)
+    assert quantize(10.26, 20.74, step=0.5) == (10.5, 20.5)
+
+
+def test_nearest_city_within_the_radius(index):
+    city, distance = index.nearest(51.45, -0.05, 50)
+    assert city["name"] == "London"
+    assert distance < 10
+    # Reading is about 60 km from London
+    assert index.nearest(51.45, -0.97, 50) == (None, None)
+
+
+def test_nearest_looks_into_neighbouring_cells(index):
+    # just across the cell border from London, in the cell to the west and south
+    city, _ = index.nearest(50.99, -1.01, 100)
+    assert city["name"] == "London"
+
+
+def test_nearest_wraps_around_the_antimeridian(index):
+    city, distance = index.nearest(-18.2, -179.9, 300)
+    assert city["name"] == "Suva"
+    assert distance < 300
+
+
+def test_snap_to_a_nearby_city(index):
+    location, city = snap_location(51.45, -0.05, "Europe/Berlin", index)
+    assert city["name"] == "London"
+    assert location == {"lat": 51.5072, "lon": -0.1276, "timezone": "Europe/London"}
+
+
+def test_far_from_cities_snaps_to_the_grid(index):
+    location, city = snap_location(50.0317, 1.3142, "Europe/Paris", index)
+    assert city is None
+    assert location == {"lat": 50.0, "lon": 1.3, "timezone": "Europe/Paris"}
+
+
+def test_grid_cell_without_a_timezone_borrows_the_nearest_city(index):
+    location, _ = snap_location(50.0317, 1.3142, None, index)
+    assert location["timezone"] == "Europe/Paris"
+    # nothing within TIMEZONE_RADIUS_KM
+    location, _ = snap_location(0.0, -30.0, None, index)
+    assert location["timezone"] == "UTC"
+    location, _ = snap_location(0.0, -30.0, None)
+    assert location["timezone"] == "UTC"
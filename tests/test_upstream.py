@@ -0,0 +1,160 @@
+import json
+import os
+import subprocess
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+import helpers
+import upstream as upstream_module
+from upstream import BACKOFF_BASE, BACKOFF_MAX, UpstreamClient
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    # keep-alive, like the real APIs
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        self.server.connections += 1
+
+    def do_GET(self):
+        self.server.requests.append(self.path)
+        script = self.server.scripts.get(self.path.split("?")[0], [])
+        status, body, delay = script.pop(0) if len(script) > 1 else (script[0] if script else (404, {}, 0))
+        if delay:
+            # not time.sleep, the tests record the client's backoff sleeps
+            threading.Event().wait(delay)
+        data = json.dumps(body).encode()
+        try:
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+        except OSError:
+            # the client timed out and hung up
+            pass
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def stub():
+    """
+    A local HTTP server answering each path with its script of (status, json body, delay) responses.
+    The last response of a script repeats.
+    """
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    server.daemon_threads = True
+    server.scripts = {}
+    server.requests = []
+    server.connections = 0
+    server.url = f"http://127.0.0.1:{server.server_address[1]}"
+    thread = threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    # the backoff sleeps, recorded instead of slept
+    recorded = []
+    monkeypatch.setattr(upstream_module.time, "sleep", recorded.append)
+    return recorded
+
+
+def client_for(stub, retries=2, read_timeout=1.0):
+    return UpstreamClient({"stub": {"base_url": stub.url, "connect_timeout": 1.0, "read_timeout": read_timeout, "retries": retries}})
+
+
+def test_retries_5xx_with_backoff(stub, sleeps):
+    stub.scripts["/v1/forecast"] = [(503, {}, 0), (502, {}, 0), (200, {"ok": True}, 0)]
+    client = client_for(stub, retries=2)
+
+    resp = client.get("stub", "/v1/forecast")
+
+    assert resp.status_code == 200 and resp.json() == {"ok": True}
+    assert len(stub.requests) == 3
+    assert len(sleeps) == 2
+    assert all(0 <= slept <= min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt) for attempt, slept in enumerate(sleeps))
+    assert client.stats()["stub"]["retries"] == 2
+    assert client.stats()["stub"]["errors"] == 0
+
+
+def test_returns_last_5xx_when_retries_are_used_up(stub, sleeps):
+    stub.scripts["/json/1.2.3.4"] = [(503, {}, 0)]
+    client = client_for(stub, retries=1)
+
+    assert client.get("stub", "/json/1.2.3.4").status_code == 503
+    assert len(stub.requests) == 2
+    assert client.stats()["stub"]["errors"] == 1
+
+
+def test_rate_limit_is_not_retried(stub, sleeps):
+    stub.scripts["/json/1.2.3.4"] = [(429, {}, 0)]
+
+    assert client_for(stub).get("stub", "/json/1.2.3.4").status_code == 429
+    assert len(stub.requests) == 1
+    assert sleeps == []
+
+
+def test_read_timeout_is_retried_then_raised(stub, sleeps):
+    stub.scripts["/slow"] = [(200, {}, 0.5)]
+    client = client_for(stub, retries=1, read_timeout=0.1)
+
+    with pytest.raises(requests.Timeout):
+        client.get("stub", "/slow")
+    assert len(stub.requests) == 2
+    assert client.stats()["stub"]["errors"] == 1
+
+
+def test_read_timeout_then_success(stub, sleeps):
+    stub.scripts["/slow"] = [(200, {"late": True}, 0.5), (200, {"late": False}, 0)]
+
+    assert client_for(stub, retries=1, read_timeout=0.1).get("stub", "/slow").json() == {"late": False}
+
+
+def test_connection_refused_raises(sleeps):
+    client = UpstreamClient({"stub": {"base_url": "http://127.0.0.1:9", "connect_timeout": 0.5, "read_timeout": 0.5, "retries": 1}})
+
+    with pytest.raises(requests.ConnectionError):
+        client.get("stub", "/")
+    assert len(sleeps) == 1
+
+
+def test_keep_alive_connection_is_reused(stub):
+    stub.scripts["/v1/forecast"] = [(200, {}, 0)]
+    client = client_for(stub)
+
+    for _ in range(5):
+        assert client.get("stub", "/v1/forecast").status_code == 200
+    assert len(stub.requests) == 5
+    assert stub.connections == 1
+
+
+def test_helpers_call_the_configured_base_urls(stub, monkeypatch):
+    for name in ("open-meteo", "ip-api"):
+        monkeypatch.setitem(helpers.upstream.upstreams[name], "base_url", stub.url)
+    stub.scripts["/json/1.2.3.4"] = [(200, {"city": "Vancouver", "lat": 49.25, "lon": -123.1}, 0)]
+    stub.scripts["/v1/forecast"] = [(500, {}, 0)]
+    monkeypatch.setattr(upstream_module.time, "sleep", lambda seconds: None)
+
+    assert helpers.get_user_location("1.2.3.4")["city"] == "Vancouver"
+    # a failed forecast is an empty payload, not None
+    assert helpers.fetch_weather(49.25, -123.1, "America/Vancouver") == {}
+    assert stub.requests[1].startswith("/v1/forecast?latitude=49.25&longitude=-123.1&")
+
+
+def test_base_urls_from_environment():
+    env = dict(os.environ, OPEN_METEO_URL="http://127.0.0.1:8001", IP_API_URL="http://127.0.0.1:8002/")
+    code = "from upstream import upstream; print(upstream.url('open-meteo', '/v1/forecast'), upstream.url('ip-api', '/json/1'))"
+    out = subprocess.run([sys.executable, "-c", code], env=env, cwd=os.path.dirname(upstream_module.__file__),
+                         capture_output=True, text=True, check=True).stdout
+    assert out.split() == ["http://127.0.0.1:8001/v1/forecast", "http://127.0.0.1:8002/json/1"]
@@ -0,0 +1,130 @@
+import threading
+import time
+
+import pytest
+
+import helpers
+import warmer
+from warmer import CurrentWeatherWarmer, build_snapshot
+
+CITIES = [{"name": "London", "slug": "london", "timezone": "Europe/London", "lat": 51.5, "lon": -0.13},
+          {"name": "Paris", "slug": "paris", "timezone": "Europe/Paris", "lat": 48.86, "lon": 2.35}]
+
+
+def current(city, temperature):
+    return {"city": city, "location_name": city["name"],
+            "current": {"temperature_2m": temperature, "weather_code": 0, "is_day": 1}}
+
+
+@pytest.fixture
+def slow_fetch(monkeypatch):
+    """
+    Stubs the city list and the current weather fetch; the fetch blocks until release is set.
+    """
+    calls = []
+    release = threading.Event()
+
+    def fetch(cities):
+        calls.append(len(cities))
+        release.wait(5)
+        return [current(city, 10.0) for city in cities]
+
+    monkeypatch.setattr(warmer, "load_cities", lambda: [dict(city) for city in CITIES])
+    monkeypatch.setattr(warmer, "get_current_weather", fetch)
+    return calls, release
+
+
+def wait_for(condition):
+    deadline = time.monotonic() + 5
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+
+def test_concurrent_cold_requests_share_one_refresh(slow_fetch):
+    upstream_calls, release = slow_fetch
+    current_weather_warmer = CurrentWeatherWarmer()
+
+    futures = [current_weather_warmer.refresh_in_background() for _ in range(5)]
+    wait_for(lambda: upstream_calls)
+    release.set()
+
+    assert all(future is futures[0] for future in futures)
+    snapshot = futures[0].result(5)
+    assert [c["location_name"] for c in snapshot.cities] == ["London", "Paris"]
+    assert upstream_calls == [2]
+
+
+def test_refresh_waiting_for_another_refresh_reuses_its_snapshot(slow_fetch):
+    upstream_calls, release = slow_fetch
+    current_weather_warmer = CurrentWeatherWarmer()
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(current_weather_warmer.refresh())) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    wait_for(lambda: upstream_calls)
+    # the other two are queued on the refresh lock by now
+    time.sleep(0.05)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert upstream_calls == [2]
+    assert results[0] is results[1] is results[2] is current_weather_warmer.get_snapshot()
+
+
+def test_a_later_refresh_fetches_again(slow_fetch):
+    upstream_calls, release = slow_fetch
+    release.set()
+    current_weather_warmer = CurrentWeatherWarmer()
+    first = current_weather_warmer.refresh()
+
+    assert current_weather_warmer.refresh() is not first
+    assert upstream_calls == [2, 2]
+
+
+def test_failed_cities_keep_their_previous_entry(monkeypatch):
+    monkeypatch.setattr(warmer, "get_current_weather", lambda cities: [current(city, 10.0) for city in cities])
+    previous = build_snapshot([dict(city) for city in CITIES])
+    monkeypatch.setattr(warmer, "get_current_weather", lambda cities: [current(cities[0], 12.0), None])
+
+    snapshot = build_snapshot([dict(city) for city in CITIES], previous)
+
+    london, paris = snapshot.cities
+    assert london["current"]["temperature_2m"] == 12.0 and "stale" not in london
+    assert paris["current"]["temperature_2m"] == 10.0 and paris["stale"] is True
+
+
+def test_a_refresh_that_fails_everywhere_keeps_the_snapshot(monkeypatch):
+    monkeypatch.setattr(warmer, "load_cities", lambda: [dict(city) for city in CITIES])
+    monkeypatch.setattr(warmer, "get_current_weather", lambda cities: [current(city, 10.0) for city in cities])
+    current_weather_warmer = CurrentWeatherWarmer()
+    snapshot = current_weather_warmer.refresh()
+    monkeypatch.setattr(warmer, "get_current_weather", lambda cities: {})
+
+    assert current_weather_warmer.refresh() is snapshot
+
+
+def test_a_failed_batch_keeps_its_previous_entries_in_order(monkeypatch):
+    cities = [dict(CITIES[0]), {"name": "Berlin", "slug": "berlin", "timezone": "Europe/Berlin", "lat": 52.52, "lon": 13.4},
+              dict(CITIES[1]), {"name": "Rome", "slug": "rome", "timezone": "Europe/Rome", "lat": 41.9, "lon": 12.5}]
+    monkeypatch.setattr(warmer, "get_current_weather", lambda cities: [current(city, 10.0) for city in cities])
+    previous = build_snapshot(cities[:3])
+
+    def fetch_current_weather(batch, timezone_str):
+        if batch[0]["slug"] in ("berlin", "rome"):
+            raise ConnectionError("upstream down")
+        # the first batch finishes last
+        time.sleep(0.05 if batch[0]["slug"] == "london" else 0)
+        return [current(city, 12.0) for city in batch]
+
+    # the real batching, one city per upstream call
+    monkeypatch.setattr(warmer, "get_current_weather", helpers.get_current_weather)
+    monkeypatch.setattr(helpers, "CURRENT_WEATHER_BATCH", 1)
+    monkeypatch.setattr(helpers, "fetch_current_weather", fetch_current_weather)
+
+    snapshot = build_snapshot(cities, previous)
+
+    # Rome failed and has no previous entry, it is left out
+    assert [(c["city"]["slug"], c["current"]["temperature_2m"], c.get("stale", False)) for c in snapshot.cities] == [
+        ("london", 12.0, False), ("berlin", 10.0, True), ("paris", 12.0, False)]
+    assert set(snapshot.timezones) == {"london", "berlin", "paris", "rome"}
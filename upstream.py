@@ -0,0 +1,101 @@
+"""
+upstream.py
+
+Shared HTTP client for all calls to external APIs (open-meteo, ip-api).
+
+One requests.Session with a connection pool is shared by every thread, so
+repeat calls reuse keep-alive connections instead of doing a fresh TCP/DNS
+handshake. Every upstream has its own connect/read timeouts and retry budget.
+Each call's latency is recorded per upstream.
+
+Base URLs can be overridden with environment variables, e.g. to point the app
+at a local stub server: OPEN_METEO_URL=http://127.0.0.1:8001
+"""
+
+import os
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+UPSTREAMS = {
+    "open-meteo": {
+        "base_url": os.environ.get("OPEN_METEO_URL", "http://api.open-meteo.com"),
+        "connect_timeout": 3.05,
+        "read_timeout": 10,
+        "retries": 2,
+    },
+    "ip-api": {
+        "base_url": os.environ.get("IP_API_URL", "http://ip-api.com"),
+        "connect_timeout": 2,
+        "read_timeout": 3,
+        "retries": 1,
+    },
+}
+
+# Status codes worth retrying; 429 is not retried, the free ip-api tier would only get angrier
+RETRY_STATUSES = {500, 502, 503, 504}
+BACKOFF_BASE = 0.2
+BACKOFF_MAX = 2.0
+POOL_SIZE = int(os.environ.get("UPSTREAM_POOL_SIZE", 20))
+
+
+class UpstreamClient:
+    def __init__(self, upstreams=UPSTREAMS, pool_size=POOL_SIZE):
+        self.upstreams = upstreams
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=len(upstreams), pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._lock = threading.Lock()
+        self._stats = {name: {"calls": 0, "errors": 0, "retries": 0, "total_ms": 0.0, "last_ms": 0.0} for name in upstreams}
+
+    def url(self, name, path):
+        return self.upstreams[name]["base_url"].rstrip("/") + path
+
+    def _record(self, name, elapsed_ms, error=False, retries=0):
+        with self._lock:
+            stats = self._stats[name]
+            stats["calls"] += 1
+            stats["retries"] += retries
+            stats["total_ms"] += elapsed_ms
+            stats["last_ms"] = elapsed_ms
+            if error:
+                stats["errors"] += 1
+
+    def get(self, name, path, params=None):
+        """
+        GET base_url + path on the named upstream.
+        Retries connection errors, timeouts and 5xx responses with jittered backoff.
+        Returns the last response, or raises requests.RequestException once retries are used up.
+        """
+        config = self.upstreams[name]
+        url = self.url(name, path)
+        timeout = (config["connect_timeout"], config["read_timeout"])
+        attempts = config["retries"] + 1
+
+        start = time.perf_counter()
+        for attempt in range(attempts):
+            try:
+                resp = self.session.get(url, params=params, timeout=timeout)
+                if resp.status_code not in RETRY_STATUSES or attempt == attempts - 1:
+                    self._record(name, (time.perf_counter() - start) * 1000, error=resp.status_code >= 500, retries=attempt)
+                    return resp
+            except requests.RequestException:
+                if attempt == attempts - 1:
+                    self._record(name, (time.perf_counter() - start) * 1000, error=True, retries=attempt)
+                    raise
+            # full jitter: sleep a random amount up to the exponential backoff
+            time.sleep(random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt)))
+
+    def stats(self):
+        with self._lock:
+            stats = {name: dict(s) for name, s in self._stats.items()}
+        for s in stats.values():
+            s["avg_ms"] = s["total_ms"] / s["calls"] if s["calls"] else 0.0
+        return stats
+
+
+upstream = UpstreamClient()
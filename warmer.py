@@ -0,0 +1,136 @@
+"""
+warmer.py
+
+Background thread that keeps the current weather of every city in the
+`cities` table up to date, so the homepage never waits on open-meteo.
+
+Each refresh builds a new, read-only snapshot and swaps it in atomically.
+Requests only ever read whichever snapshot is current.
+"""
+
+import os
+import threading
+import time
+import zoneinfo
+from collections import namedtuple
+from types import MappingProxyType
+
+import fanout
+from helpers import get_current_weather
+from reference_data import reference_data
+from weather_helper import icon_batch, simplified_batch
+
+# Seconds between refreshes; open-meteo updates current conditions every 15 minutes
+WARMER_INTERVAL = int(os.environ.get("WARMER_INTERVAL", 300))
+
+# cities: tuple of read-only {"city", "location_name", "current"} mappings, ordered by name.
+#   Cities whose batch failed keep their previous entry, with "stale": True
+# timezones: {slug: ZoneInfo}
+Snapshot = namedtuple("Snapshot", ["cities", "timezones", "fetched_at"])
+
+
+def freeze(value):
+    """
+    Recursively wraps dicts in MappingProxyType and lists in tuples.
+    """
+    if isinstance(value, dict):
+        return MappingProxyType({k: freeze(v) for k, v in value.items()})
+    if isinstance(value, list):
+        return tuple(freeze(v) for v in value)
+    return value
+
+
+def load_cities():
+    return [dict(city) for city in reference_data.get().cities]
+
+
+def build_snapshot(city_names, previous=None):
+    """
+    Fetches current weather for all cities and precomputes the icon and description.
+    Cities that could not be fetched keep their entry from the previous snapshot, marked stale.
+    Returns None if the upstream call failed for every city.
+    """
+    if not city_names:
+        return Snapshot(cities=(), timezones={}, fetched_at=time.time())
+
+    data = get_current_weather(city_names)
+    if not data:
+        return None
+    fetched = [city for city in data if city is not None]
+
+    # classify every city's current weather in one pass
+    codes = [city["current"]["weather_code"] for city in fetched]
+    is_day = [city["current"]["is_day"] for city in fetched]
+    for city, icon, description in zip(fetched, icon_batch(codes, is_day), simplified_batch(codes, is_day)):
+        city["current"]["icon"] = icon
+        city["current"]["description"] = description
+
+    previous_entries = {c["city"]["slug"]: c for c in previous.cities} if previous else {}
+    cities = []
+    for city, result in zip(city_names, data):
+        if result is not None:
+            cities.append(freeze(result))
+        elif city["slug"] in previous_entries:
+            cities.append(MappingProxyType(dict(previous_entries[city["slug"]], stale=True)))
+
+    timezones = {c["slug"]: zoneinfo.ZoneInfo(c["timezone"]) for c in city_names}
+    return Snapshot(cities=tuple(cities), timezones=MappingProxyType(timezones), fetched_at=time.time())
+
+
+class CurrentWeatherWarmer:
+    def __init__(self, interval=WARMER_INTERVAL):
+        self.interval = interval
+        self._snapshot = None
+        self._thread = None
+        self._stop = threading.Event()
+        self._refresh_lock = threading.Lock()
+        self._future = None
+        self._future_lock = threading.Lock()
+
+    def get_snapshot(self):
+        return self._snapshot
+
+    def refresh(self):
+        """
+        Rebuilds the snapshot and publishes it. On failure the previous snapshot is kept.
+        A call that waited for another refresh returns that refresh's snapshot instead of fetching again.
+        """
+        started = time.time()
+        with self._refresh_lock:
+            if self._snapshot is not None and self._snapshot.fetched_at >= started:
+                return self._snapshot
+            snapshot = build_snapshot(load_cities(), self._snapshot)
+            if snapshot is not None:
+                self._snapshot = snapshot
+            return self._snapshot
+
+    def refresh_in_background(self):
+        """
+        Starts refresh() on the fanout pool and returns its future, or the future of the
+        refresh already started this way, so concurrent cold requests share one fetch.
+        """
+        with self._future_lock:
+            if self._future is None or self._future.done():
+                self._future = fanout.submit(self.refresh)
+            return self._future
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f"[warmer] refresh failed: {e}")
+            self._stop.wait(self.interval)
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="current-weather-warmer", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+
+current_weather_warmer = CurrentWeatherWarmer()
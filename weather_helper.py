@@ -4,8 +4,8 @@ weather_helper.py
 Maps open-meteo weather codes and day/night to icon filenames in /static/icons/static/.
 """
 
+from bisect import bisect_left, bisect_right
 from datetime import datetime, timedelta
-import dateutil.parser
 
 # Mapping based on open-meteo weather codes:
 # https://open-meteo.com/en/docs#api_form
@@ -45,6 +45,90 @@ WEATHER_ICON_MAP = {
 
 DEFAULT_ICON = "cloudy.svg"
 
+# Lower bound (km/h) of Beaufort numbers 1 to 12:
+# light air, light breeze, gentle breeze, moderate breeze, fresh breeze, strong breeze,
+# high wind, gale, strong gale, storm, violent storm, hurricane
+BEAUFORT_THRESHOLDS = (1, 6, 12, 20, 29, 39, 50, 62, 75, 89, 103, 118)
+
+WIND_DIRECTIONS = (
+    'N', 'NNE', 'NE', 'ENE', 'E', 'ESE', 'SE', 'SSE',
+    'S', 'SSW', 'SW', 'WSW', 'W', 'WNW', 'NW', 'NNW'
+)
+
+# Code 0 is "sunny" by day and "clear" by night, see _describe()
+WEATHER_ONEWORD = {
+    1: "mostly clear",
+    2: "partly cloudy",
+    3: "cloudy",
+    45: "fog",
+    48: "fog",
+    51: "drizzle",
+    53: "drizzle",
+    55: "drizzle",
+    56: "freezing drizzle",
+    57: "freezing drizzle",
+    61: "rain",
+    63: "rain",
+    65: "rain",
+    66: "freezing rain",
+    67: "freezing rain",
+    71: "snow",
+    73: "snow",
+    75: "snow",
+    77: "snow",
+    80: "rain showers",
+    81: "rain showers",
+    82: "rain showers",
+    85: "snow showers",
+    86: "snow showers",
+    95: "thunderstorm",
+    96: "thunderstorm",
+    99: "thunderstorm",
+}
+
+WEATHER_SIMPLIFIED = {
+    1: "cloudy",
+    2: "cloudy",
+    3: "cloudy",
+    45: "fog",
+    48: "fog",
+    51: "rainy",
+    53: "rainy",
+    55: "rainy",
+    56: "rainy",
+    57: "rainy",
+    61: "rainy",
+    63: "rainy",
+    65: "rainy",
+    66: "rainy",
+    67: "rainy",
+    71: "snowy",
+    73: "snowy",
+    75: "snowy",
+    77: "snowy",
+    80: "rainy",
+    81: "rainy",
+    82: "rainy",
+    85: "snowy",
+    86: "snowy",
+    95: "thunderstorm",
+    96: "thunderstorm",
+    99: "thunderstorm",
+}
+
+def beaufort_scale(windspeed):
+    """
+    Convert wind speed in km/h to Beaufort scale.
+    """
+    return bisect_right(BEAUFORT_THRESHOLDS, windspeed)
+    
+def wind_direction_cardinal(degree):
+    """
+    Convert wind direction in degrees to the closest cardinal direction (e.g. N, NNE, NE, etc.).
+    0°/360° is North, 90° is East, 180° is South, 270° is West.
+    """
+    return WIND_DIRECTIONS[int((degree % 360) / 22.5 + 0.5) % 16]
+
 def get_weather_icon(weathercode, is_day=None):
     """
     Returns the icon filename for a given open-meteo weather code and day/night flag.
@@ -62,79 +146,101 @@ def get_weather_icon(weathercode, is_day=None):
         return icons[1]
     return icons[2]
 
+def _describe(code_map, weathercode, is_day):
+    if weathercode == 0:
+        # Daytime sunny, nighttime clear
+        return is_day and "sunny" or "clear"
+    return code_map.get(weathercode, "unknown")
+
 def get_weather_oneword(weathercode, is_day=None):
     """
     Returns a one-word weather description for a given open-meteo weather code.
     """
-    code_map = {
-        # Daytime sunny, nighttime clear
-        0: is_day and "sunny" or "clear",
-        1: "mostly clear",
-        2: "partly cloudy",
-        3: "cloudy",
-        45: "fog",
-        48: "fog",
-        51: "drizzle",
-        53: "drizzle",
-        55: "drizzle",
-        56: "freezing drizzle",
-        57: "freezing drizzle",
-        61: "rain",
-        63: "rain",
-        65: "rain",
-        66: "freezing rain",
-        67: "freezing rain",
-        71: "snow",
-        73: "snow",
-        75: "snow",
-        77: "snow",
-        80: "rain showers",
-        81: "rain showers",
-        82: "rain showers",
-        85: "snow showers",
-        86: "snow showers",
-        95: "thunderstorm",
-        96: "thunderstorm",
-        99: "thunderstorm",
-    }
-    return code_map.get(weathercode, "unknown")
+    return _describe(WEATHER_ONEWORD, weathercode, is_day)
 
 def get_weather_simplified(weathercode, is_day=None):
     """
     Returns a simplified one-word weather description for a given open-meteo weather code.
     """
-    code_map = {
-        # Daytime sunny, nighttime clear
-        0: is_day and "sunny" or "clear",
-        1: "cloudy",
-        2: "cloudy",
-        3: "cloudy",
-        45: "fog",
-        48: "fog",
-        51: "rainy",
-        53: "rainy",
-        55: "rainy",
-        56: "rainy",
-        57: "rainy",
-        61: "rainy",
-        63: "rainy",
-        65: "rainy",
-        66: "rainy",
-        67: "rainy",
-        71: "snowy",
-        73: "snowy",
-        75: "snowy",
-        77: "snowy",
-        80: "rainy",
-        81: "rainy",
-        82: "rainy",
-        85: "snowy",
-        86: "snowy",
-        95: "thunderstorm",
-        96: "thunderstorm",
-        99: "thunderstorm",
-    }
-    return code_map.get(weathercode, "unknown")
+    return _describe(WEATHER_SIMPLIFIED, weathercode, is_day)
+
+# Batch classifiers: take whole columns (lists or arrays, e.g. an HourlyForecast's columns or
+# one value per city) and classify them with precomputed lookup tables, so each value costs
+# one index instead of a function call and a chain of comparisons.
+# Missing values (None, NaN, or a negative direction/code, as HourlyForecast stores them) come back as None.
+
+MAX_WEATHER_CODE = 99
+
+# Beaufort number for every whole km/h below the hurricane threshold (the thresholds are whole numbers)
+BEAUFORT_BY_KMH = tuple(bisect_right(BEAUFORT_THRESHOLDS, kmh) for kmh in range(BEAUFORT_THRESHOLDS[-1]))
+
+# Cardinal direction for every quarter degree, the sector boundaries are at multiples of 11.25°
+CARDINAL_BY_QUARTER_DEGREE = tuple(wind_direction_cardinal(q / 4) for q in range(360 * 4))
+
+def _code_table(classify):
+    """
+    Flat table indexed by code * 3 + is_day % 3, so 0 is night, 1 is day and 2 is
+    what the scalar function returns for the -1 "missing" flag.
+    """
+    return tuple(classify(code, is_day) for code in range(MAX_WEATHER_CODE + 1) for is_day in (0, 1, -1))
+
+def _neutral_table(classify):
+    return tuple(classify(code, None) for code in range(MAX_WEATHER_CODE + 1))
+
+ICON_TABLE = _code_table(get_weather_icon)
+ONEWORD_TABLE = _code_table(get_weather_oneword)
+SIMPLIFIED_TABLE = _code_table(get_weather_simplified)
+ICON_NEUTRAL = _neutral_table(get_weather_icon)
+ONEWORD_NEUTRAL = _neutral_table(get_weather_oneword)
+SIMPLIFIED_NEUTRAL = _neutral_table(get_weather_simplified)
+
+def _classify_codes(classify, table, neutral, unknown, codes, is_day):
+    top = MAX_WEATHER_CODE
+    try:
+        if is_day is None:
+            return [neutral[c] if 0 <= c <= top else (None if c < 0 else unknown) for c in codes]
+        return [table[c * 3 + f % 3] if 0 <= c <= top else (None if c < 0 else unknown) for c, f in zip(codes, is_day)]
+    except TypeError:
+        # None or float values, e.g. straight from an open-meteo response
+        if is_day is None:
+            is_day = [None] * len(codes)
+        return [None if c is None or c < 0 else classify(c, f) for c, f in zip(codes, is_day)]
+
+def beaufort_batch(speeds):
+    """
+    Beaufort number for each wind speed in km/h.
+    """
+    table = BEAUFORT_BY_KMH
+    size = len(table)
+    try:
+        # v != v is only true for NaN
+        return [table[int(v)] if 0 <= v < size else (None if v != v else bisect_right(BEAUFORT_THRESHOLDS, v)) for v in speeds]
+    except TypeError:
+        return [None if v is None else beaufort_scale(v) for v in speeds]
+
+def cardinal_batch(degrees):
+    """
+    Cardinal direction for each wind direction in degrees.
+    """
+    table = CARDINAL_BY_QUARTER_DEGREE
+    size = len(table)
+    try:
+        return [table[int(d * 4) % size] if d >= 0 else None for d in degrees]
+    except TypeError:
+        return [None if d is None or d < 0 else wind_direction_cardinal(d) for d in degrees]
+
+def icon_batch(codes, is_day=None):
+    """
+    Icon filename for each weather code. is_day is a parallel column of 1/0 flags,
+    or None for the neutral icons.
+    """
+    return _classify_codes(get_weather_icon, ICON_TABLE, ICON_NEUTRAL, DEFAULT_ICON, codes, is_day)
+
+def oneword_batch(codes, is_day=None):
+    return _classify_codes(get_weather_oneword, ONEWORD_TABLE, ONEWORD_NEUTRAL, "unknown", codes, is_day)
+
+def simplified_batch(codes, is_day=None):
+    return _classify_codes(get_weather_simplified, SIMPLIFIED_TABLE, SIMPLIFIED_NEUTRAL, "unknown", codes, is_day)
 
 def hourly_dicts_from_openmeteo(hourly):
     # Convert parallel lists to list of dicts
@@ -148,14 +254,14 @@ def hourly_dicts_from_openmeteo(hourly):
 
 def filtered_hourly_dicts_from_openmeteo(hourly, start_hour=None, end_hour=None):
     """
-    Convert parallel lists to list of dicts, filtered by start_hour and end_hour (inclusive).
+    Convert parallel lists to list of dicts, filtered by start_hour (inclusive) and end_hour (exclusive).
     - start_hour, end_hour: datetime objects (local time, matching the timezone of the API call/time strings)
     Defaults: start_hour = now (rounded down), end_hour = start_hour + 24h
+    open-meteo's "YYYY-MM-DDTHH:MM" times sort as strings, so the range is found with bisect
+    instead of parsing every timestamp.
     """
     keys = list(hourly.keys())
-    length = len(hourly[keys[0]])
-    # Parse all times to datetime
-    times = [dateutil.parser.isoparse(t) for t in hourly['time']]
+    times = hourly['time']
     now = datetime.now().replace(minute=0, second=0, microsecond=0)
     if start_hour is None:
         start_hour = now
@@ -165,10 +271,7 @@ def filtered_hourly_dicts_from_openmeteo(hourly, start_hour=None, end_hour=None)
         end_hour = start_hour + timedelta(hours=24)
     else:
         end_hour = end_hour.replace(minute=0, second=0, microsecond=0)
+    start = bisect_left(times, start_hour.strftime("%Y-%m-%dT%H:%M"))
+    end = bisect_left(times, end_hour.strftime("%Y-%m-%dT%H:%M"))
     # Build filtered list
-    result = []
-    for i in range(length):
-        t = times[i]
-        if start_hour <= t < end_hour:
-            result.append({k: hourly[k][i] for k in keys})
-    return result
+    return [{k: hourly[k][i] for k in keys} for i in range(start, end)]